@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+""" Benchmark the spidev driver's refresh loop against a simulated chain
+    of TLCs.
+
+    Packs a random frame, repeatedly writes complete refreshes of it
+    (every layer of every bit-plane) to a ``tlc_sim`` chain and reports
+    the Python time per refresh, the modelled SPI clock time per refresh
+    and the resulting achievable refresh rate. The Python time includes
+    the simulator's own decoding, so the achievable rate is a lower
+    bound. It also checks that the values latched by the simulated chain
+    match the frame that was sent.
+
+    Run with::
+
+        $ python benchmarks/bench_driver.py
+"""
+
+import time
+
+import click
+import numpy as np
+
+from tessled.frame_utils import FrameConstants
+from tessled.spidev_driver import (
+    TLCs, PWMBuffers, SpiSweep, bcm_plane_order)
+from tessled.tlc_sim import SimBackend
+
+
+def expected_latches(pwm_buffers, frame):
+    """ Return the output values each layer write should latch. """
+    n_layers = len(pwm_buffers.layers)
+    voxels = frame.reshape(n_layers, -1)
+    expected = []
+    for plane in pwm_buffers.plane_order:
+        for layer in range(n_layers):
+            values = np.zeros(80, dtype=np.uint16)
+            values[layer] = 4095
+            values[16:] = pwm_buffers.levels[plane][voxels[layer]]
+            expected.append(values)
+    return expected
+
+
+@click.command()
+@click.option(
+    '--refreshes', default=1000,
+    help='Number of refreshes to write.')
+@click.option(
+    '--bcm-bits', default=None, type=click.IntRange(1, 8),
+    help='Number of BCM bit-planes.')
+@click.option(
+    '--lut/--no-lut', default=True,
+    help='Pack frames using lookup tables.')
+@click.option(
+    '--ioctl-sweep/--no-ioctl-sweep', default=False,
+    help='Write refreshes using prebuilt ioctl transfers.')
+@click.option(
+    '--xlat-on-cs/--no-xlat-on-cs', default=False,
+    help='Latch layers with the SPI chip-select. Implies --ioctl-sweep.')
+@click.option(
+    '--spispeed', default=3906250 // 4,
+    help='SPI clock speed in Hz.')
+def main(refreshes, bcm_bits, lut, ioctl_sweep, xlat_on_cs, spispeed):
+    fc = FrameConstants()
+    backend = SimBackend(xlat_on_cs=xlat_on_cs)
+    tlcs = TLCs(
+        tlcs=5, blank=3, vprg=5, xlat=6, dcprg=7, spispeed=spispeed,
+        backend=backend)
+    chain = backend.chain
+    tlcs.init_tlcs()
+
+    frame = np.random.randint(0, 256, size=fc.frame_shape).astype(np.uint8)
+    pwm_buffers = PWMBuffers(tlcs, fc, bcm_bits=bcm_bits, lut=lut)
+    pwm_buffers.update(frame)
+
+    if ioctl_sweep or xlat_on_cs:
+        sweep = SpiSweep(
+            tlcs, len(pwm_buffers.buffers), xlat_on_cs=xlat_on_cs,
+            batch=len(pwm_buffers.buffers))
+        sweep.load(pwm_buffers.buffers)
+        write_refresh = sweep.write
+    else:
+        def write_refresh():
+            for pwm_buffer in pwm_buffers.buffers:
+                tlcs.write_pwm_packed(pwm_buffer)
+
+    # check that one refresh round-trips through the simulated chain
+    chain.reset()
+    chain.record_latched = True
+    write_refresh()
+    chain.record_latched = False
+    expected = expected_latches(pwm_buffers, frame)
+    round_trip = len(chain.latched) == len(expected) and all(
+        np.array_equal(got, want)
+        for got, want in zip(chain.latched, expected))
+
+    chain.reset()
+    start = time.perf_counter()
+    for _ in range(refreshes):
+        write_refresh()
+    python_seconds = time.perf_counter() - start
+    stats = chain.stats()
+
+    python_us = 1e6 * python_seconds / refreshes
+    spi_us = 1e6 * stats["spi_seconds"] / refreshes
+    refresh_rate = 1e6 / (python_us + spi_us)
+    syscalls = stats["ioctls"] if stats["ioctls"] else stats["writes"]
+    click.echo("Bit-plane order:            {}".format(
+        bcm_plane_order(bcm_bits) if bcm_bits else [0]))
+    click.echo("Layer writes per refresh:   {:10d}".format(
+        len(pwm_buffers.buffers)))
+    click.echo("Syscalls per refresh:       {:10.1f}".format(
+        float(syscalls) / refreshes))
+    click.echo("GPIO toggles per refresh:   {:10.1f}".format(
+        float(stats["gpio_toggles"]) / refreshes))
+    click.echo("Python time per refresh:    {:10.1f} us".format(python_us))
+    click.echo("SPI clock time per refresh: {:10.1f} us".format(spi_us))
+    click.echo("Achievable refreshes / s:   {:10.1f}".format(refresh_rate))
+    click.echo("Achievable layer sweeps / s:{:10.1f}".format(
+        refresh_rate * pwm_buffers.sweeps_per_refresh))
+    click.echo("Round trip:                 {}".format(
+        "OK" if round_trip else "MISMATCH"))
+    if not round_trip:
+        raise click.Abort()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+""" Benchmark converting a rendered frame for several tesseract types.
+
+    Compares converting each frame by slicing (``virtual_to_physical``)
+    and copying the result with ``tobytes()``, as one effectbox per
+    tesseract type does, with the precomputed index permutations of
+    ``FrameMapper`` used by ``tesseract-effectbox --target``, and times
+    a random wiring map (which can only be converted by permutation).
+
+    Run with::
+
+        $ python benchmarks/bench_fanout.py
+"""
+
+import timeit
+
+import click
+import numpy as np
+
+from tessled.frame_utils import FrameConstants, FrameMapper
+from tessled.wiring import Wiring
+
+
+@click.command()
+@click.option(
+    '--number', default=100000,
+    help='Frames to convert for each target type.')
+def main(number):
+    fc = FrameConstants()
+    frame = np.random.randint(
+        0, 256, size=fc.frame_shape).astype(fc.frame_dtype)
+    click.echo("{:12s}{:>16s}{:>16s}".format(
+        "Target", "slice us", "permute us"))
+    for ttype in sorted(FrameConstants.TESSERACT_TYPES):
+        convert = FrameConstants.TESSERACT_TYPES[ttype]
+        mapper = FrameMapper(None, ttype, fc.frame_shape)
+        assert np.array_equal(mapper(frame), convert(frame))
+        sliced = timeit.timeit(
+            lambda: convert(frame).tobytes(), number=number)
+        permuted = timeit.timeit(lambda: mapper(frame), number=number)
+        click.echo("{:12s}{:16.2f}{:16.2f}".format(
+            ttype, 1e6 * sliced / number, 1e6 * permuted / number))
+    wiring = Wiring(
+        fc.frame_shape, np.random.permutation(frame.size)).validate()
+    mapper = FrameMapper(None, wiring, fc.frame_shape)
+    permuted = timeit.timeit(lambda: mapper(frame), number=number)
+    click.echo("{:12s}{:>16s}{:16.2f}".format(
+        "wiring", "-", 1e6 * permuted / number))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+""" Benchmark packing frames into TLC PWM buffers.
+
+    Compares the original per-layer ``pack_to_12bit`` packing with the
+    vectorized ``PWMPacker`` and the ``PackingLUT`` lookup tables.
+
+    Run with::
+
+        $ python benchmarks/bench_packing.py
+"""
+
+import timeit
+
+import click
+import numpy as np
+
+from tessled.frame_utils import FrameConstants
+from tessled.spidev_driver import (
+    PWMPacker, PackingLUT, pack_to_12bit, pwm_levels)
+
+
+def pack_per_layer(frame, layer_masks):
+    """ Pack a frame one layer at a time as the driver used to. """
+    buffers = []
+    pwm_values = np.zeros(80, dtype=np.uint16)
+    for layer, layer_mask in enumerate(layer_masks):
+        pwm_values[0:16] = layer_mask
+        pwm_values[16:] = (frame[layer].ravel() > 125)
+        pwm_values[16:] *= 4095
+        buffers.append(np.bitwise_not(pack_to_12bit(pwm_values[::-1])))
+    return buffers
+
+
+@click.command()
+@click.option(
+    '--number', default=2000,
+    help='Number of frames to pack for each method.')
+@click.option(
+    '--bcm-bits', default=None, type=click.IntRange(1, 8),
+    help='Number of BCM bit-planes for the vectorized methods.')
+def main(number, bcm_bits):
+    fc = FrameConstants()
+    frame = np.random.randint(0, 256, size=fc.frame_shape).astype(np.uint8)
+    levels = pwm_levels(bcm_bits)
+    n_planes = len(levels)
+
+    layer_masks = np.zeros((fc.layers, 16), dtype=np.uint16)
+    for layer in range(fc.layers):
+        layer_masks[layer, layer] = 4095
+
+    pwm_values = np.zeros((n_planes, fc.layers, 80), dtype=np.uint16)
+    packed = np.zeros((n_planes, fc.layers, 120), dtype=np.uint8)
+    packer = PWMPacker(pwm_values.shape)
+
+    def pack_vectorized():
+        voxels = frame.reshape(fc.layers, -1)
+        np.take(levels, voxels, axis=1, out=pwm_values[:, :, 16:],
+                mode='clip')
+        packer.pack(pwm_values, out=packed)
+
+    lut = PackingLUT(levels)
+    lut_view = lut.voxel_view(packed)
+
+    def pack_lut():
+        lut.pack(frame.reshape(fc.layers, -1), out=lut_view)
+
+    methods = [
+        ("pack_to_12bit per layer (1 plane)",
+         lambda: pack_per_layer(frame, layer_masks)),
+        ("PWMPacker ({} planes)".format(n_planes), pack_vectorized),
+        ("PackingLUT ({} planes)".format(n_planes), pack_lut),
+    ]
+    for name, method in methods:
+        seconds = timeit.timeit(method, number=number)
+        click.echo("{:<40} {:8.1f} us / frame".format(
+            name, 1e6 * seconds / number))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+""" Benchmark rendering frames while crossfading between animations.
+
+    During a crossfade the effect engine renders both the outgoing and
+    the incoming animations and mixes their frames. This times frames
+    rendered with and without a crossfade, for each transition mask, and
+    reports how many would miss the tick at the given frame rate (run it
+    on the Pi to check that crossfades fit in the frame budget).
+
+    Run with::
+
+        $ python benchmarks/bench_transitions.py --fps 25
+"""
+
+import click
+
+from tessled.effects import transitions
+from tessled.effects.animations import import_animation
+from tessled.effects.engine import EffectEngine
+from tessled.frame_utils import FrameConstants
+
+
+def run(fc, animation_classes, frames, **kw):
+    engine = EffectEngine(
+        fc=fc, tick=1. / fc.fps, transition=frames / float(fc.fps), **kw)
+    for animation_cls in animation_classes:
+        engine.add_animation_type(animation_cls)
+    # start the first animation, then transition to the second
+    engine.next_frame()
+    engine.set_next_transition(0)
+    for i in range(frames):
+        engine.next_frame()
+    return engine
+
+
+@click.command()
+@click.option(
+    '--fps', default=10,
+    help='Frames per second (the tick is the frame budget).')
+@click.option(
+    '--animation', default='exploringsphere,phases',
+    help='Two comma-separated animations to crossfade between.')
+@click.option(
+    '--frames', default=200,
+    help='Frames to render for each mask.')
+def main(fps, animation, frames):
+    animation_classes = []
+    for name in animation.split(','):
+        name, _, subname = name.partition('.')
+        animation_classes.append(import_animation(name, subname))
+    fc = FrameConstants(fps=fps)
+    click.echo("{:10s}{:>12s}{:>12s}{:>12s}{:>8s}".format(
+        "Mask", "mean us", "p99 us", "max us", "over"))
+    engine = run(fc, animation_classes, frames)
+    results = [("cut", engine.render_times, engine.frames_over_budget)]
+    for mask in transitions.MASKS:
+        engine = run(
+            fc, animation_classes, frames,
+            crossfade=frames / float(fps), transition_mask=mask)
+        results.append(
+            (mask, engine.crossfade_times, engine.frames_over_budget))
+    for mask, times, over in results:
+        click.echo("{:10s}{:12.1f}{:12.1f}{:12.1f}{:8d}".format(
+            mask, times.mean() / 1e3, times.percentile(99) / 1e3,
+            times.max / 1e3, over))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,5 +3,6 @@
 while true; do
   /home/pi/tesseract-control-software/ve/bin/tesseract-spidev-driver \
     --fps 10 \
+    --stats-file /home/pi/spidev-driver-stats.json \
     >> /home/pi/spidev-driver.log
 done
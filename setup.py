@@ -12,7 +12,7 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=[
-        'click',
+        'click>=8.0',
         'numpy',
         'pillow',
         'zmq',
@@ -24,6 +24,8 @@ setup(
     entry_points={  # Optional
         'console_scripts': [
             'tesseract-effectbox=tessled.effectbox:main',
+            'tesseract-play=tessled.recording:play',
+            'tesseract-record=tessled.recording:record',
             'tesseract-simulator=tessled.simulator:main',
             'tesseract-spidev-driver=tessled.spidev_driver:main',
         ],
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+""" Dot correction calibration files.
+
+    The TLC chips have a 6-bit dot correction (DC) value per output that
+    scales the current through that output. Writing calibrated values to
+    the chips once corrects for LED-to-LED brightness differences with no
+    per-frame cost.
+
+    A calibration file is a text file containing one DC value (0-63) per
+    TLC output, in output order, separated by whitespace. Blank lines and
+    anything after a ``#`` are ignored. Outputs 0-15 are the layer select
+    lines (only 0-7 are used) and outputs 16-79 are the ground lines for
+    the 64 columns of LEDs in the order they appear in a physical frame
+    layer. Since each LED is lit through one layer line and one ground
+    line, the correction for an LED is the product of the two.
+"""
+
+import numpy as np
+
+DC_MAX = 63
+
+DC_HEADER = """\
+# Tesseract dot correction calibration.
+#
+# One value (0-63) per TLC output, in output order. Outputs 0-15 are the
+# layer select lines and outputs 16-79 are the ground lines for each
+# column of LEDs in physical frame order.
+"""
+
+
+class CalibrationError(ValueError):
+    """ Raised when a calibration file is invalid. """
+
+
+def load_dc(path, n_outputs=80):
+    """ Load dot correction values from a calibration file.
+
+        :param str path:
+            The calibration file to read.
+        :param int n_outputs:
+            The number of TLC outputs. Default: 80.
+
+        :return numpy.array:
+            An array of DC values, one per output.
+    """
+    values = []
+    with open(path) as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.partition("#")[0]
+            for word in line.split():
+                try:
+                    value = int(word)
+                except ValueError:
+                    raise CalibrationError(
+                        "{}:{}: invalid DC value {!r}".format(
+                            path, lineno, word))
+                if not 0 <= value <= DC_MAX:
+                    raise CalibrationError(
+                        "{}:{}: DC value {} is not in the range 0-{}".format(
+                            path, lineno, value, DC_MAX))
+                values.append(value)
+    if len(values) != n_outputs:
+        raise CalibrationError(
+            "{}: expected {} DC values but found {}".format(
+                path, n_outputs, len(values)))
+    return np.array(values, dtype=np.uint8)
+
+
+def save_dc(path, dc_values, per_line=16):
+    """ Save dot correction values to a calibration file.
+
+        :param str path:
+            The calibration file to write.
+        :param numpy.array dc_values:
+            The DC values, one per output.
+        :param int per_line:
+            The number of values to write per line. Default: 16 (one
+            TLC chip per line).
+    """
+    with open(path, "w") as f:
+        f.write(DC_HEADER)
+        for start in range(0, len(dc_values), per_line):
+            chunk = dc_values[start:start + per_line]
+            f.write("{:<48}# outputs {}-{}\n".format(
+                " ".join("{:2d}".format(int(v)) for v in chunk),
+                start, start + len(chunk) - 1))
+
+
+def default_dc(n_outputs=80):
+    """ Return uncorrected (maximum) dot correction values. """
+    return np.full(n_outputs, DC_MAX, dtype=np.uint8)
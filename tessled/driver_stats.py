@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+""" Periodic statistics for the LED drivers.
+
+    Statistics are published as JSON objects, either on a ZeroMQ PUB
+    socket, to a file (which is replaced atomically so readers never see
+    a partial write), or both. Each object looks like::
+
+        {
+            "time": 1500000000.0,
+            "interval": 10.0,
+            "refreshes_per_second": 71.3,
+            "sweeps_per_second": 499.1,
+            "frames_received": 1200,
+            "frames_dropped": 3,
+            "frames_unchanged": 400,
+            "frames_lost": 0,
+            "frames_late": 2,
+            "frames_packed": 797,
+            "layers_packed": 3000,
+            "layers_skipped": 3376,
+            "pack_time_mean_us": 12.1,
+            "pack_time_max_us": 80.4,
+            "frame_age_ms": 45.2,
+            "spi_write_us": {"count": 4000, "p50": 250.1, ...},
+        }
+
+    Frame counts are totals since the driver started. Rates and the SPI
+    write time distribution cover the latest interval only.
+"""
+
+import json
+import os
+import time
+
+
+def write_json_atomic(path, data):
+    """ Write data as JSON to path, replacing any existing file atomically.
+    """
+    tmp_path = "{}.tmp".format(path)
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.rename(tmp_path, path)
+
+
+class DriverStats(object):
+    """ Collect and periodically publish driver statistics.
+
+        :param FrameReceiver receiver:
+            The driver's frame receiver.
+        :param DwellTimer timer:
+            The driver's dwell timer (used for SPI write times).
+        :param int sweeps_per_refresh:
+            The number of sweeps through the layers per complete refresh.
+        :param float interval:
+            The number of seconds between publishing statistics.
+        :param zmq.Socket socket:
+            A PUB socket to publish statistics on. Default: None.
+        :param str path:
+            A file to write statistics to. Default: None.
+
+        Call ``.tick()`` once per complete refresh.
+    """
+
+    def __init__(self, receiver, timer, sweeps_per_refresh, interval,
+                 socket=None, path=None):
+        self.receiver = receiver
+        self.timer = timer
+        self.sweeps_per_refresh = sweeps_per_refresh
+        self.interval = interval
+        self.socket = socket
+        self.path = path
+        self.refreshes = 0
+        self.start = time.time()
+
+    def tick(self):
+        """ Record one complete refresh and publish if the interval is up.
+        """
+        self.refreshes += 1
+        now = time.time()
+        if now - self.start >= self.interval:
+            self.publish(self.snapshot(now))
+            self.refreshes = 0
+            self.timer.writes.reset()
+            self.start = now
+
+    def snapshot(self, now):
+        """ Return the current statistics as a dictionary. """
+        elapsed = now - self.start
+        refresh_rate = self.refreshes / elapsed if elapsed > 0 else 0.0
+        receiver = self.receiver
+        writes = self.timer.writes
+        return {
+            "time": now,
+            "interval": elapsed,
+            "refreshes_per_second": refresh_rate,
+            "sweeps_per_second": refresh_rate * self.sweeps_per_refresh,
+            "frames_received": receiver.frames_received,
+            "frames_dropped": receiver.frames_dropped,
+            "frames_unchanged": receiver.frames_unchanged,
+            "frames_lost": receiver.frames_lost,
+            "frames_late": receiver.frames_late,
+            "frames_packed": receiver.frames_packed,
+            "layers_packed": receiver.layers_packed(),
+            "layers_skipped": receiver.layers_skipped(),
+            "pack_time_mean_us": 1e6 * receiver.pack_time_total / max(
+                receiver.frames_packed, 1),
+            "pack_time_max_us": 1e6 * receiver.pack_time_max,
+            "frame_age_ms": 1e3 * receiver.frame_age(now),
+            "spi_write_us": dict(
+                [("count", writes.count)] + [
+                    ("p{:g}".format(p), writes.percentile(p) / 1e3)
+                    for p in writes.PERCENTILES]),
+        }
+
+    def publish(self, stats):
+        """ Publish statistics to the socket and file, if configured. """
+        if self.socket is not None:
+            self.socket.send_json(stats)
+        if self.path is not None:
+            write_json_atomic(self.path, stats)
@@ -4,9 +4,10 @@
     for sending to the Tesseract.
 
     The EffectBox polls for events regularly, attempting to publish
-    frames at regular intervals. Frames are timestamped so that small
-    wobbles in processing times can be sorted out in a more realtime
-    process (e.g. one written in C or on the Arduino) later.
+    frames at regular intervals. Frames are timestamped (see
+    tessled.envelope) with a display time a fixed delay after their
+    scheduled render time, so that small wobbles in processing times
+    can be sorted out by the playout buffer in the driver later.
 
     If the Tesseract LEDs are viewed as laided in a right-handed coordinate
     system X, Y and Z, where Z is the vertical axis then the frame is a list
@@ -26,14 +27,100 @@
     Each monochrome LED is represented by one byte.
 """
 
+import itertools
 import time
 
 import click
 import zmq
 
+from . import frame_codec
+from . import recording
+from . import show_cache
+from . import transport
+from . import wiring
+from .effects import transitions
 from .effects.engine import EffectEngine
-from .effects.animations import import_animation
-from .frame_utils import FrameConstants
+from .effects.animations import DEFAULT_ANIMATIONS, import_animation
+from .frame_utils import FRAME_SHAPE, FrameConstants, FrameMapper
+
+
+class FanOutPublisher(object):
+    """ Publish each frame to several targets, converting it to each
+        target's physical layout.
+
+        :param list targets:
+            A list of (FrameMapper, publisher) pairs.
+    """
+
+    def __init__(self, targets):
+        self.targets = targets
+
+    def publish(self, frame, display_at=None):
+        for mapper, publisher in self.targets:
+            publisher.publish(mapper(frame), display_at=display_at)
+
+    def close(self):
+        for _, publisher in self.targets:
+            publisher.close()
+
+
+def parse_wiring(ctx, param, value):
+    """ Load a --wiring file. """
+    if value is None:
+        return None
+    try:
+        return wiring.load_wiring(value)
+    except (IOError, wiring.WiringError) as err:
+        raise click.BadParameter(str(err))
+
+
+def parse_target(ctx, param, value):
+    """ Parse --target TTYPE=ADDR options, where TTYPE may also be a
+        wiring file.
+    """
+    targets = []
+    for target in value:
+        layout, _, addr = target.partition('=')
+        if not addr:
+            raise click.BadParameter(
+                "{!r} is not TTYPE=ADDR.".format(target))
+        if layout not in FrameConstants.TESSERACT_TYPES:
+            try:
+                layout = wiring.load_wiring(layout)
+            except (IOError, wiring.WiringError) as err:
+                raise click.BadParameter(
+                    "{!r} is not TTYPE=ADDR with TTYPE one of {} or a"
+                    " wiring file: {}".format(
+                        target,
+                        ", ".join(sorted(FrameConstants.TESSERACT_TYPES)),
+                        err))
+        targets.append((layout, addr))
+    return targets
+
+
+def publish_frames(publisher, frames, tick, display_delay):
+    """ Publish frames on a regular schedule.
+
+        :param publisher:
+            The transport publisher to publish frames with.
+        :param iterable frames:
+            The frames to publish.
+        :param float tick:
+            Seconds between frames.
+        :param float display_delay:
+            Seconds between when a frame is scheduled and when it should
+            be displayed.
+    """
+    scheduled = time.time()
+    for frame in frames:
+        publisher.publish(frame, display_at=scheduled + display_delay)
+        scheduled += tick
+        sleep_time = scheduled - time.time()
+        if sleep_time > 0:
+            time.sleep(sleep_time)
+        elif sleep_time < -display_delay:
+            # too far behind to catch up, so start a new schedule
+            scheduled = time.time()
 
 
 @click.command(context_settings={"auto_envvar_prefix": "TSC"})
@@ -43,37 +130,131 @@ from .frame_utils import FrameConstants
 @click.option(
     '--ttype', default="tesseract",
     type=click.Choice(FrameConstants.TESSERACT_TYPES.keys()))
+@click.option(
+    '--wiring', 'wiring_map', default=None, callback=parse_wiring,
+    type=click.Path(exists=True, dir_okay=False),
+    help='Wiring map file to lay out frames with instead of --ttype'
+         ' (see tessled.wiring).')
 @click.option(
     '--transition', default=60,
     help='Time between animation transitions.')
+@click.option(
+    '--crossfade', default=0.0, type=click.FloatRange(0, None),
+    help='Seconds to crossfade between animations for at each transition'
+         ' (default: cut straight to the next animation).')
+@click.option(
+    '--transition-mask', default='fade',
+    type=click.Choice(list(transitions.MASKS) + ['random']),
+    help='How to crossfade: fade every voxel together, wipe across the'
+         ' cube, dissolve voxel by voxel or pick one at random for each'
+         ' transition.')
 @click.option(
     '--animation', default=None,
     help='Run only a selected set of comma-separated animations.')
 @click.option(
     '--frame-addr', default='tcp://127.0.0.1:5556',
-    help='ZeroMQ address to publish frames too.')
-def main(fps, ttype, transition, animation, frame_addr):
+    help='ZeroMQ address to publish frames too, or shm://<name> to write'
+         ' them to a shared memory ring (on the same machine).')
+@click.option(
+    '--target', 'targets', multiple=True, callback=parse_target,
+    help='Publish frames for another tesseract type (or wiring file) as'
+         ' TTYPE=ADDR, e.g. minicube=tcp://127.0.0.1:5557. May be'
+         ' repeated. Each frame is rendered once and converted for each'
+         ' target. When given, frames are only published to the targets,'
+         ' not --frame-addr.')
+@click.option(
+    '--display-delay', default=0.1, type=float,
+    help='Seconds between when a frame is scheduled to be rendered and'
+         ' when it should be displayed.')
+@click.option(
+    '--encoding', default='raw',
+    type=click.Choice(sorted(frame_codec.ENCODINGS.keys())),
+    help='How to encode frames sent over ZeroMQ: raw, run-length encoded'
+         ' (rle) or run-length encoded deltas between keyframes (delta).')
+@click.option(
+    '--keyframe-interval', default=30, type=click.IntRange(1, None),
+    help='Frames between keyframes with --encoding=delta.')
+@click.option(
+    '--seed', default=None, type=int,
+    help='Random seed, to make the playlist and animations repeatable.')
+@click.option(
+    '--prerender', default=None, type=click.Path(dir_okay=False),
+    help='Render --duration seconds of frames into a show cache file'
+         ' instead of publishing them.')
+@click.option(
+    '--duration', default=600.0, type=float,
+    help='Seconds of frames to render with --prerender.')
+@click.option(
+    '--from-cache', default=None, type=click.Path(dir_okay=False),
+    help='Publish the frames in a show cache file (in a loop) instead of'
+         ' running the animations. The other options must match those'
+         ' used to render the cache.')
+def main(fps, ttype, wiring_map, transition, crossfade, transition_mask,
+         animation, frame_addr, targets, display_delay, encoding,
+         keyframe_interval, seed, prerender, duration, from_cache):
     click.echo("Tesseract effectbox running.")
     tick = 1. / fps
-    context = zmq.Context()
-    frame_socket = context.socket(zmq.PUB)
-    frame_socket.bind(frame_addr)
 
-    fc = FrameConstants(fps=fps, ttype=ttype)
-    engine = EffectEngine(fc=fc, tick=tick, transition=transition)
+    layouts = [wiring_map] + [layout for layout, _ in targets]
+    for layout in layouts:
+        if isinstance(layout, wiring.Wiring) and (
+                layout.frame_shape != FRAME_SHAPE):
+            raise click.ClickException(
+                "{}: the wiring is for {} frames, not {}.".format(
+                    layout.name, layout.frame_shape, FRAME_SHAPE))
+    fc = FrameConstants(fps=fps, ttype=ttype, wiring=wiring_map)
     if animation:
+        animation_classes = []
         for name in animation.split(','):
             name, _, subname = name.partition('.')
-            engine.add_animation_type(import_animation(name, subname))
+            animation_classes.append(import_animation(name, subname))
     else:
-        engine.add_default_animation_types()
-
-    while True:
-        start = time.time()
-        frame = engine.next_frame()
-        frame = fc.virtual_to_physical(frame)
-        frame_socket.send(frame.tobytes())
-        sleep_time = tick - (time.time() - start)
-        if sleep_time > 0:
-            time.sleep(sleep_time)
+        animation_classes = list(DEFAULT_ANIMATIONS)
+    params = show_cache.cache_params(
+        animation_classes, transition, fc, seed, crossfade=crossfade,
+        transition_mask=transition_mask)
+
+    if from_cache:
+        try:
+            cache = show_cache.open_cache(from_cache, params)
+        except (show_cache.StaleCacheError, recording.RecordingError) as err:
+            raise click.ClickException(str(err))
+        click.echo("Playing {} cached frames from {}.".format(
+            len(cache), from_cache))
+        frames = itertools.cycle(cache.frames)
+        layout = fc.layout
+    else:
+        show_cache.seed_random(seed)
+        engine = EffectEngine(
+            fc=fc, tick=tick, transition=transition, crossfade=crossfade,
+            transition_mask=transition_mask)
+        for animation_cls in animation_classes:
+            engine.add_animation_type(animation_cls)
+        if prerender:
+            n_frames = show_cache.prerender(
+                engine, fc, prerender, duration, params)
+            click.echo("Rendered {} frames to {}.".format(
+                n_frames, prerender))
+            return
+        if targets:
+            frames = (engine.next_frame() for _ in itertools.count())
+            layout = None
+        else:
+            frames = (
+                fc.virtual_to_physical(engine.next_frame())
+                for _ in itertools.count())
+
+    context = zmq.Context()
+    if targets:
+        publisher = FanOutPublisher([
+            (FrameMapper(layout, target_layout, fc.frame_shape),
+             transport.open_publisher(
+                 addr, fc.frame_shape, context=context, encoding=encoding,
+                 keyframe_interval=keyframe_interval))
+            for target_layout, addr in targets])
+    else:
+        publisher = transport.open_publisher(
+            frame_addr, fc.frame_shape, context=context, encoding=encoding,
+            keyframe_interval=keyframe_interval)
+    publish_frames(publisher, frames, tick, display_delay)
     click.echo("Tesseract effectbox exited.")
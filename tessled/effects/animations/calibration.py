@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+""" Calibration sweep animation.
+
+    Lights one column of LEDs (i.e. one TLC ground line) at a time next
+    to a fixed reference column so that their brightness can be compared
+    when building a dot correction calibration file (see
+    tessled.calibration).
+"""
+
+import click
+import numpy as np
+
+from ..engine import Animation
+from ..argtypes import IntArg
+
+
+class CalibrationSweep(Animation):
+
+    ANIMATION = __name__ + ".sweep"
+    ARGS = {
+        'hold': IntArg(default=50, min=1),
+        'reference': IntArg(default=0, min=0, max=63),
+    }
+
+    def post_init(self):
+        # Work out which virtual voxels end up in each physical column so
+        # that columns can be identified by their TLC output number.
+        layers = self.fc.frame_shape[0]
+        virtual = np.arange(np.prod(self.fc.frame_shape))
+        virtual = virtual.reshape(self.fc.frame_shape)
+        physical = self.fc.virtual_to_physical(virtual)
+        self._columns = physical.reshape(layers, -1).T
+        self._reference = np.unravel_index(
+            self._columns[self.reference], self.fc.frame_shape)
+        self._column = -1
+        self._t = 0
+
+    def _next_column(self):
+        self._column = (self._column + 1) % len(self._columns)
+        click.echo(
+            "Calibrating TLC output {} against reference output {}.".format(
+                16 + self._column, 16 + self.reference))
+
+    def render(self, frame):
+        if self._t % self.hold == 0:
+            self._next_column()
+        self._t += 1
+        frame[self._reference] = 255
+        frame[np.unravel_index(
+            self._columns[self._column], self.fc.frame_shape)] = 255
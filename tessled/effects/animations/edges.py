@@ -20,16 +20,17 @@ class Swipe:
         self.min = -8.0
         self.reset = True
         self.state = self.up
+        self.states = [
+            self._in, self.out, self.up, self.down, self.left, self.right,
+            self._in, self.out, self.up, self.down, self.left, self.right,
+            self.diag_up_left_in, self.diag_up_left_out,
+            self.diag_up_right_in, self.diag_up_right_out,
+            self.diag_down_left_in, self.diag_down_left_out,
+            self.diag_down_right_in, self.diag_down_right_out]
 
     def next(self):
         if self.reset:
-            self.state = random.choice(
-                [self._in, self.out, self.up, self.down, self.left, self.right,
-                 self._in, self.out, self.up, self.down, self.left, self.right,
-                 self.diag_up_left_in, self.diag_up_left_out,
-                 self.diag_up_right_in, self.diag_up_right_out,
-                 self.diag_down_left_in, self.diag_down_left_out,
-                 self.diag_down_right_in, self.diag_down_right_out])
+            self.state = random.choice(self.states)
         return self.state()
 
     def up(self):
@@ -95,6 +96,7 @@ class Swipe:
 class SolidEdge(Animation):
 
     ANIMATION = __name__ + ".swipe"
+    ALLOCATION_FREE = True
     ARGS = {
     }
 
@@ -14,6 +14,7 @@ from ..sprites import Cube
 class ExpandingBoxSlow(Animation):
 
     ANIMATION = __name__ + ".slow"
+    ALLOCATION_FREE = True
     ARGS = {
     }
     SLOWNESS = 4
@@ -27,7 +28,7 @@ class ExpandingBoxSlow(Animation):
         self._t = (self._t + 1) % self.SLOWNESS
         if self._t == 0:
             self._cube.size = next(self._sizes)
-        small = 4 - self._cube.size / 2
+        small = 4 - self._cube.size // 2
         self._cube.pos = (small, small, small)
         self._cube.render(frame)
 
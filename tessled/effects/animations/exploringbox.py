@@ -39,6 +39,7 @@ class SpiralPath:
 class ExploringBox(Animation):
 
     ANIMATION = __name__
+    ALLOCATION_FREE = True
     ARGS = {
     }
 
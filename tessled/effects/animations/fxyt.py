@@ -3,8 +3,6 @@
 """ Animations of the form z = f(x, y, t).
 """
 
-import time
-
 import numpy as np
 
 from ..engine import Animation
@@ -35,8 +33,7 @@ class Fxyt(Sprite):
         self.z_min = f.range_z[0]
         self.z_resize = (f.range_z[1] - f.range_z[0]) / 8.
 
-    def render(self, frame):
-        t = time.time()
+    def render(self, frame, t):
         z = self.f(self.x, self.y, t)
         z = (z - self.z_min) / self.z_resize
         zi = np.floor(z).astype(np.int).clip(0, 7)
@@ -53,7 +50,7 @@ class FxytMexicanHat(Animation):
         self.fxyt = Fxyt(self.f)
 
     def render(self, frame):
-        self.fxyt.render(frame)
+        self.fxyt.render(frame, self.t)
 
     @frange(x=(-8, 8), y=(-8, 8), z=(-0.2, 0.6))
     def f(self, x, y, t):
@@ -109,8 +106,8 @@ class FxytBreather(Animation):
         self.fxyt_2 = Fxyt(self.f_2)
 
     def render(self, frame):
-        self.fxyt_1.render(frame)
-        self.fxyt_2.render(frame)
+        self.fxyt_1.render(frame, self.t)
+        self.fxyt_2.render(frame, self.t)
 
     @frange(x=(-1, 1), y=(-1, 1), z=(-1.24, 1.6))
     def f_1(self, x, y, t):
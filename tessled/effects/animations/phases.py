@@ -55,6 +55,7 @@ class Swipe:
 class Phases(Animation):
 
     ANIMATION = __name__ + ".swipe"
+    ALLOCATION_FREE = True
     ARGS = {
     }
 
@@ -70,22 +71,12 @@ class Phases(Animation):
             Swipe(3, 1), Swipe(4, 1), Swipe(5, 2),
             Swipe(6, 3), Swipe(7, 4),
         ]
+        self._scratch_frame = self.scratch_frame()
 
     def render(self, frame):
-        frames = [
-            self.fc.empty_frame(), self.fc.empty_frame(),
-            self.fc.empty_frame(), self.fc.empty_frame(),
-            self.fc.empty_frame(), self.fc.empty_frame(),
-            self.fc.empty_frame(), self.fc.empty_frame(),
-        ]
+        scratch = self._scratch_frame
         for i in range(8):
             self._lines[i].pos = self._path[i].next()
-            self._lines[i].render(frames[i])
-        frame[:, 0:1, :] = frames[0][:, 0:1, :]
-        frame[:, 1:2, :] = frames[1][:, 1:2, :]
-        frame[:, 2:3, :] = frames[2][:, 2:3, :]
-        frame[:, 3:4, :] = frames[3][:, 3:4, :]
-        frame[:, 4:5, :] = frames[4][:, 4:5, :]
-        frame[:, 5:6, :] = frames[5][:, 5:6, :]
-        frame[:, 6:7, :] = frames[6][:, 6:7, :]
-        frame[:, 7:8, :] = frames[7][:, 7:8, :]
+            scratch.fill(0)
+            self._lines[i].render(scratch)
+            frame[:, i:i + 1, :] = scratch[:, i:i + 1, :]
@@ -11,12 +11,13 @@ from ..engine import Animation
 class PowerOn(Animation):
 
     ANIMATION = __name__
+    ALLOCATION_FREE = True
     ARGS = {
     }
 
     def post_init(self):
         self._layer = 0
-        self._frame = self.fc.empty_frame()
+        self._frame = self.scratch_frame()
 
     def render(self, frame):
         self._frame[self._layer] = 0
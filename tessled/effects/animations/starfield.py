@@ -31,6 +31,6 @@ class Starfield(Animation):
             del self.stars[i][0:n]
 
     def render(self, frame):
-        self.del_stars(self.n / 10)
-        self.add_stars(self.n / 10)
+        self.del_stars(self.n // 10)
+        self.add_stars(self.n // 10)
         frame[self.stars[0], self.stars[1], self.stars[2]] = 255
@@ -11,6 +11,7 @@ from ..engine import Animation
 class Test(Animation):
 
     ANIMATION = __name__
+    ALLOCATION_FREE = True
     ARGS = {
     }
 
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+""" Blend modes for compositing animation layers.
+
+    Each blend mode composites a layer (``src``) onto the frame below it
+    (``dst``), in place::
+
+        max       the brighter of the two voxels
+        add       the sum of the two voxels, saturating at 255
+        multiply  the product of the two voxels (scaled so that 255 is 1)
+        mask      the frame below, only where the layer is lit
+        alpha     the layer over the frame below with a fixed opacity
+
+    Blending uses integer arithmetic on the uint8 frames and scratch
+    arrays from the frame pool (with numpy scalar constants, which numpy
+    does not need casting buffers for), so compositing allocates no
+    arrays.
+"""
+
+import numpy as np
+
+from ..frame_utils import FramePool
+
+_U8_MAX = np.uint8(255)
+_U8_ONE = np.uint8(1)
+_U16_MAX = np.uint16(255)
+_U16_HALF = np.uint16(127)
+
+
+def divide_255(wide):
+    """ Divide a uint16 array by 255, rounding to the nearest integer. """
+    np.add(wide, _U16_HALF, out=wide)
+    np.floor_divide(wide, _U16_MAX, out=wide)
+
+
+def blend_max(dst, src, alpha, pool):
+    np.maximum(dst, src, out=dst)
+
+
+def blend_add(dst, src, alpha, pool):
+    headroom = pool.acquire(dst.shape, clear=False)
+    np.subtract(_U8_MAX, dst, out=headroom)
+    np.minimum(headroom, src, out=headroom)
+    np.add(dst, headroom, out=dst)
+    pool.release(headroom)
+
+
+def blend_multiply(dst, src, alpha, pool):
+    wide = pool.acquire(dst.shape, np.uint16, clear=False)
+    wide_src = pool.acquire(dst.shape, np.uint16, clear=False)
+    np.copyto(wide, dst)
+    np.copyto(wide_src, src)
+    np.multiply(wide, wide_src, out=wide)
+    divide_255(wide)
+    dst[...] = wide
+    pool.release(wide)
+    pool.release(wide_src)
+
+
+def blend_mask(dst, src, alpha, pool):
+    lit = pool.acquire(dst.shape, clear=False)
+    np.minimum(src, _U8_ONE, out=lit)
+    np.multiply(dst, lit, out=dst)
+    pool.release(lit)
+
+
+def blend_alpha(dst, src, alpha, pool):
+    opacity = np.uint16(int(round(alpha * 255)))
+    wide = pool.acquire(dst.shape, np.uint16, clear=False)
+    wide_dst = pool.acquire(dst.shape, np.uint16, clear=False)
+    np.copyto(wide, src)
+    np.multiply(wide, opacity, out=wide)
+    np.copyto(wide_dst, dst)
+    np.multiply(wide_dst, _U16_MAX - opacity, out=wide_dst)
+    np.add(wide, wide_dst, out=wide)
+    divide_255(wide)
+    dst[...] = wide
+    pool.release(wide)
+    pool.release(wide_dst)
+
+
+BLEND_MODES = {
+    "max": blend_max,
+    "add": blend_add,
+    "multiply": blend_multiply,
+    "mask": blend_mask,
+    "alpha": blend_alpha,
+}
+
+
+def blend(dst, src, mode="max", alpha=1.0, pool=None):
+    """ Composite a layer onto a frame in place.
+
+        :param numpy.ndarray dst:
+            The frame to composite onto.
+        :param numpy.ndarray src:
+            The layer to composite.
+        :param str mode:
+            The blend mode (one of BLEND_MODES). Default: "max".
+        :param float alpha:
+            The layer's opacity, from 0 to 1, for the "alpha" mode.
+            Default: 1.0.
+        :param frame_utils.FramePool pool:
+            The pool to take scratch arrays from. Default: a new pool.
+    """
+    if not 0 <= alpha <= 1:
+        raise ValueError("Alpha must be from 0 to 1: {!r}".format(alpha))
+    if pool is None:
+        pool = FramePool(dst.shape, dst.dtype)
+    BLEND_MODES[mode](dst, src, alpha, pool)
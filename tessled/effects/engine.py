@@ -3,9 +3,14 @@
 """ Engine and base classes for applying effects. """
 
 import random
+import time
 
 import click
 
+from . import blending
+from . import transitions
+from .. import timing
+
 
 class EffectEngine(object):
     """ Engine for applying effects.
@@ -18,19 +23,61 @@ class EffectEngine(object):
             Time step between frames.
         transition : float
             Time between animation transitions.
+        crossfade : float
+            Time that the outgoing and incoming animations overlap for
+            during a transition. Default: 0 (a hard cut).
+        transition_mask : str
+            How the animations are mixed during a crossfade: one of
+            transitions.MASKS or "random" (a random mask for each
+            transition). Default: "fade".
+
+        Frames come from the frame constants' frame pool, so the frame
+        returned by ``next_frame`` is only valid until the next call.
+
+        The lowest layer with animations is rendered straight into the
+        frame. Each layer above it is rendered into its own pooled frame
+        and then composited onto the layers below with the layer's blend
+        mode (see ``set_layer_blend`` and tessled.effects.blending).
+
+        The time taken to render each frame is recorded in
+        ``.render_times`` (or ``.crossfade_times`` during crossfades,
+        when two animations are rendered) and frames that take longer
+        than the tick are counted in ``.frames_over_budget``.
     """
 
-    def __init__(self, fc, tick, transition=60):
+    def __init__(self, fc, tick, transition=60, crossfade=0.0,
+                 transition_mask="fade"):
         self._animation_types = {}
         self._frame_constants = fc
         self._animation_layers = [
             'background', 'default', 'foreground',
         ]
         self._animations = dict((k, []) for k in self._animation_layers)
+        self._blends = dict(
+            (k, ("max", 1.0)) for k in self._animation_layers)
         self._tick = tick
         self._transition_time = transition
         # do first transition straight away
         self._next_transition = 0
+        self._frame = None
+        if transition_mask == "random":
+            masks = transitions.MASKS
+        else:
+            masks = [transition_mask]
+        self._transition_mask = transition_mask
+        self._crossfades = {}
+        self._weight_tables = {}
+        steps = int(round(crossfade / float(tick)))
+        if steps > 0:
+            for mask in masks:
+                weights = transitions.weight_table(
+                    mask, steps, fc.frame_shape)
+                self._weight_tables[mask] = (weights, 255 - weights)
+        self._budget = int(tick * 1e9)
+        self.render_times = timing.HdrHistogram("render")
+        self.crossfade_times = timing.HdrHistogram("crossfade render")
+        self.frames_over_budget = 0
+        self._slowest_crossfade = 0
 
     def add_animation_type(self, animation_cls):
         self._animation_types[animation_cls.ANIMATION] = animation_cls
@@ -47,6 +94,25 @@ class EffectEngine(object):
         animation = animation_cls(self._frame_constants, **kw)
         self._animations[layer].append(animation)
 
+    def set_layer_blend(self, layer, mode, alpha=1.0):
+        """ Set how a layer is composited onto the layers below it.
+
+            :param str layer:
+                The layer: "background", "default" or "foreground".
+            :param str mode:
+                The blend mode (one of blending.BLEND_MODES).
+            :param float alpha:
+                The layer's opacity, from 0 to 1, for the "alpha" mode.
+                Default: 1.0.
+        """
+        if layer not in self._blends:
+            raise ValueError("Unknown layer {!r}".format(layer))
+        if mode not in blending.BLEND_MODES:
+            raise ValueError("Unknown blend mode {!r}".format(mode))
+        if not 0 <= alpha <= 1:
+            raise ValueError("Alpha must be from 0 to 1: {!r}".format(alpha))
+        self._blends[layer] = (mode, alpha)
+
     def _is_valid_new_animation(self, name, layer):
         if len(self._animation_types) <= 1:
             return True
@@ -58,39 +124,121 @@ class EffectEngine(object):
         if layer is None:
             layer = "default"
         while True:
-            name = random.choice(self._animation_types.keys())
+            name = random.choice(list(self._animation_types.keys()))
             if self._is_valid_new_animation(name, layer):
                 break
         click.echo("New animation: {!r}".format(name))
+        outgoing = self._animations[layer][:]
         del self._animations[layer][:]
+        previous = self._crossfades.pop(layer, None)
+        if previous is not None:
+            previous.close()
+        if outgoing and self._weight_tables:
+            mask = self._transition_mask
+            if mask == "random":
+                mask = random.choice(transitions.MASKS)
+            self._crossfades[layer] = transitions.Transition(
+                outgoing, *self._weight_tables[mask])
+        else:
+            for animation in outgoing:
+                animation.close()
         self.add_animation(name, layer=layer)
 
     def set_next_transition(self, seconds):
         self._next_transition = seconds
 
     def next_frame(self):
+        start = time.perf_counter_ns()
         self._next_transition -= self._tick
         if self._next_transition <= 0:
             self.set_next_transition(self._transition_time)
             self.set_random_animation()
-        frame = self._frame_constants.empty_frame()
+        pool = self._frame_constants.frame_pool
+        if self._frame is not None:
+            pool.release(self._frame)
+        frame = self._frame = pool.acquire()
+        target = frame
+        crossfading = bool(self._crossfades)
         for layer in self._animation_layers:
-            for animation in self._animations[layer][:]:
-                animation.render(frame)
+            animations = self._animations[layer]
+            crossfade = self._crossfades.get(layer)
+            if not animations and crossfade is None:
+                continue
+            if target is None:
+                target = pool.acquire()
+            for animation in animations[:]:
+                animation.render(target)
+                animation.t += self._tick
                 if animation.done():
-                    self._animations[layer].remove(animation)
+                    animation.close()
+                    animations.remove(animation)
+            if crossfade is not None:
+                self._mix_outgoing(layer, crossfade, target, pool)
+            if target is not frame:
+                mode, alpha = self._blends[layer]
+                blending.blend(frame, target, mode, alpha, pool)
+                pool.release(target)
+            # layers above this one are rendered separately
+            target = None
+        elapsed = time.perf_counter_ns() - start
+        if crossfading:
+            self.crossfade_times.record(elapsed)
+            self._slowest_crossfade = max(self._slowest_crossfade, elapsed)
+            if not self._crossfades:
+                self._check_crossfade_budget()
+        else:
+            self.render_times.record(elapsed)
+        if elapsed > self._budget:
+            self.frames_over_budget += 1
         return frame
 
+    def _mix_outgoing(self, layer, crossfade, target, pool):
+        """ Render a layer's outgoing animations and mix them into the
+            layer's frame.
+        """
+        outgoing = pool.acquire()
+        for animation in crossfade.animations:
+            animation.render(outgoing)
+            animation.t += self._tick
+        crossfade.mix(target, outgoing, pool)
+        pool.release(outgoing)
+        if crossfade.done():
+            crossfade.close()
+            del self._crossfades[layer]
+
+    def _check_crossfade_budget(self):
+        """ Warn if the crossfade that just finished rendered frames
+            more slowly than the tick.
+        """
+        if self._slowest_crossfade > self._budget:
+            click.echo(
+                "Crossfade took up to {:.1f} ms per frame, longer than the"
+                " {:.1f} ms tick.".format(
+                    self._slowest_crossfade / 1e6, self._budget / 1e6))
+        self._slowest_crossfade = 0
+
 
 class Animation(object):
-    """ Base animation class. """
+    """ Base animation class.
+
+        ``.t`` is the time, in seconds, that the animation has been
+        running for. The engine advances it by one tick for each frame
+        rendered, so animations that move with time should use it rather
+        than the wall clock (frames may be rendered faster than real time,
+        e.g. when pre-rendering a show).
+    """
 
     ANIMATION = "unknown"
     ARGS = {}
     SKIP_GENERIC_TEST = False
+    # whether rendering allocates no arrays once the animation is running
+    # (checked by the generic animation tests)
+    ALLOCATION_FREE = False
 
     def __init__(self, frame_constants, **kw):
         self.fc = frame_constants
+        self.t = 0.0
+        self._scratch = []
         self._set_args(kw)
         self.post_init()
 
@@ -102,6 +250,20 @@ class Animation(object):
     def post_init(self):
         """ Post initialization set up. """
 
+    def scratch_frame(self, shape=None, dtype=None):
+        """ Return a scratch array from the frame pool (by default, a
+            frame) for the animation to reuse while it runs.
+        """
+        array = self.fc.frame_pool.acquire(shape, dtype)
+        self._scratch.append(array)
+        return array
+
+    def close(self):
+        """ Return the animation's scratch arrays to the frame pool. """
+        for array in self._scratch:
+            self.fc.frame_pool.release(array)
+        del self._scratch[:]
+
     def done(self):
         """ Return True if the animation is finished. False otherwise. """
         return False
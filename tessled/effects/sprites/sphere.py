@@ -20,26 +20,46 @@ class Sphere(Sprite):
             to 255 (brightest).
         :param float sharpness:
             Measure of how sharply the sphere is rendered.
+        :param function scratch:
+            A function that returns a scratch array given its shape and
+            dtype, e.g. ``Animation.scratch_frame``. Default: numpy.zeros.
 
         Note: The integer position coordinates mark the grid intersections
         *between* LEDs. The centres of LEDs are given by half-integer
         coordinates.
     """
 
-    _GRID = np.mgrid[0.5:8:1, 0.5:8:1, 0.5:8:1].transpose(1, 2, 3, 0)
+    # one grid of LED centre coordinates per axis
+    _GRID = np.mgrid[0.5:8:1, 0.5:8:1, 0.5:8:1]
 
-    def __init__(self, pos=(4, 4, 4), radius=1, intensity=255, sharpness=1):
+    def __init__(self, pos=(4, 4, 4), radius=1, intensity=255, sharpness=1,
+                 scratch=np.zeros):
         self.pos = pos
         self.radius = radius
         self.intensity = intensity
         self.sharpness = sharpness
+        self._dp = scratch(self._GRID.shape[1:], self._GRID.dtype)
+        self._dr = scratch(self._GRID.shape[1:], self._GRID.dtype)
+        self._levels = scratch(self._GRID.shape[1:], np.uint8)
 
     def step(self):
         pass
 
     def render(self, frame):
-        dp = self._GRID - np.array(self.pos)
-        dr = np.sqrt(np.sum(dp ** 2, -1)) - self.radius
-        dr = 1 - self.sharpness * np.abs(dr)
-        dr[dr < 0] = 0
-        frame[:] = np.maximum(frame, dr * self.intensity)
+        # computed in place in scratch arrays, one axis at a time, so
+        # that rendering does not allocate any arrays
+        dp, dr = self._dp, self._dr
+        dr.fill(0)
+        for grid, p in zip(self._GRID, self.pos):
+            np.subtract(grid, p, out=dp)
+            np.square(dp, out=dp)
+            dr += dp
+        np.sqrt(dr, out=dr)
+        dr -= self.radius
+        np.abs(dr, out=dr)
+        dr *= self.sharpness
+        np.subtract(1, dr, out=dr)
+        np.maximum(dr, 0, out=dr)
+        dr *= self.intensity
+        self._levels[...] = dr
+        np.maximum(frame, self._levels, out=frame)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+""" Crossfade transitions between animations.
+
+    During a transition both the outgoing and the incoming animations are
+    rendered and their frames are mixed voxel by voxel::
+
+        frame = (incoming * weight + outgoing * (255 - weight)) / 255
+
+    The weights for every step of the transition are precomputed when the
+    engine is created, one uint16 array per step (with the complements
+    also precomputed), so mixing a frame is a handful of in-place integer
+    operations on pooled scratch arrays. The masks are:
+
+        fade      every voxel fades from the outgoing to the incoming
+                  animation together
+        wipe      the incoming animation sweeps across the cube (along
+                  the X axis) with a soft edge
+        dissolve  voxels switch to the incoming animation one by one in
+                  a random order
+"""
+
+import numpy as np
+
+from . import blending
+
+MASKS = ("fade", "wipe", "dissolve")
+
+
+def weight_table(mask, steps, frame_shape):
+    """ Return the weights of the incoming animation for each step of a
+        transition, as a uint16 array of shape (steps,) + frame_shape
+        with values from 0 to 255.
+
+        :param str mask:
+            One of MASKS.
+        :param int steps:
+            The number of frames the transition lasts.
+        :param tuple frame_shape:
+            The shape of frames.
+    """
+    frame_shape = tuple(frame_shape)
+    # progress through the transition, excluding the frames before and
+    # after it (which are all outgoing or all incoming)
+    progress = np.arange(1, steps + 1) / float(steps + 1)
+    progress = progress.reshape((steps,) + (1,) * len(frame_shape))
+    if mask == "fade":
+        weights = np.broadcast_to(progress, (steps,) + frame_shape)
+    elif mask == "wipe":
+        columns = frame_shape[-1]
+        soft = 2. / columns
+        centres = (np.arange(columns) + 0.5) / columns
+        weights = np.clip((progress * (1 + soft) - centres) / soft, 0, 1)
+        weights = np.broadcast_to(weights, (steps,) + frame_shape)
+    elif mask == "dissolve":
+        n_voxels = int(np.prod(frame_shape))
+        ranks = np.random.permutation(n_voxels).reshape(frame_shape)
+        weights = (ranks < progress * n_voxels).astype(np.float64)
+    else:
+        raise ValueError("Unknown transition mask {!r}".format(mask))
+    return np.round(weights * 255).astype(np.uint16)
+
+
+class Transition(object):
+    """ Animations being mixed out of a layer.
+
+        :param list animations:
+            The outgoing animations.
+        :param numpy.ndarray weights:
+            The weight table (see ``weight_table``).
+        :param numpy.ndarray complements:
+            255 minus the weight table.
+    """
+
+    def __init__(self, animations, weights, complements):
+        self.animations = animations
+        self.weights = weights
+        self.complements = complements
+        self.step = 0
+
+    def done(self):
+        return self.step >= len(self.weights)
+
+    def mix(self, frame, outgoing, pool):
+        """ Mix the outgoing animations' frame into the incoming
+            animations' frame, in place, and move on to the next step.
+        """
+        wide = pool.acquire(frame.shape, np.uint16, clear=False)
+        wide_out = pool.acquire(frame.shape, np.uint16, clear=False)
+        np.copyto(wide, frame)
+        np.multiply(wide, self.weights[self.step], out=wide)
+        np.copyto(wide_out, outgoing)
+        np.multiply(wide_out, self.complements[self.step], out=wide_out)
+        np.add(wide, wide_out, out=wide)
+        blending.divide_255(wide)
+        frame[...] = wide
+        pool.release(wide)
+        pool.release(wide_out)
+        self.step += 1
+
+    def close(self):
+        for animation in self.animations:
+            animation.close()
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+""" Timestamped frame envelopes and a playout buffer for displaying
+    frames at their scheduled time.
+
+    The effectbox wraps each frame in an envelope: a fixed size header
+    followed by the frame data::
+
+        magic (4 bytes), version (uint8), number of dimensions (uint8),
+        dtype (2 bytes, e.g. "u1"), sequence number (uint64),
+        render time (float64), display time (float64),
+        shape (4 x uint16), encoding (uint8), padding (7 bytes)
+
+    Times are seconds since the epoch (``time.time()``), so the effectbox
+    and the driver need synchronised clocks if they run on different
+    machines. Sequence numbers start at 1 and increase by one per frame,
+    so gaps reveal lost frames. The encoding says how the frame data is
+    compressed (see tessled.frame_codec); subscribers decode whichever
+    encoding the publisher chose.
+
+    Messages that are just the frame data (without a header) are still
+    accepted and are displayed as soon as they arrive.
+"""
+
+import collections
+import heapq
+import struct
+
+import numpy as np
+
+from . import frame_codec
+
+ENVELOPE_MAGIC = b"TSCE"
+ENVELOPE_VERSION = 2
+ENVELOPE_HEADER = struct.Struct("=4sBB2sQdd4HB7x")
+MAX_DIMENSIONS = 4
+
+FrameHeader = collections.namedtuple(
+    "FrameHeader",
+    ["seq", "rendered_at", "display_at", "shape", "dtype", "encoding"])
+
+
+class EnvelopeError(ValueError):
+    """ Raised when a message is not a valid frame. """
+
+
+def message_size(frame_shape, dtype=np.uint8):
+    """ Return the size in bytes of an envelope holding a frame. """
+    return (
+        ENVELOPE_HEADER.size +
+        int(np.prod(frame_shape)) * np.dtype(dtype).itemsize)
+
+
+def pack_header(buf, seq, rendered_at, display_at, frame_shape,
+                dtype=np.uint8, encoding=frame_codec.ENCODING_RAW):
+    """ Write an envelope header to the start of a writable buffer. """
+    frame_shape = tuple(frame_shape)
+    if len(frame_shape) > MAX_DIMENSIONS:
+        raise EnvelopeError(
+            "Frames may have at most {} dimensions.".format(MAX_DIMENSIONS))
+    padded = frame_shape + (0,) * (MAX_DIMENSIONS - len(frame_shape))
+    ENVELOPE_HEADER.pack_into(
+        buf, 0, ENVELOPE_MAGIC, ENVELOPE_VERSION, len(frame_shape),
+        np.dtype(dtype).str[1:].encode("ascii"), seq, rendered_at,
+        display_at, *(padded + (encoding,)))
+
+
+def read_header(data):
+    """ Return the FrameHeader of a message, or None if the message is a
+        bare frame.
+    """
+    if len(data) < ENVELOPE_HEADER.size or (
+            bytes(data[:4]) != ENVELOPE_MAGIC):
+        return None
+    fields = ENVELOPE_HEADER.unpack_from(data)
+    version, ndim, dtype, seq, rendered_at, display_at = fields[1:7]
+    shape = fields[7:7 + MAX_DIMENSIONS]
+    if version != ENVELOPE_VERSION or ndim > MAX_DIMENSIONS:
+        raise EnvelopeError(
+            "Unsupported frame envelope (version {}).".format(version))
+    return FrameHeader(
+        seq, rendered_at, display_at, tuple(shape[:ndim]),
+        np.dtype(dtype.decode("ascii")), fields[-1])
+
+
+def unpack(data, frame_shape, dtype=np.uint8, decoder=None):
+    """ Return the header (or None) and the frame in a message.
+
+        :param buffer data:
+            The message received.
+        :param tuple frame_shape:
+            The expected shape of the frame.
+        :param dtype:
+            The expected numpy dtype of the frame. Default: numpy.uint8.
+        :param frame_codec.FrameDecoder decoder:
+            The decoder for the publisher's frames, needed for encoded
+            frames. Default: None.
+
+        :return tuple:
+            The header and a numpy array of the frame, which is a view of
+            ``data`` for raw frames and the decoder's frame otherwise. The
+            frame is None if it is a delta that cannot be decoded.
+    """
+    header = read_header(data)
+    offset = 0
+    if header is not None:
+        if header.shape != tuple(frame_shape) or header.dtype != dtype:
+            raise EnvelopeError(
+                "Expected {} {} frames but received {} {}.".format(
+                    tuple(frame_shape), np.dtype(dtype), header.shape,
+                    header.dtype))
+        offset = ENVELOPE_HEADER.size
+        if decoder is not None:
+            try:
+                return header, decoder.decode(
+                    header.seq, header.encoding, memoryview(data)[offset:])
+            except frame_codec.CodecError as err:
+                raise EnvelopeError(str(err))
+        if header.encoding != frame_codec.ENCODING_RAW:
+            raise EnvelopeError("Received an encoded frame.")
+    count = int(np.prod(frame_shape))
+    if len(data) - offset != count * np.dtype(dtype).itemsize:
+        raise EnvelopeError(
+            "Expected {} byte frames but received {} bytes.".format(
+                count * np.dtype(dtype).itemsize, len(data) - offset))
+    frame = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+    return header, frame.reshape(frame_shape)
+
+
+class PlayoutBuffer(object):
+    """ Hold frames until their display time.
+
+        :param tuple frame_shape:
+            The shape of the frames.
+        :param bool scheduled:
+            Whether to hold frames until their display time. If False,
+            frames are only checked for being lost or late. Default: True.
+        :param float max_delay:
+            The longest time, in seconds, to hold a frame for. Frames
+            scheduled further in the future (e.g. because the clocks
+            are not synchronised) are displayed after this delay.
+            Default: 1.0.
+        :param int max_frames:
+            The most frames to hold. The oldest frames are skipped if
+            more arrive. Default: 64.
+
+        Frames whose sequence number jumps forward are counted in
+        ``.frames_lost`` (by the size of the gap), and frames that
+        arrive after their display time, or out of order, in
+        ``.frames_late``. Late frames are displayed straight away unless
+        a newer frame is also due, while out of order frames are
+        discarded. A sequence number of 1 means the publisher restarted.
+        Encoded frames are decoded as they arrive; deltas that cannot be
+        decoded (because the previous frame was lost) are also counted as
+        lost.
+    """
+
+    def __init__(self, frame_shape, scheduled=True, max_delay=1.0,
+                 max_frames=64):
+        self.frame_shape = tuple(frame_shape)
+        self.scheduled = scheduled
+        self.max_delay = max_delay
+        self.max_frames = max_frames
+        self.last_seq = None
+        self.frames_lost = 0
+        self.frames_late = 0
+        self.frames_skipped = 0
+        self.decoder = frame_codec.FrameDecoder(frame_shape)
+        self._frames = []
+        self._pushed = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    def track(self, header, now):
+        """ Count lost and late frames.
+
+            :return bool:
+                False if the frame arrived out of order and should be
+                discarded, True otherwise.
+        """
+        if header is None:
+            return True
+        if self.last_seq is not None and header.seq != 1:
+            if header.seq <= self.last_seq:
+                self.frames_late += 1
+                return False
+            self.frames_lost += header.seq - self.last_seq - 1
+        self.last_seq = header.seq
+        if header.display_at < now:
+            self.frames_late += 1
+        return True
+
+    def receive(self, data, now):
+        """ Unpack and decode a message, counting lost and late frames.
+
+            :return tuple:
+                The header (or None) and frame (see ``unpack``). The frame
+                is None if it should not be displayed.
+        """
+        header = read_header(data)
+        if not self.track(header, now):
+            return header, None
+        header, frame = unpack(
+            data, self.frame_shape, decoder=self.decoder)
+        if frame is None:
+            self.frames_lost += 1
+        return header, frame
+
+    def push(self, data, now):
+        """ Add a message to the buffer, copying its frame. """
+        header, frame = self.receive(data, now)
+        if frame is None:
+            return
+        if header is None:
+            display_at = now
+        else:
+            display_at = min(header.display_at, now + self.max_delay)
+        self._pushed += 1
+        heapq.heappush(self._frames, (display_at, self._pushed, frame.copy()))
+        while len(self._frames) > self.max_frames:
+            heapq.heappop(self._frames)
+            self.frames_skipped += 1
+
+    def next_due(self):
+        """ Return the display time of the next frame, or None. """
+        return self._frames[0][0] if self._frames else None
+
+    def pop(self, now):
+        """ Return the newest frame due by now, or None. Older frames that
+            are also due are skipped.
+        """
+        frame = None
+        while self._frames and self._frames[0][0] <= now:
+            if frame is not None:
+                self.frames_skipped += 1
+            frame = heapq.heappop(self._frames)[2]
+        return frame
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+""" Compressed frame encodings for sending frames over the network.
+
+    Frames can be sent in one of three encodings, recorded in the frame
+    envelope (see tessled.envelope):
+
+    * ``ENCODING_RAW``: the frame's bytes.
+    * ``ENCODING_RLE``: a keyframe, run-length encoded.
+    * ``ENCODING_DELTA``: the frame XORed with the previous frame (so
+      unchanged voxels are zero), run-length encoded.
+
+    Run-length encoded payloads are::
+
+        number of runs (uint16), run lengths (uint16 each), literals
+
+    where the runs alternate between zero bytes and literal (non-zero)
+    bytes, starting with zeros (so the first run may be empty), and the
+    literals are the non-zero bytes in order. Encoding and decoding are
+    vectorised with numpy.
+
+    A delta can only be decoded if the previous frame was, so publishers
+    send a keyframe every ``keyframe_interval`` frames for subscribers that
+    join late or lose a frame.
+"""
+
+import struct
+
+import numpy as np
+
+ENCODING_RAW = 0
+ENCODING_RLE = 1
+ENCODING_DELTA = 2
+
+ENCODINGS = {
+    "raw": ENCODING_RAW,
+    "rle": ENCODING_RLE,
+    "delta": ENCODING_DELTA,
+}
+
+RUN_COUNT = struct.Struct("=H")
+
+
+class CodecError(ValueError):
+    """ Raised when a payload cannot be decoded. """
+
+
+def rle_encode(data):
+    """ Run-length encode zero runs in a uint8 array. """
+    nonzero = data != 0
+    changes = np.flatnonzero(nonzero[1:] != nonzero[:-1]) + 1
+    bounds = np.concatenate(([0], changes, [len(data)]))
+    runs = np.diff(bounds)
+    if len(data) and nonzero[0]:
+        runs = np.concatenate(([0], runs))
+    return b"".join([
+        RUN_COUNT.pack(len(runs)),
+        runs.astype("<u2").tobytes(),
+        data[nonzero].tobytes(),
+    ])
+
+
+def rle_decode(payload, out):
+    """ Decode a run-length encoded payload into a uint8 array. """
+    payload = memoryview(payload)
+    if len(payload) < RUN_COUNT.size:
+        raise CodecError("Truncated run-length encoded payload.")
+    (n_runs,) = RUN_COUNT.unpack_from(payload)
+    offset = RUN_COUNT.size + 2 * n_runs
+    runs = np.frombuffer(
+        payload, dtype="<u2", count=n_runs, offset=RUN_COUNT.size)
+    literal = np.zeros(n_runs, dtype=bool)
+    literal[1::2] = True
+    mask = np.repeat(literal, runs)
+    literals = np.frombuffer(payload, dtype=np.uint8, offset=offset)
+    if len(mask) != len(out) or mask.sum() != len(literals):
+        raise CodecError("Corrupt run-length encoded payload.")
+    out[:] = 0
+    out[mask] = literals
+
+
+class FrameEncoder(object):
+    """ Encode frames for publishing.
+
+        :param tuple frame_shape:
+            The shape of the frames.
+        :param dtype:
+            The numpy dtype of the frames. Default: numpy.uint8.
+        :param str encoding:
+            One of "raw", "rle" or "delta". Default: "raw".
+        :param int keyframe_interval:
+            The number of frames between keyframes with the "delta"
+            encoding. Default: 30.
+
+        Frames are sent raw whenever that is smaller than the encoded
+        payload.
+    """
+
+    def __init__(self, frame_shape, dtype=np.uint8, encoding="raw",
+                 keyframe_interval=30):
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.encoding = ENCODINGS[encoding]
+        self.keyframe_interval = keyframe_interval
+        self._frame = np.zeros(self.frame_shape, dtype=self.dtype)
+        self._previous = np.zeros(self.frame_shape, dtype=self.dtype)
+        self._delta = np.zeros(self.frame_shape, dtype=self.dtype)
+        self._frames = 0
+
+    def _bytes(self, frame):
+        return frame.reshape(-1).view(np.uint8)
+
+    def encode(self, frame):
+        """ Return the encoding and payload for the next frame. """
+        np.copyto(self._frame, frame)
+        self._frames += 1
+        raw = self._bytes(self._frame)
+        if self.encoding == ENCODING_RAW:
+            return ENCODING_RAW, raw.tobytes()
+        if self.encoding == ENCODING_DELTA and (
+                (self._frames - 1) % self.keyframe_interval):
+            np.bitwise_xor(
+                self._frame.view(np.uint8), self._previous.view(np.uint8),
+                out=self._delta.view(np.uint8))
+            encoding = ENCODING_DELTA
+            payload = rle_encode(self._bytes(self._delta))
+        else:
+            encoding = ENCODING_RLE
+            payload = rle_encode(raw)
+        self._frame, self._previous = self._previous, self._frame
+        if len(payload) >= raw.nbytes:
+            return ENCODING_RAW, raw.tobytes()
+        return encoding, payload
+
+
+class FrameDecoder(object):
+    """ Decode received frames.
+
+        :param tuple frame_shape:
+            The shape of the frames.
+        :param dtype:
+            The numpy dtype of the frames. Default: numpy.uint8.
+
+        Raw frames are returned as views of their payload, which must stay
+        valid until the next frame is decoded (it is only copied if the
+        next frame is a delta). Other frames are decoded into ``.frame``,
+        which is overwritten by the next frame decoded.
+    """
+
+    def __init__(self, frame_shape, dtype=np.uint8):
+        self.frame = np.zeros(frame_shape, dtype=dtype)
+        self._bytes = self.frame.reshape(-1).view(np.uint8)
+        self._delta = np.zeros_like(self._bytes)
+        self._raw = None
+        self._seq = None
+
+    def decode(self, seq, encoding, payload):
+        """ Decode a frame.
+
+            :param int seq:
+                The frame's sequence number.
+            :param int encoding:
+                The frame's encoding.
+            :param buffer payload:
+                The encoded frame.
+
+            :return numpy.ndarray:
+                The decoded frame, or None if it is a delta from a frame
+                that was not decoded.
+        """
+        if encoding == ENCODING_RAW:
+            if len(payload) != self._bytes.nbytes:
+                raise CodecError(
+                    "Expected {} byte frames but received {} bytes.".format(
+                        self._bytes.nbytes, len(payload)))
+            self._raw = payload
+            self._seq = seq
+            return np.frombuffer(payload, dtype=self.frame.dtype).reshape(
+                self.frame.shape)
+        if encoding == ENCODING_RLE:
+            rle_decode(payload, self._bytes)
+        elif encoding == ENCODING_DELTA:
+            if self._seq is None or seq != self._seq + 1:
+                self._seq = None
+                return None
+            if self._raw is not None:
+                self._bytes[:] = np.frombuffer(self._raw, dtype=np.uint8)
+            rle_decode(payload, self._delta)
+            self._bytes ^= self._delta
+        else:
+            raise CodecError("Unknown frame encoding {}.".format(encoding))
+        self._raw = None
+        self._seq = seq
+        return self.frame
@@ -28,6 +28,55 @@ def minicube_virtual_to_physical(virt_frame):
     return virt_frame[::-1, :, :]
 
 
+class FramePool(object):
+    """ A pool of reusable arrays, so that rendering frames does not
+        allocate new arrays once the pool is warm.
+
+        :param tuple frame_shape:
+            The shape of frames.
+        :param dtype:
+            The numpy dtype of frames. Default: FRAME_DTYPE.
+
+        ``acquire`` returns a free array (allocating one only if there
+        is none) and ``release`` returns it to the pool for reuse.
+        Arrays of other shapes and dtypes (e.g. float scratch arrays for
+        sprites) are pooled separately. ``.allocated`` counts the arrays
+        allocated.
+    """
+
+    def __init__(self, frame_shape, dtype=FRAME_DTYPE):
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.allocated = 0
+        self._free = {}
+
+    def acquire(self, shape=None, dtype=None, clear=True):
+        """ Return an array from the pool.
+
+            :param tuple shape:
+                The shape of the array. Default: the frame shape.
+            :param dtype:
+                The numpy dtype of the array. Default: the frame dtype.
+            :param bool clear:
+                Whether to zero the array. Default: True.
+        """
+        key = (
+            self.frame_shape if shape is None else tuple(shape),
+            self.dtype if dtype is None else np.dtype(dtype))
+        free = self._free.setdefault(key, [])
+        if free:
+            array = free.pop()
+            if clear:
+                array.fill(0)
+            return array
+        self.allocated += 1
+        return np.zeros(key[0], dtype=key[1])
+
+    def release(self, array):
+        """ Return an array to the pool. """
+        self._free[(array.shape, array.dtype)].append(array)
+
+
 class FrameConstants(object):
     """ Holder for frame constants.
 
@@ -36,6 +85,11 @@ class FrameConstants(object):
         :param str ttype:
             Either "simulator" if drawing to the simulator or
             "tesseract" if drawing to the real tesseract.
+        :param tuple frame_shape:
+            The shape of frames. Default: FRAME_SHAPE.
+        :param wiring.Wiring wiring:
+            A wiring map to convert virtual frames to physical frames
+            with instead of the ttype's. Default: None.
     """
 
     TESSERACT_TYPES = {
@@ -44,16 +98,86 @@ class FrameConstants(object):
         "minicube": minicube_virtual_to_physical,
     }
 
-    def __init__(self, fps=10, ttype="simulator"):
+    def __init__(self, fps=10, ttype="simulator", frame_shape=FRAME_SHAPE,
+                 wiring=None):
         assert ttype in self.TESSERACT_TYPES, (
             "ttype must be one of: ".join(sorted(self.TESSERACT_TYPES.keys())))
         self.fps = fps
         self.ttype = ttype
-        self.frame_shape = FRAME_SHAPE
+        self.frame_shape = tuple(frame_shape)
         self.frame_dtype = FRAME_DTYPE
-        self.layers = FRAME_SHAPE[0]
-        self.virtual_to_physical = self.TESSERACT_TYPES[ttype]
+        self.layers = self.frame_shape[0]
+        self.frame_pool = FramePool(self.frame_shape, self.frame_dtype)
+        self.wiring = wiring
+        if wiring is None:
+            self.layout = ttype
+            self.virtual_to_physical = self.TESSERACT_TYPES[ttype]
+        else:
+            assert wiring.frame_shape == self.frame_shape, (
+                "wiring is for {} frames".format(wiring.frame_shape))
+            self.layout = wiring
+            self.virtual_to_physical = FrameMapper(
+                None, wiring, self.frame_shape)
 
     def empty_frame(self):
         """ Return an numpy array for frame. """
         return np.zeros(self.frame_shape, dtype=self.frame_dtype)
+
+
+def layout_index(layout, frame_shape=FRAME_SHAPE):
+    """ Return the index (into the flattened virtual frame) of the voxel
+        shown by each physical voxel of a layout.
+
+        :param layout:
+            A tesseract type, a wiring.Wiring or None (for virtual frames).
+        :param tuple frame_shape:
+            The shape of frames. Default: FRAME_SHAPE.
+    """
+    virtual = np.arange(int(np.prod(frame_shape)), dtype=np.intp)
+    if layout is None:
+        return virtual
+    if layout in FrameConstants.TESSERACT_TYPES:
+        virtual = virtual.reshape(frame_shape)
+        return FrameConstants.TESSERACT_TYPES[layout](virtual).ravel()
+    return layout.index
+
+
+class FrameMapper(object):
+    """ Convert frames from one physical layout to another.
+
+        :param src:
+            The layout of the frames converted: a tesseract type, a
+            wiring.Wiring or None for virtual frames.
+        :param dst:
+            The layout to convert frames to: a tesseract type or a
+            wiring.Wiring.
+        :param tuple frame_shape:
+            The shape of frames. Default: FRAME_SHAPE.
+
+        The conversion is compiled to a single permutation of the
+        flattened frame, so converting a frame is one fancy indexing
+        operation (which is quicker than ``numpy.take`` into a reused
+        frame for frames this small). Conversions that do not move any
+        voxels return the frame unchanged.
+    """
+
+    def __init__(self, src, dst, frame_shape=FRAME_SHAPE):
+        self.src = src
+        self.dst = dst
+        self.frame_shape = tuple(frame_shape)
+        dst_index = layout_index(dst, self.frame_shape)
+        if src is None:
+            self.index = dst_index
+        else:
+            src_index = layout_index(src, self.frame_shape)
+            inverse = np.empty_like(src_index)
+            inverse[src_index] = np.arange(len(src_index), dtype=np.intp)
+            self.index = inverse[dst_index]
+        self.identity = bool(
+            (self.index == np.arange(len(self.index))).all())
+
+    def __call__(self, frame):
+        """ Return the frame converted to the destination layout. """
+        if self.identity:
+            return frame
+        return frame.reshape(-1)[self.index].reshape(self.frame_shape)
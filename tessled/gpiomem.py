@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+""" GPIO control by writing directly to the memory mapped GPIO registers
+    of the Raspberry Pi (via /dev/gpiomem).
+
+    Each write to the GPSET0 or GPCLR0 register sets or clears every pin
+    whose bit is set in the written word, so several pins can be changed
+    with a single memory store and without a call into wiringpi.
+
+    Any file at least ``REGISTER_BLOCK_SIZE`` bytes long can be mapped in
+    place of /dev/gpiomem, which allows the register writes to be tested
+    off the Pi.
+"""
+
+import mmap
+import os
+
+# register offsets (in bytes) from the start of the GPIO register block
+GPFSEL0 = 0x00
+GPSET0 = 0x1C
+GPCLR0 = 0x28
+GPLEV0 = 0x34
+
+REGISTER_BLOCK_SIZE = 4096
+
+# wiringpi pin number -> BCM GPIO number (for board revision 2 and later)
+WIRINGPI_TO_BCM = {
+    0: 17, 1: 18, 2: 27, 3: 22, 4: 23, 5: 24, 6: 25, 7: 4,
+    8: 2, 9: 3, 10: 8, 11: 7, 12: 10, 13: 9, 14: 11, 15: 14,
+    16: 15, 21: 5, 22: 6, 23: 13, 24: 19, 25: 26, 26: 12, 27: 16,
+    28: 20, 29: 21, 30: 0, 31: 1,
+}
+
+
+class GPIOMem(object):
+    """ A drop in replacement for wiringpi.GPIO (in WPI_MODE_PINS mode)
+        that writes to the memory mapped GPIO registers.
+
+        :param str path:
+            The file to map. Default: /dev/gpiomem.
+
+        Only pins 0-31 (i.e. those controlled by the first bank of
+        registers) are supported, which includes every pin on the Pi's
+        header.
+    """
+
+    INPUT = 0
+    OUTPUT = 1
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self, path="/dev/gpiomem"):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_SYNC)
+        try:
+            self._mmap = mmap.mmap(
+                fd, REGISTER_BLOCK_SIZE, mmap.MAP_SHARED,
+                mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+        self.words = memoryview(self._mmap).cast("I")
+        self._set = GPSET0 // 4
+        self._clr = GPCLR0 // 4
+        self._masks = {
+            pin: 1 << bcm for pin, bcm in WIRINGPI_TO_BCM.items()}
+
+    def close(self):
+        """ Unmap the GPIO registers. """
+        self.words.release()
+        self._mmap.close()
+
+    def mask(self, pins):
+        """ Return the register bit mask for a list of (wiringpi) pins. """
+        mask = 0
+        for pin in pins:
+            mask |= self._masks[pin]
+        return mask
+
+    def pinMode(self, pin, mode):
+        """ Set a (wiringpi) pin to be an input or an output. """
+        bcm = WIRINGPI_TO_BCM[pin]
+        index = GPFSEL0 // 4 + bcm // 10
+        shift = 3 * (bcm % 10)
+        fsel = self.words[index] & ~(0b111 << shift)
+        if mode == self.OUTPUT:
+            fsel |= 0b001 << shift
+        self.words[index] = fsel
+
+    def digitalWrite(self, pin, value):
+        """ Set a (wiringpi) pin high or low. """
+        if value:
+            self.words[self._set] = self._masks[pin]
+        else:
+            self.words[self._clr] = self._masks[pin]
+
+    def digitalRead(self, pin):
+        """ Return the level of a (wiringpi) pin. """
+        return int(bool(self.words[GPLEV0 // 4] & self._masks[pin]))
+
+    def write_masks(self, set_mask=0, clear_mask=0):
+        """ Set and clear every pin in the given masks (see ``.mask``)
+            with one store per register.
+        """
+        if set_mask:
+            self.words[self._set] = set_mask
+        if clear_mask:
+            self.words[self._clr] = clear_mask
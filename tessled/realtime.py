@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+""" Utilities for running a process with (soft) real-time settings.
+
+    Each setting is applied separately by its own function so that it
+    can be used (and tested) on any Linux machine. Settings that are not
+    available (e.g. because the process lacks the required permissions)
+    raise RealtimeUnavailable with a message describing why.
+"""
+
+import ctypes
+import ctypes.util
+import gc
+import os
+
+import click
+
+# from sys/mman.h
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+GC_MODES = ("enabled", "freeze", "disable")
+
+
+class RealtimeUnavailable(Exception):
+    """ Raised when a real-time setting cannot be applied. """
+
+
+def default_cpu():
+    """ Return the CPU to pin to by default (the last available one). """
+    return max(os.sched_getaffinity(0))
+
+
+def pin_to_cpu(cpu):
+    """ Pin the calling thread (and threads it starts later) to a CPU.
+
+        :param int cpu:
+            The number of the CPU to run on.
+    """
+    if not hasattr(os, "sched_setaffinity"):
+        raise RealtimeUnavailable("CPU affinity is not supported.")
+    try:
+        os.sched_setaffinity(0, {cpu})
+    except (OSError, ValueError) as err:
+        raise RealtimeUnavailable(
+            "Could not pin to CPU {}: {}".format(cpu, err))
+
+
+def set_sched_fifo(priority):
+    """ Run the calling thread with the SCHED_FIFO scheduling policy.
+
+        :param int priority:
+            The real-time priority (1-99).
+    """
+    if not hasattr(os, "SCHED_FIFO"):
+        raise RealtimeUnavailable("SCHED_FIFO is not supported.")
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+    except (OSError, ValueError) as err:
+        raise RealtimeUnavailable(
+            "Could not set SCHED_FIFO priority {}: {}".format(priority, err))
+
+
+def lock_memory():
+    """ Lock all current and future pages of the process into RAM. """
+    libc_name = ctypes.util.find_library("c")
+    if libc_name is None:
+        raise RealtimeUnavailable("Could not find libc for mlockall.")
+    libc = ctypes.CDLL(libc_name, use_errno=True)
+    if libc.mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+        errno = ctypes.get_errno()
+        raise RealtimeUnavailable(
+            "Could not lock memory: {}".format(os.strerror(errno)))
+
+
+def set_gc_mode(mode):
+    """ Control the cyclic garbage collector.
+
+        :param str mode:
+            One of "enabled" (leave the collector running), "freeze"
+            (collect once and move all current objects to the permanent
+            generation so that later collections are quick) or "disable"
+            (turn off the cyclic collector entirely).
+    """
+    if mode == "enabled":
+        gc.enable()
+    elif mode == "freeze":
+        if not hasattr(gc, "freeze"):
+            raise RealtimeUnavailable("gc.freeze requires Python 3.7+.")
+        gc.collect()
+        gc.freeze()
+    elif mode == "disable":
+        gc.collect()
+        gc.disable()
+    else:
+        raise ValueError("Unknown GC mode: {!r}".format(mode))
+
+
+def apply_realtime(cpu=None, fifo_priority=None, mlock=False,
+                   gc_mode="enabled", report=click.echo):
+    """ Apply a set of real-time settings, reporting on each.
+
+        :param int cpu:
+            The CPU to pin to or None to leave the affinity unchanged.
+        :param int fifo_priority:
+            The SCHED_FIFO priority or None to leave the scheduling policy
+            unchanged.
+        :param bool mlock:
+            Whether to lock the process memory.
+        :param str gc_mode:
+            The garbage collector mode (see ``set_gc_mode``).
+        :param function report:
+            Function to call with a description of each setting.
+
+        :return dict:
+            Whether each requested setting was applied.
+    """
+    steps = []
+    if cpu is not None:
+        steps.append(
+            ("cpu", "pinned to CPU {}".format(cpu), pin_to_cpu, (cpu,)))
+    if fifo_priority is not None:
+        steps.append((
+            "sched_fifo", "SCHED_FIFO priority {}".format(fifo_priority),
+            set_sched_fifo, (fifo_priority,)))
+    if mlock:
+        steps.append(("mlock", "memory locked", lock_memory, ()))
+    if gc_mode != "enabled":
+        steps.append((
+            "gc", "garbage collector mode {}".format(gc_mode), set_gc_mode,
+            (gc_mode,)))
+    applied = {}
+    for name, description, f, args in steps:
+        try:
+            f(*args)
+        except RealtimeUnavailable as err:
+            report("Realtime: {} (skipped).".format(err))
+            applied[name] = False
+        else:
+            report("Realtime: {}.".format(description))
+            applied[name] = True
+    return applied
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+
+""" Recording frame streams and replaying them.
+
+    ``tesseract-record`` subscribes to a frame address and appends each
+    frame to a recording file. ``tesseract-play`` publishes a recording
+    to a frame address, e.g. to replay a show without running the
+    animations or to feed the driver and simulator a fixed sequence of
+    frames.
+
+    A recording file starts with a header::
+
+        magic (4 bytes), version (uint32), number of dimensions (uint32),
+        dtype (2 bytes, e.g. "u1"), padding (2 bytes),
+        shape (4 x uint32), metadata size (uint32), padding (12 bytes)
+
+    followed by optional JSON metadata (padded to a multiple of 8 bytes)
+    and then fixed size records, each a timestamp (float64, seconds
+    since the epoch, the frame's display time if it had one) and a frame
+    (padded to a multiple of 8 bytes). The number of frames is taken from
+    the size of the file, so a recording interrupted part way through a
+    record is still readable.
+
+    Recordings are memory mapped as a numpy structured array, so any frame
+    can be read in O(1) without reading the rest of the file.
+"""
+
+import json
+import os
+import struct
+import time
+
+import click
+import numpy as np
+import zmq
+
+from . import envelope
+from . import frame_utils
+from . import transport
+
+RECORDING_MAGIC = b"TSCR"
+RECORDING_VERSION = 1
+RECORDING_HEADER = struct.Struct("=4sII2s2x4II12x")
+MAX_DIMENSIONS = 4
+
+
+class RecordingError(ValueError):
+    """ Raised when a recording file is invalid. """
+
+
+def record_dtype(frame_shape, dtype=np.uint8):
+    """ Return the numpy dtype of one record. """
+    dtype = np.dtype(dtype)
+    frame_bytes = int(np.prod(frame_shape)) * dtype.itemsize
+    return np.dtype({
+        "names": ["time", "frame"],
+        "formats": ["<f8", (dtype, tuple(frame_shape))],
+        "offsets": [0, 8],
+        "itemsize": 8 + 8 * ((frame_bytes + 7) // 8),
+    })
+
+
+class RecordingWriter(object):
+    """ Write frames to a recording file.
+
+        :param str path:
+            The file to write (replacing any existing file).
+        :param tuple frame_shape:
+            The shape of the frames.
+        :param dtype:
+            The numpy dtype of the frames. Default: numpy.uint8.
+        :param dict metadata:
+            Metadata to store with the recording. Default: None.
+    """
+
+    def __init__(self, path, frame_shape, dtype=np.uint8, metadata=None):
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        if len(self.frame_shape) > MAX_DIMENSIONS:
+            raise RecordingError(
+                "Frames may have at most {} dimensions.".format(
+                    MAX_DIMENSIONS))
+        self._record = np.zeros(1, dtype=record_dtype(frame_shape, dtype))
+        self.frames = 0
+        self._file = open(path, "wb")
+        padded = self.frame_shape + (0,) * (
+            MAX_DIMENSIONS - len(self.frame_shape))
+        encoded = b""
+        if metadata is not None:
+            encoded = json.dumps(metadata, sort_keys=True).encode("utf-8")
+        self._file.write(RECORDING_HEADER.pack(
+            RECORDING_MAGIC, RECORDING_VERSION, len(self.frame_shape),
+            self.dtype.str[1:].encode("ascii"), *(padded + (len(encoded),))))
+        self._file.write(encoded.ljust(8 * ((len(encoded) + 7) // 8), b"\0"))
+
+    def write(self, frame, timestamp):
+        """ Append a frame to the recording. """
+        self._record["time"] = timestamp
+        self._record["frame"][0] = frame
+        self._file.write(self._record.tobytes())
+        self.frames += 1
+
+    def close(self):
+        self._file.close()
+
+
+class Recording(object):
+    """ A memory mapped recording.
+
+        :param str path:
+            The recording file to read.
+
+        ``.frames`` and ``.times`` are numpy arrays of the frames and
+        their timestamps, backed by the file. ``.metadata`` is the
+        recording's metadata (or None).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(RECORDING_HEADER.size)
+            if len(header) != RECORDING_HEADER.size:
+                raise RecordingError("{}: not a recording".format(path))
+            fields = RECORDING_HEADER.unpack(header)
+            magic, version, ndim, dtype = fields[:4]
+            if magic != RECORDING_MAGIC or version != RECORDING_VERSION or (
+                    ndim > MAX_DIMENSIONS):
+                raise RecordingError("{}: not a recording".format(path))
+            metadata_size = fields[-1]
+            self.metadata = None
+            if metadata_size:
+                try:
+                    self.metadata = json.loads(
+                        f.read(metadata_size).decode("utf-8"))
+                except ValueError as err:
+                    raise RecordingError(
+                        "{}: invalid metadata: {}".format(path, err))
+        offset = RECORDING_HEADER.size + 8 * ((metadata_size + 7) // 8)
+        self.frame_shape = tuple(fields[4:4 + ndim])
+        self.dtype = np.dtype(dtype.decode("ascii"))
+        self.record_dtype = record_dtype(self.frame_shape, self.dtype)
+        n_frames = max(
+            os.path.getsize(path) - offset, 0) // self.record_dtype.itemsize
+        if n_frames:
+            self.records = np.memmap(
+                path, dtype=self.record_dtype, mode="r", offset=offset,
+                shape=(n_frames,))
+        else:
+            self.records = np.zeros(0, dtype=self.record_dtype)
+        self.frames = self.records["frame"]
+        self.times = self.records["time"]
+
+    def __len__(self):
+        return len(self.records)
+
+    def duration(self):
+        """ Return the seconds between the first and last frames. """
+        if len(self) < 2:
+            return 0.0
+        return float(self.times[-1] - self.times[0])
+
+    def index_at(self, seconds):
+        """ Return the index of the frame shown a number of seconds after
+            the start of the recording (using the recorded timestamps).
+        """
+        if not len(self):
+            return 0
+        target = self.times[0] + seconds
+        return max(int(np.searchsorted(self.times, target, "right")) - 1, 0)
+
+
+def _frames(rec, fps, start, loop):
+    """ Yield (index, seconds from the start of playback) for each frame
+        to play.
+
+        A start past the end of the recording wraps around when looping
+        and starts from the last frame otherwise. A start before the
+        beginning starts from the first frame.
+    """
+    start = max(start, 0)
+    if fps:
+        index = int(round(start * fps))
+        if loop:
+            index %= len(rec)
+        else:
+            index = min(index, len(rec) - 1)
+        offset = 0.0
+        while True:
+            for i in range(index, len(rec)):
+                yield i, offset + (i - index) / float(fps)
+            if not loop:
+                return
+            offset += (len(rec) - index) / float(fps)
+            index = 0
+    else:
+        if loop:
+            # the length of one loop, including the gap at its end
+            start %= rec.duration() + (
+                rec.duration() / max(len(rec) - 1, 1)) or 1.0
+        index = rec.index_at(start)
+        offset = 0.0
+        while True:
+            first = rec.times[index]
+            for i in range(index, len(rec)):
+                yield i, offset + float(rec.times[i] - first)
+            if not loop:
+                return
+            # leave the mean frame interval between the end and the start
+            offset += float(rec.times[-1] - first) + (
+                rec.duration() / max(len(rec) - 1, 1))
+            index = 0
+
+
+@click.command(context_settings={"auto_envvar_prefix": "TSC"})
+@click.argument('path', type=click.Path(dir_okay=False))
+@click.option(
+    '--frame-addr', default='tcp://127.0.0.1:5556',
+    help='ZeroMQ address or shm://<name> to receive frames from.')
+@click.option(
+    '--seconds', default=None, type=float,
+    help='Stop recording after this many seconds.')
+@click.option(
+    '--max-frames', default=None, type=int,
+    help='Stop recording after this many frames.')
+def record(path, frame_addr, seconds, max_frames):
+    """ Record the frames published on a frame address to PATH. """
+    context = zmq.Context()
+    frame_source = transport.open_subscriber(frame_addr, context)
+    playout = envelope.PlayoutBuffer(
+        frame_utils.FRAME_SHAPE, scheduled=False)
+    writer = None
+    click.echo("Recording frames from {} to {}.".format(frame_addr, path))
+    deadline = None if seconds is None else time.time() + seconds
+    try:
+        while deadline is None or time.time() < deadline:
+            if max_frames is not None and writer and (
+                    writer.frames >= max_frames):
+                break
+            if not frame_source.poll(100):
+                continue
+            data = frame_source.recv_nowait()
+            if data is None:
+                continue
+            now = time.time()
+            header = envelope.read_header(data)
+            if writer is None:
+                frame_shape = frame_utils.FRAME_SHAPE
+                if header is not None:
+                    frame_shape = header.shape
+                    playout = envelope.PlayoutBuffer(
+                        frame_shape, scheduled=False)
+                writer = RecordingWriter(path, frame_shape)
+            header, frame = playout.receive(data, now)
+            if frame is not None:
+                writer.write(
+                    frame, now if header is None else header.display_at)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if writer is not None:
+            writer.close()
+        frame_source.close()
+    click.echo("Recorded {} frames ({} lost).".format(
+        writer.frames if writer else 0, playout.frames_lost))
+
+
+@click.command(context_settings={"auto_envvar_prefix": "TSC"})
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    '--frame-addr', default='tcp://127.0.0.1:5556',
+    help='ZeroMQ address or shm://<name> to publish frames to.')
+@click.option(
+    '--fps', default=None, type=click.FloatRange(0, None, min_open=True),
+    help='Frames per second (default: the recorded timing).')
+@click.option(
+    '--loop/--no-loop', default=False,
+    help='Replay the recording forever.')
+@click.option(
+    '--start', default=0.0, type=click.FloatRange(0, None),
+    help='Seconds into the recording to start from.')
+@click.option(
+    '--display-delay', default=0.1, type=float,
+    help='Seconds between publishing a frame and when it should be'
+         ' displayed.')
+def play(path, frame_addr, fps, loop, start, display_delay):
+    """ Publish the frames recorded in PATH. """
+    try:
+        rec = Recording(path)
+    except RecordingError as err:
+        raise click.ClickException(str(err))
+    if not len(rec):
+        raise click.ClickException("{}: no frames recorded".format(path))
+    click.echo("Playing {} frames ({:.1f} s) from {}.".format(
+        len(rec), rec.duration(), path))
+    context = zmq.Context()
+    publisher = transport.open_publisher(
+        frame_addr, rec.frame_shape, rec.dtype, context=context)
+    began = time.time()
+    try:
+        for index, at in _frames(rec, fps, start, loop):
+            sleep_time = began + at - time.time()
+            if sleep_time > 0:
+                time.sleep(sleep_time)
+            publisher.publish(
+                rec.frames[index], display_at=began + at + display_delay)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        publisher.close()
+    click.echo("Tesseract player exited.")
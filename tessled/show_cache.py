@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+""" Pre-rendered shows.
+
+    ``tesseract-effectbox --prerender show.cache --duration 600`` renders
+    the effectbox's playlist of animations (with its transitions) ahead of
+    time, as fast as possible, into a cache file. ``tesseract-effectbox
+    --from-cache show.cache`` then publishes the cached frames instead of
+    running the animations, which takes very little CPU on the Pi.
+
+    Caches are recordings (see tessled.recording) whose metadata holds a
+    cache key: a hash of the animations played (and the source code of
+    their modules and of the engine, sprites and the rest of
+    tessled.effects), the transition and crossfade times and mask, the frame
+    rate, the cube's type (or wiring map) and frame shape and the random
+    seed. ``--from-cache`` refuses to play a cache whose key does not match
+    its own options, e.g. because an animation was changed after the cache
+    was rendered.
+"""
+
+import hashlib
+import importlib
+import inspect
+import json
+import pkgutil
+import random
+
+import numpy as np
+
+from . import effects
+from . import recording
+
+CACHE_FORMAT = 1
+
+# only the animations in the playlist are hashed
+_ANIMATIONS_PACKAGE = "tessled.effects.animations"
+
+
+class StaleCacheError(ValueError):
+    """ Raised when a cache was rendered with different options. """
+
+
+def _source_hash(animation_classes):
+    """ Return a hash of the source of the modules the animations are
+        defined in and of every other module in tessled.effects (the
+        engine, blending, transitions, sprites, etc.).
+    """
+    modules = set(cls.__module__ for cls in animation_classes)
+    modules.add("tessled.frame_utils")
+    for module_info in pkgutil.walk_packages(
+            effects.__path__, effects.__name__ + "."):
+        if not module_info.name.startswith(_ANIMATIONS_PACKAGE):
+            modules.add(module_info.name)
+    digest = hashlib.sha256()
+    for name in sorted(modules):
+        module = importlib.import_module(name)
+        digest.update(name.encode("utf-8"))
+        digest.update(inspect.getsource(module).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def cache_params(animation_classes, transition, fc, seed, crossfade=0.0,
+                 transition_mask="fade"):
+    """ Return the options a cache depends on.
+
+        :param list animation_classes:
+            The animations in the playlist, in order.
+        :param float transition:
+            The time between animation transitions.
+        :param FrameConstants fc:
+            The frame constants.
+        :param int seed:
+            The random seed, or None.
+        :param float crossfade:
+            The crossfade time. Default: 0.
+        :param str transition_mask:
+            The crossfade mask. Default: "fade".
+    """
+    return {
+        "format": CACHE_FORMAT,
+        "animations": [cls.ANIMATION for cls in animation_classes],
+        "source": _source_hash(animation_classes),
+        "transition": transition,
+        "crossfade": crossfade,
+        "transition_mask": transition_mask,
+        "fps": fc.fps,
+        "ttype": fc.ttype,
+        "wiring": None if fc.wiring is None else fc.wiring.digest(),
+        "frame_shape": list(fc.frame_shape),
+        "seed": seed,
+    }
+
+
+def cache_key(params):
+    """ Return the cache key for a set of options. """
+    return hashlib.sha256(
+        json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def seed_random(seed):
+    """ Seed the random number generators used by the animations. """
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+
+
+def prerender(engine, fc, path, seconds, params):
+    """ Render frames from an EffectEngine into a cache file.
+
+        :param EffectEngine engine:
+            The engine to render frames with.
+        :param FrameConstants fc:
+            The frame constants.
+        :param str path:
+            The cache file to write.
+        :param float seconds:
+            How many seconds of frames to render.
+        :param dict params:
+            The cache parameters (see ``cache_params``).
+
+        :return int:
+            The number of frames rendered.
+    """
+    n_frames = int(round(seconds * fc.fps))
+    writer = recording.RecordingWriter(
+        path, fc.frame_shape, fc.frame_dtype,
+        metadata={"cache_key": cache_key(params), "params": params})
+    try:
+        for i in range(n_frames):
+            frame = fc.virtual_to_physical(engine.next_frame())
+            writer.write(frame, float(i) / fc.fps)
+    finally:
+        writer.close()
+    return n_frames
+
+
+def open_cache(path, params):
+    """ Open a cache file, checking that it matches the options given.
+
+        :param str path:
+            The cache file to read.
+        :param dict params:
+            The cache parameters (see ``cache_params``).
+
+        :return recording.Recording:
+            The cached frames.
+    """
+    cache = recording.Recording(path)
+    metadata = cache.metadata or {}
+    if metadata.get("cache_key") != cache_key(params):
+        cached = metadata.get("params") or {}
+        changed = sorted(
+            name for name in set(params) | set(cached)
+            if params.get(name) != cached.get(name))
+        raise StaleCacheError(
+            "{}: cache is stale (changed: {})".format(
+                path, ", ".join(changed) or "cache key"))
+    if not len(cache):
+        raise StaleCacheError("{}: cache is empty".format(path))
+    return cache
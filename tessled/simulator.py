@@ -6,6 +6,7 @@
 """
 
 import itertools
+import time
 
 import faulthandler
 
@@ -16,7 +17,9 @@ import OpenGL.GLU as glu
 import pygame
 import zmq
 
+from . import envelope
 from . import frame_utils
+from . import transport
 
 
 class ExitSimulator(Exception):
@@ -289,34 +292,40 @@ def gl_init(screen_size, display_mode):
     help='Turn on or off printing actual frames per second.')
 @click.option(
     '--frame-addr', default='tcp://127.0.0.1:5556',
-    help='ZeroMQ address to receive frames from.')
-def main(fps, print_fps, frame_addr):
+    help='ZeroMQ address to receive frames from, or shm://<name> to read'
+         ' them from a shared memory ring.')
+@click.option(
+    '--playout/--no-playout', default=True,
+    help='Hold frames until the display time set by the effectbox (the'
+         ' default), or display them as soon as they arrive.')
+def main(fps, print_fps, frame_addr, playout):
     click.echo("Tesseract simulator running.")
     s = SimTesseract(fps, print_fps)
     s.setup()
 
     context = zmq.Context()
-    frame_socket = context.socket(zmq.SUB)
-    frame_socket.connect(frame_addr)
-    frame_socket.setsockopt_string(zmq.SUBSCRIBE, u"")  # receive everything
+    frame_source = transport.open_subscriber(frame_addr, context)
 
     fc = frame_utils.FrameConstants(fps=fps, ttype="simulator")
+    playout_buffer = envelope.PlayoutBuffer(fc.frame_shape, scheduled=playout)
     frame = fc.empty_frame()
     try:
         while True:
-            try:
-                data = frame_socket.recv(flags=zmq.NOBLOCK)
-            except zmq.ZMQError as err:
-                if not err.errno == zmq.EAGAIN:
-                    raise
-            else:
+            now = time.time()
+            data = frame_source.recv_nowait()
+            while data is not None:
+                playout_buffer.push(data, now)
+                data = frame_source.recv_nowait()
+            due = playout_buffer.pop(now)
+            if due is not None:
                 if not s.paused():
-                    frame = np.frombuffer(data, dtype=frame_utils.FRAME_DTYPE)
-                    frame.shape = frame_utils.FRAME_SHAPE
+                    frame = due
                 s.render(frame)
             s.tick()
     except ExitSimulator:
         pass
     finally:
         s.teardown()
+    click.echo("Frames: {} lost, {} late.".format(
+        playout_buffer.frames_lost, playout_buffer.frames_late))
     click.echo("Tesseract simulator exited.")
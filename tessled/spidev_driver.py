@@ -9,22 +9,46 @@
 
     * The first 8 lines from the 5th chip control which layer is powered.
 
-    The driver receives frames from ZeroMQ and continual cycles through
-    the layers until a new frame is received via ZeroMQ.
+    The driver receives frames from ZeroMQ in a background thread and
+    continually cycles through the layers of the most recently packed
+    frame.
 
     The frame layout is described in tessled.effectbox.
 """
 
+import fcntl
+import math
 import os
+import signal
+import struct
+import threading
+import time
 
 import click
 import numpy as np
 import zmq
 
-import wiringpi
-import spidev
+try:
+    import wiringpi
+except ImportError:
+    wiringpi = None
 
+try:
+    import spidev
+except ImportError:
+    spidev = None
+
+from . import calibration
+from . import envelope
 from . import frame_utils
+from . import gpiomem
+from . import realtime
+from . import tlc_sim
+from . import topology
+from . import transport
+from . import tuning
+from .driver_stats import DriverStats
+from .timing import DwellTimer
 
 
 def pack_to_12bit(values):
@@ -39,7 +63,7 @@ def pack_to_12bit(values):
     """
     values = values % 4096  # clamp to 0 to 4095 (i.e. 12 bit)
     v_0, v_1 = values[0::2], values[1::2]
-    b = np.zeros(3 * len(values) / 2, dtype=np.uint8)
+    b = np.zeros(3 * len(values) // 2, dtype=np.uint8)
     b[0::3] = (v_0 >> 4)
     b[1::3] = ((v_0 % 16) << 4) + (v_1 >> 8)
     b[2::3] = (v_1 % 256)
@@ -59,17 +83,58 @@ def pack_to_6bit(values):
     """
     values = values % 64  # clamp to 0 to 63 (i.e. 6 bit)
     v_0, v_1, v_2, v_3 = values[0::4], values[1::4], values[2::4], values[3::4]
-    b = np.zeros(3 * len(values) / 4, dtype=np.uint8)
+    b = np.zeros(3 * len(values) // 4, dtype=np.uint8)
     b[0::3] = (v_0 << 2) + (v_1 >> 4)
     b[1::3] = ((v_1 % 16) << 4) + (v_2 >> 2)
     b[2::3] = ((v_2 % 4) << 6) + (v_3)
     return b
 
 
+class HardwareBackend(object):
+    """ Driver backend that controls real TLCs using spidev (for clocking
+        data into the TLC chips using SPI) and either wiringpi or the
+        memory mapped GPIO registers (for general GPIO).
+
+        :param str gpio:
+            Either "wiringpi" or "gpiomem". Default: "wiringpi".
+        :param str gpiomem_path:
+            The file to map the GPIO registers from with "gpiomem".
+            Default: /dev/gpiomem.
+    """
+
+    name = "spidev"
+
+    def __init__(self, gpio="wiringpi", gpiomem_path="/dev/gpiomem"):
+        self.gpio = gpio
+        self.gpiomem_path = gpiomem_path
+
+    def connect(self, tlcs):
+        """ Return the SPI device and GPIO objects for a TLCs object. """
+        if spidev is None:
+            raise click.ClickException(
+                "The spidev module is required to drive the TLCs"
+                " (install tessled[spidev] or use --backend=sim).")
+        if self.gpio == "gpiomem":
+            gpio = gpiomem.GPIOMem(self.gpiomem_path)
+        elif wiringpi is None:
+            raise click.ClickException(
+                "The wiringpi module is required for GPIO (install"
+                " tessled[spidev] or use --gpio=gpiomem).")
+        else:
+            gpio = wiringpi.GPIO(wiringpi.GPIO.WPI_MODE_PINS)
+        return spidev.SpiDev(), gpio
+
+    def write(self, fd, data):
+        return os.write(fd, data)
+
+    def ioctl(self, fd, request, arg):
+        return fcntl.ioctl(fd, request, arg)
+
+
 class TLCs(object):
     """ Object representing a chain of TLCs and controlling them using
-        wiringpi (for general GPIO) and spidev (for clocking data into
-        the TLC chips using SPI).
+        a backend that provides the SPI device (for clocking data into the
+        TLC chips) and general GPIO.
 
         :param int tlcs:
             The number of TLC chips connected in series.
@@ -90,22 +155,30 @@ class TLCs(object):
         :param bool inverted:
             Whether the signal logic should be inverted (for both the SPI
             signals and the GPIO controlled pins). Default: True.
+        :param backend:
+            The backend to write to, e.g. a ``tlc_sim.SimBackend``.
+            Default: a ``HardwareBackend`` using spidev and wiringpi.
 
         Inspired heavily by
         https://github.com/eflukx/enlightenPi/blob/master/TLC5940.py.
     """
     def __init__(
             self, tlcs, blank, vprg, xlat, dcprg,
-            spibus=0, spidevice=0, spispeed=500000, inverted=True):
+            spibus=0, spidevice=0, spispeed=500000, inverted=True,
+            backend=None):
         self.n_tlcs = tlcs
         self.n_outputs = self.n_tlcs * 16  # 16 outputs per TLC
         self.blank = blank
         self.vprg = vprg
         self.xlat = xlat
         self.dcprg = dcprg
+        self.inverted = inverted
+        self.backend = HardwareBackend() if backend is None else backend
+        self.spi, self.gpio = self.backend.connect(self)
+        self.write = self.backend.write
+        self.ioctl = self.backend.ioctl
 
         # setup SPI
-        self.spi = spidev.SpiDev()
         self.spi.open(spibus, spidevice)
         self.spi_fd = self.spi.fileno()
         self.spi.max_speed_hz = spispeed
@@ -113,7 +186,6 @@ class TLCs(object):
             self.spi.mode = 0b10  # invert clock signal
 
         # setup GPIO pins
-        self.gpio = wiringpi.GPIO(wiringpi.GPIO.WPI_MODE_PINS)
         self.gpio.pinMode(self.blank, self.gpio.OUTPUT)
         self.gpio.pinMode(self.vprg, self.gpio.OUTPUT)
         self.gpio.pinMode(self.xlat, self.gpio.OUTPUT)
@@ -126,6 +198,17 @@ class TLCs(object):
             self.HIGH = self.gpio.HIGH
             self.LOW = self.gpio.LOW
 
+        # with memory mapped GPIO (see tessled.gpiomem) raise BLANK and
+        # XLAT together and then lower XLAT, with one register store each
+        self.latch_masks = None
+        if hasattr(self.gpio, "write_masks"):
+            both = self.gpio.mask([self.blank, self.xlat])
+            xlat = self.gpio.mask([self.xlat])
+            if self.HIGH == self.gpio.HIGH:
+                self.latch_masks = ((both, 0), (0, xlat))
+            else:
+                self.latch_masks = ((0, both), (xlat, 0))
+
     def init_tlcs(self):
         """ Initialize the TLCs."""
         self.gpio.digitalWrite(self.dcprg, self.LOW)
@@ -143,13 +226,33 @@ class TLCs(object):
 
             Values are written to the TLCs in reverse order (since each value
             is clocked through to the next input).
+
+            DCPRG is set high so that the TLCs use the DC register (rather
+            than their EEPROM), the values are clocked in with VPRG high
+            and latched with XLAT, and VPRG is returned low ready for
+            grayscale data.
         """
-        dc_buffer = pack_to_6bit(dc_values[::-1])
-        dc_buffer = np.bitwise_not(dc_buffer)
+        dc_buffer = self.pack_dc(dc_values)
         self.gpio.digitalWrite(self.dcprg, self.HIGH)
         self.gpio.digitalWrite(self.vprg, self.HIGH)
-        self.gpio.digitalWrite(self.vprg, self.HIGH)
-        os.write(self.spi_fd, dc_buffer)
+        self.write(self.spi_fd, dc_buffer)
+        self.gpio.digitalWrite(self.xlat, self.HIGH)
+        self.gpio.digitalWrite(self.xlat, self.LOW)
+        self.gpio.digitalWrite(self.vprg, self.LOW)
+
+    def pack_dc(self, dc_values):
+        """ Pack dot clock (DC) values into a buffer.
+
+            :param numpy.array dc_values:
+                A numpy array with the dot clock values for each TLC output.
+                Each value must be in the range 0-63 (inclusive).
+
+            :return numpy.array:
+                Packed and reversed array of 6-bit TLC values.
+        """
+        dc_buffer = pack_to_6bit(dc_values[::-1])
+        dc_buffer = np.bitwise_not(dc_buffer)
+        return dc_buffer
 
     def pack_pwm(self, pwm_values):
         """ Pack PWM values into a buffer.
@@ -178,21 +281,491 @@ class TLCs(object):
         pwm_buffer = self.pack_pwm(pwm_values)
         self.write_pwm_packed(pwm_buffer)
 
-    def write_pwm_packed(self, pwm_buffer):
+    def write_pwm_packed(self, pwm_buffer, dwell=None):
         """ Write the PWM output levels from a pre-packed buffer.
 
             :param numpy.array pwm_buffer:
                 A numpy array with the PWM values for each TLC output.
                 Each value must be pre-packed in 12-bits per value and
                 the buffer should be pre-reversed.
+            :param DwellTimer dwell:
+                If given, keep the previously latched layer lit until the
+                timer's dwell time is up. Default: None.
+
+            The grayscale clock is driven by the SPI clock, so the
+            previously latched layer is lit from when BLANK goes low
+            until BLANK goes high again.
         """
         self.gpio.digitalWrite(self.blank, self.LOW)
-        os.write(self.spi_fd, pwm_buffer)
+        if dwell is not None:
+            dwell.begin()
+        self.write(self.spi_fd, pwm_buffer)
+        if dwell is not None:
+            dwell.end()
+        self.latch()
+
+    def latch(self):
+        """ Raise BLANK and pulse XLAT to latch the data written. """
+        if self.latch_masks is not None:
+            raise_both, lower_xlat = self.latch_masks
+            self.gpio.write_masks(*raise_both)
+            self.gpio.write_masks(*lower_xlat)
+            return
         self.gpio.digitalWrite(self.blank, self.HIGH)
         self.gpio.digitalWrite(self.xlat, self.HIGH)
         self.gpio.digitalWrite(self.xlat, self.LOW)
 
 
+class ParallelChains(object):
+    """ Several chains of TLCs on different SPI devices that share the
+        BLANK, XLAT, VPRG and DCPRG lines.
+
+        :param list tlcs:
+            The TLCs for each chain. The GPIO lines are controlled using
+            the first.
+
+        Each layer is written to every chain concurrently (one thread per
+        additional chain, with the first chain written by the calling
+        thread) and then latched on all chains at once, so adding chains
+        does not lower the refresh rate.
+    """
+
+    def __init__(self, tlcs):
+        self.tlcs = list(tlcs)
+        self.primary = self.tlcs[0]
+        self.n_outputs = sum(t.n_outputs for t in self.tlcs)
+        self.error = None
+        self._buffers = None
+        self._stopped = False
+        self._start = threading.Barrier(len(self.tlcs))
+        self._done = threading.Barrier(len(self.tlcs))
+        if hasattr(self.primary.gpio, "share"):
+            # simulated chains (see tessled.tlc_sim) share GPIO lines too
+            for tlcs in self.tlcs[1:]:
+                self.primary.gpio.share(tlcs.gpio)
+        self._threads = [
+            threading.Thread(
+                target=self._run, args=(index,),
+                name="tlc-chain-{}".format(index))
+            for index in range(1, len(self.tlcs))]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def _run(self, index):
+        tlcs = self.tlcs[index]
+        try:
+            while True:
+                self._start.wait()
+                if self._stopped:
+                    return
+                tlcs.write(tlcs.spi_fd, self._buffers[index])
+                self._done.wait()
+        except threading.BrokenBarrierError:
+            return
+        except Exception as err:
+            self.error = err
+            self._done.abort()
+
+    def stop(self):
+        """ Stop the chain threads. """
+        self._stopped = True
+        self._start.abort()
+        for thread in self._threads:
+            thread.join()
+
+    def _write_all(self, buffers):
+        """ Write one buffer to each chain concurrently. """
+        self._buffers = buffers
+        try:
+            self._start.wait()
+            self.primary.write(self.primary.spi_fd, buffers[0])
+            self._done.wait()
+        except threading.BrokenBarrierError:
+            raise RuntimeError("TLC chain write failed: {}".format(
+                self.error))
+
+    def init_tlcs(self):
+        """ Initialize the TLCs. """
+        self.primary.init_tlcs()
+
+    def write_dc(self, dc_values):
+        """ Write the dot clock (DC) levels for every chain's outputs (in
+            chain order) and latch them together.
+        """
+        primary = self.primary
+        buffers, start = [], 0
+        for tlcs in self.tlcs:
+            buffers.append(tlcs.pack_dc(
+                dc_values[start:start + tlcs.n_outputs]))
+            start += tlcs.n_outputs
+        primary.gpio.digitalWrite(primary.dcprg, primary.HIGH)
+        primary.gpio.digitalWrite(primary.vprg, primary.HIGH)
+        self._write_all(buffers)
+        primary.gpio.digitalWrite(primary.xlat, primary.HIGH)
+        primary.gpio.digitalWrite(primary.xlat, primary.LOW)
+        primary.gpio.digitalWrite(primary.vprg, primary.LOW)
+
+    def write_layer(self, buffers, dwell=None):
+        """ Write the packed PWM buffers for one layer, one per chain.
+
+            :param list buffers:
+                The packed buffer for each chain.
+            :param DwellTimer dwell:
+                If given, keep the previously latched layer lit until the
+                timer's dwell time is up. Default: None.
+        """
+        primary = self.primary
+        primary.gpio.digitalWrite(primary.blank, primary.LOW)
+        if dwell is not None:
+            dwell.begin()
+        self._write_all(buffers)
+        if dwell is not None:
+            dwell.end()
+        primary.latch()
+
+
+def bcm_plane_order(bits):
+    """ Return the order in which to display binary code modulation
+        bit-planes.
+
+        :param int bits:
+            The number of bit-planes.
+
+        :return list:
+            A list of ``2 ** bits - 1`` bit-plane indexes.
+
+        Bit-plane ``k`` has a weight of ``2 ** k`` and so appears
+        ``2 ** k`` times in the list. Rather than displaying the repeats
+        of a plane back-to-back, they are spread out evenly (the most
+        significant plane appears in every second slot, the next in every
+        fourth slot, and so on) so that LEDs are never dark for long enough
+        to flicker.
+    """
+    order = []
+    for i in range(1, 2 ** bits):
+        trailing_zeros = (i & -i).bit_length() - 1
+        order.append(bits - 1 - trailing_zeros)
+    return order
+
+
+# struct spi_ioc_transfer from linux/spi/spidev.h
+SPI_IOC_TRANSFER = struct.Struct("=QQIIHBBBBBB")
+SPI_IOC_MAGIC = ord("k")
+
+
+def spi_ioc_message(n):
+    """ Return the SPI_IOC_MESSAGE(n) ioctl request number for sending
+        n spi_ioc_transfer structs in one ioctl call.
+    """
+    size = n * SPI_IOC_TRANSFER.size
+    if size >= (1 << 14):
+        raise ValueError("Too many SPI transfers for one ioctl: {}".format(n))
+    ioc_write = 1
+    return (ioc_write << 30) | (size << 16) | (SPI_IOC_MAGIC << 8) | 0
+
+
+class SpiSweep(object):
+    """ Write a sweep of packed PWM buffers to the TLCs using batched
+        spidev ioctl transfers.
+
+        :param TLCs tlcs:
+            The TLCs to write to.
+        :param int n_buffers:
+            The number of buffers in one sweep.
+        :param bool xlat_on_cs:
+            Whether the TLC XLAT (and BLANK) lines are driven by the SPI
+            chip-select line. If so, the chip-select change after each
+            transfer latches the layer, no GPIO calls are needed and
+            up to ``batch`` layers are sent in a single ioctl. Otherwise
+            each layer is sent in its own ioctl and latched using the GPIO
+            pins. Default: False.
+        :param int batch:
+            The maximum number of transfers to send per ioctl when
+            ``xlat_on_cs`` is set. Default: 8.
+        :param int delay_usecs:
+            Microseconds to wait after each transfer before changing
+            the chip-select. Default: 0.
+        :param function ioctl:
+            The ioctl function to use. Default: the TLCs backend's ioctl.
+
+        The buffers are held in one contiguous, preallocated array,
+        ``.buffer``, and the spi_ioc_transfer structs pointing into it are
+        built once up front, so a sweep costs only the ioctl calls
+        themselves (and the GPIO latching, if used).
+    """
+
+    def __init__(
+            self, tlcs, n_buffers, xlat_on_cs=False, batch=8, delay_usecs=0,
+            ioctl=None):
+        self.tlcs = tlcs
+        self.xlat_on_cs = xlat_on_cs
+        self.batch = batch if xlat_on_cs else 1
+        self.delay_usecs = delay_usecs
+        self.ioctl = tlcs.ioctl if ioctl is None else ioctl
+        self.n_bytes = 3 * tlcs.n_outputs // 2
+        self.buffer = np.zeros((n_buffers, self.n_bytes), dtype=np.uint8)
+        self.batches = self._build_batches()
+
+    def _build_batches(self):
+        """ Build the ioctl requests and transfer structs for a sweep. """
+        n_buffers = len(self.buffer)
+        base = self.buffer.ctypes.data
+        speed_hz = int(self.tlcs.spi.max_speed_hz)
+        batches = []
+        for start in range(0, n_buffers, self.batch):
+            n = min(self.batch, n_buffers - start)
+            transfers = bytearray(n * SPI_IOC_TRANSFER.size)
+            for i in range(n):
+                # with xlat_on_cs, change chip-select between transfers
+                # to latch each layer (the chip-select is always released
+                # at the end of the message, so the last transfer keeps
+                # cs_change = 0)
+                cs_change = 1 if (self.xlat_on_cs and i < n - 1) else 0
+                SPI_IOC_TRANSFER.pack_into(
+                    transfers, i * SPI_IOC_TRANSFER.size,
+                    base + (start + i) * self.n_bytes, 0,
+                    self.n_bytes, speed_hz, self.delay_usecs, 8, cs_change,
+                    0, 0, 0, 0)
+            batches.append((spi_ioc_message(n), transfers))
+        return batches
+
+    @property
+    def syscalls_per_sweep(self):
+        """ The number of ioctl calls needed for one sweep. """
+        return len(self.batches)
+
+    def load(self, buffers):
+        """ Copy packed PWM buffers into the sweep buffer.
+
+            :param list buffers:
+                The packed PWM buffers for one sweep.
+        """
+        self.buffer[:] = buffers
+
+    def write(self, dwell=None):
+        """ Write one sweep to the TLCs.
+
+            :param DwellTimer dwell:
+                If given, hold each layer on until the timer's dwell time
+                is up. Only used when latching with GPIO (with
+                ``xlat_on_cs`` use ``delay_usecs`` instead). Default: None.
+        """
+        fd = self.tlcs.spi_fd
+        ioctl = self.ioctl
+        if self.xlat_on_cs:
+            for request, transfers in self.batches:
+                ioctl(fd, request, transfers)
+            return
+        tlcs = self.tlcs
+        digital_write = tlcs.gpio.digitalWrite
+        blank, xlat, high, low = tlcs.blank, tlcs.xlat, tlcs.HIGH, tlcs.LOW
+        latch_masks = tlcs.latch_masks
+        for request, transfers in self.batches:
+            digital_write(blank, low)
+            if dwell is not None:
+                dwell.begin()
+            ioctl(fd, request, transfers)
+            if dwell is not None:
+                dwell.end()
+            if latch_masks is not None:
+                tlcs.gpio.write_masks(*latch_masks[0])
+                tlcs.gpio.write_masks(*latch_masks[1])
+                continue
+            digital_write(blank, high)
+            digital_write(xlat, high)
+            digital_write(xlat, low)
+
+
+def pwm_levels(bcm_bits=None, gamma=None, brightness=1.0):
+    """ Return the table of PWM values for each plane and intensity.
+
+        :param int bcm_bits:
+            The number of binary code modulation bit-planes or None
+            for a single plane. Default: None.
+        :param float gamma:
+            The gamma correction to apply to intensities. Default: None.
+        :param float brightness:
+            Scale factor (0.0-1.0) for the corrected intensities.
+            Default: 1.0.
+
+        :return numpy.array:
+            A (planes, 256) array of PWM values.
+
+        With neither ``bcm_bits`` nor ``gamma`` LEDs are either off or on
+        at the brightness given (completely on by default). With only
+        ``gamma`` there is a single plane of 12-bit greyscale PWM values.
+        With ``bcm_bits`` each plane is completely on or completely off
+        and the gamma (default 1.0) and brightness select the BCM level.
+    """
+    intensities = np.arange(256, dtype=np.uint16)
+    if bcm_bits is None and gamma is None:
+        # Currently we set LEDs either completely off (intensity <= 125)
+        # or completely on (intensity > 125) because this renders without
+        # glitches on the mini cube.
+        on = int(round(brightness * 4095))
+        levels = (intensities > 125)[np.newaxis, :] * on
+        return levels.astype(np.uint16)
+    curve = brightness * (intensities / 255.) ** (gamma or 1.0)
+    if bcm_bits is None:
+        # Greyscale PWM values cause rendering glitches on the mini cube
+        # but are fine on the full size Tesseract.
+        levels = np.round(curve * 4095)[np.newaxis, :]
+        return levels.astype(np.uint16)
+    # Each bit-plane is written using the same completely on or
+    # completely off PWM values, which avoids the glitches seen
+    # with intermediate PWM values on the mini cube.
+    max_level = 2 ** bcm_bits - 1
+    bits = np.minimum(np.floor(curve * (max_level + 1)), max_level)
+    bits = bits.astype(np.uint16)
+    levels = np.array([(bits >> plane) & 1 for plane in range(bcm_bits)])
+    return (levels * 4095).astype(np.uint16)
+
+
+class PackingLUT(object):
+    """ Lookup tables that map pairs of voxel intensities directly to
+        packed and inverted TLC bytes.
+
+        :param numpy.array levels:
+            A (planes, 256) array of PWM values for each intensity (e.g.
+            as returned by ``pwm_levels``). Gamma and brightness curves
+            are baked into the table.
+
+        Voxels are read in pairs as little-endian 16-bit words. Because
+        the TLC data is clocked in reverse, the pair (v_2k, v_2k+1) maps
+        to the three bytes of 12-bit values [v_2k+1, v_2k] and the groups
+        of three bytes are written in reverse order. Packing a layer is
+        then a single ``np.take`` from the table with no arithmetic.
+    """
+
+    WORD_DTYPE = np.dtype("<u2")
+
+    def __init__(self, levels):
+        words = np.arange(65536)
+        first = levels[:, words >> 8]
+        second = levels[:, words & 255]
+        self.table = np.zeros((len(levels), 65536, 3), dtype=np.uint8)
+        self.table[:, :, 0] = first >> 4
+        self.table[:, :, 1] = ((first % 16) << 4) + (second >> 8)
+        self.table[:, :, 2] = second % 256
+        np.invert(self.table, out=self.table)
+
+    def voxel_view(self, packed, n_voxels=None):
+        """ Return a view of the voxel bytes of a packed buffer.
+
+            :param numpy.array packed:
+                A (planes, ..., layers, bytes) array of packed buffers.
+            :param int n_voxels:
+                The number of voxels, which must be driven by the last
+                (even numbered) block of outputs. Default: all outputs
+                except the first 16 (the layer select outputs).
+
+            :return numpy.array:
+                A (planes, ..., layers, pairs, 3) view of the bytes holding
+                the voxel values.
+        """
+        n_bytes = packed.shape[-1]
+        if n_voxels is None:
+            n_voxels = 2 * n_bytes // 3 - 16
+        groups = packed.reshape(packed.shape[:-1] + (n_bytes // 3, 3))
+        return groups[..., :n_voxels // 2, :]
+
+    def pack(self, voxels, out):
+        """ Pack voxel intensities for all planes and layers.
+
+            :param numpy.array voxels:
+                A C-contiguous (..., layers, voxels) uint8 array of
+                intensities.
+            :param numpy.array out:
+                The (planes, ..., layers, pairs, 3) view to write packed
+                bytes to (see ``voxel_view``).
+        """
+        words = voxels.view(self.WORD_DTYPE)[..., ::-1]
+        np.take(self.table, words, axis=1, out=out, mode='clip')
+        return out
+
+
+class PWMPacker(object):
+    """ Pack and invert arrays of PWM values for many layers at once.
+
+        :param tuple shape:
+            The shape of the PWM value arrays to pack. The last axis
+            holds the PWM values for each TLC output.
+
+        This is the vectorized equivalent of calling ``TLCs.pack_pwm``
+        on each row of PWM values. The scratch space needed is allocated
+        once up front so that packing allocates no new arrays.
+    """
+
+    def __init__(self, shape):
+        half_shape = tuple(shape[:-1]) + (shape[-1] // 2,)
+        self._scratch_0 = np.zeros(half_shape, dtype=np.uint16)
+        self._scratch_1 = np.zeros(half_shape, dtype=np.uint16)
+
+    def pack(self, pwm_values, out):
+        """ Pack PWM values into a buffer.
+
+            :param numpy.array pwm_values:
+                A uint16 array of PWM values. Each value must be in the
+                range 0-4095 (inclusive).
+            :param numpy.array out:
+                A uint8 array to write the packed and reversed values to.
+                Its last axis must be 3/2 the length of the last axis of
+                ``pwm_values``.
+        """
+        reversed_values = pwm_values[..., ::-1]
+        v_0, v_1 = reversed_values[..., 0::2], reversed_values[..., 1::2]
+        t_0, t_1 = self._scratch_0, self._scratch_1
+        np.right_shift(v_0, 4, out=out[..., 0::3], casting='unsafe')
+        np.bitwise_and(v_0, 15, out=t_0)
+        np.left_shift(t_0, 4, out=t_0)
+        np.right_shift(v_1, 8, out=t_1)
+        np.bitwise_or(t_0, t_1, out=out[..., 1::3], casting='unsafe')
+        np.bitwise_and(v_1, 255, out=out[..., 2::3], casting='unsafe')
+        np.invert(out, out=out)
+        return out
+
+
+class FrameBlender(object):
+    """ Blend from a previous frame to a new frame in a fixed number of
+        steps.
+
+        :param tuple shape:
+            The shape of the frames to blend.
+        :param int steps:
+            The number of steps. The last step is always the new frame.
+
+        Blending uses integer weights out of 256 and preallocated
+        scratch arrays, so it allocates no new arrays.
+    """
+
+    def __init__(self, shape, steps):
+        self.steps = steps
+        self.weights = np.array([
+            (256 * (step + 1)) // steps for step in range(steps)],
+            dtype=np.int32).reshape((steps,) + (1,) * len(shape))
+        self.previous = np.zeros(shape, dtype=np.int32)
+        self.diff = np.zeros(shape, dtype=np.int32)
+        self.scratch = np.zeros((steps,) + tuple(shape), dtype=np.int32)
+        self.blended = np.zeros((steps,) + tuple(shape), dtype=np.uint8)
+
+    def blend(self, previous, frame):
+        """ Return the (steps, ...) array of blended frames.
+
+            :param numpy.array previous:
+                The frame to blend from.
+            :param numpy.array frame:
+                The frame to blend to.
+        """
+        np.copyto(self.previous, previous)
+        np.subtract(frame, self.previous, out=self.diff)
+        np.multiply(self.diff, self.weights, out=self.scratch)
+        np.right_shift(self.scratch, 8, out=self.scratch)
+        np.add(self.scratch, self.previous, out=self.scratch)
+        np.copyto(self.blended, self.scratch, casting='unsafe')
+        return self.blended
+
+
 class PWMBuffers:
     """ Holder for PWM buffers.
 
@@ -200,34 +773,511 @@ class PWMBuffers:
             The TLCs object to store buffers for.
         :param FrameConstants fc:
             The FrameConstants for the cube.
+        :param int bcm_bits:
+            If given, display each layer using binary code modulation
+            (BCM) with this many bit-planes, giving ``2 ** bcm_bits``
+            brightness levels. If None, each LED is either completely on
+            or completely off. Default: None.
+        :param float gamma:
+            Gamma correction for BCM or greyscale PWM levels. If given
+            without ``bcm_bits``, full 12-bit greyscale PWM values are
+            used. Default: None.
+        :param float brightness:
+            Brightness scale factor for BCM or greyscale PWM levels.
+            Default: 1.0.
+        :param bool lut:
+            Whether to pack using a ``PackingLUT``. Default: False.
+        :param int steps:
+            The number of interpolation steps between the previous frame
+            and a new frame. Default: 1 (no interpolation).
+        :param numpy.array previous:
+            The array holding the previous frame to interpolate from.
+            Double-buffered PWMBuffers should share one. Default: None
+            (allocate a new one).
+        :param topology.Chain chain:
+            The outputs of the TLCs that drive each layer select line and
+            voxel. Default: the Tesseract's wiring (layer select lines on
+            the first outputs and voxels from output 16 onwards).
+
+        The buffers to write, in order, for one complete refresh of the
+        cube are available as ``.buffers``. In BCM mode one refresh
+        consists of ``2 ** bcm_bits - 1`` sweeps through the layers, each
+        sweep displaying one bit-plane of every layer. Since every sweep
+        visits every layer, the layer sweep rate is the same as without
+        BCM.
+
+        With interpolation, ``.step_buffers[step]`` holds the buffers for
+        each blend from the previous frame to the new one, and
+        ``.buffers`` is the final step (i.e. the new frame itself).
+
+        Without interpolation, each update compares the new frame with the
+        frame already packed layer by layer and only repacks the layers
+        that changed. ``.layers_packed`` and ``.layers_skipped`` count
+        how much packing was done and avoided.
+
+        All of the PWM values and packed buffers live in persistent
+        arrays, ``.pwm_values`` and ``.packed``, with shape
+        (planes, steps, layers, outputs) and (planes, steps, layers, bytes).
+        Each update converts and packs every layer of every plane and step
+        in a single vectorized pass and the buffer lists hold views into
+        ``.packed`` that remain valid across updates.
+
+        A lookup table is only used if the chain's voxels are driven by
+        the last block of outputs in voxel order. Otherwise ``lut`` is
+        ignored.
     """
 
-    def __init__(self, tlcs, fc):
+    def __init__(
+            self, tlcs, fc, bcm_bits=None, gamma=None, brightness=1.0,
+            lut=False, steps=1, previous=None, chain=None):
+        if chain is None:
+            chain = topology.default_topology(
+                tlcs.n_tlcs, fc.frame_shape).chains[0]
         self.tlcs = tlcs
+        self.chain = chain
         self.layers = list(range(fc.layers))
+        self.bcm_bits = bcm_bits
+        self.steps = steps
+
+        if bcm_bits is None:
+            self.plane_order = [0]
+        else:
+            self.plane_order = bcm_plane_order(bcm_bits)
+        self.levels = pwm_levels(bcm_bits, gamma, brightness)
+        n_planes = len(self.levels)
+
+        self.blender = None
+        if steps > 1:
+            if previous is None:
+                previous = fc.empty_frame()
+            self.previous = previous
+            self.blender = FrameBlender(fc.frame_shape, steps)
+
+        n_voxels = len(chain.voxels)
+        self._all_voxels = np.array_equal(
+            chain.voxels, np.arange(np.prod(fc.frame_shape[1:])))
+        block = chain.voxel_block()
+        if block is not None:
+            self._voxel_outputs = slice(*block)
+        else:
+            self._voxel_outputs = chain.voxel_outputs
 
-        self.layer_masks = [np.zeros(16) for _ in range(fc.layers)]
-        for l in self.layers:
-            self.layer_masks[l][l] = 4095
+        self.pwm_values = np.zeros(
+            (n_planes, steps, fc.layers, tlcs.n_outputs), dtype=np.uint16)
+        if chain.layer_outputs is not None:
+            for layer, output in enumerate(chain.layer_outputs):
+                self.pwm_values[:, :, layer, output] = 4095
+        self.packed = np.zeros(
+            (n_planes, steps, fc.layers, 3 * tlcs.n_outputs // 2),
+            dtype=np.uint8)
+        self.packer = PWMPacker(self.pwm_values.shape)
+        self.lut = None
+        if lut and block is not None and block[1] == tlcs.n_outputs and (
+                n_voxels % 2 == 0):
+            self.lut = PackingLUT(self.levels)
+            self.lut_view = self.lut.voxel_view(self.packed, n_voxels)
 
-        self.buffers = [None for _ in self.layers]
-        self.update(fc.empty_frame())
+        self.step_buffers = [
+            [self.packed[plane, step, layer]
+             for plane in self.plane_order for layer in self.layers]
+            for step in range(steps)]
+        self.buffers = self.step_buffers[-1]
+
+        self.layers_packed = 0
+        self.layers_skipped = 0
+        self.layer_packer = PWMPacker(self.pwm_values[:, :, 0].shape)
+        self.frame = np.zeros((fc.layers, n_voxels), dtype=fc.frame_dtype)
+        self._selected = np.zeros(
+            (1,) + self.frame.shape, dtype=fc.frame_dtype)
+        self._changed = np.zeros(self.frame.shape, dtype=bool)
+        # pack the layer select outputs (which never change) and the
+        # empty frame
+        self.packer.pack(self.pwm_values, out=self.packed)
+        self._pack_all(np.zeros(
+            (steps,) + self.frame.shape, dtype=fc.frame_dtype))
+
+    @property
+    def sweeps_per_refresh(self):
+        """ The number of sweeps through the layers per complete refresh. """
+        return len(self.plane_order)
 
     def update(self, frame):
-        pwm_values = np.zeros(self.tlcs.n_outputs, dtype=np.uint16)
-        for layer in self.layers:
-            pwm_values[0:16] = self.layer_masks[layer].ravel()
-            # Currently we set LEDs either completely off (intensity <= 125)
-            # or completely on (intensity > 125) because this renders without
-            # glitches on the mini cube.
-            pwm_values[16:] = (frame[layer].ravel() > 125)
-            pwm_values[16:] *= 4095
-            # These two lines scale the intensity from 0-255 to 0-4095 but
-            # are commented out for now because they cause rendering glitches
-            # on the mini cube:
-            # pwm_values[16:] = frame[layer].ravel()
-            # pwm_values[16:] *= 16  # 16 == 4096 / 256
-            self.buffers[layer] = self.tlcs.pack_pwm(pwm_values)
+        if self.blender is not None:
+            frames = self.blender.blend(self.previous, frame)
+            self.previous[...] = frame
+            frames = frames.reshape((self.steps, len(self.layers), -1))
+            if not self._all_voxels:
+                frames = np.take(frames, self.chain.voxels, axis=-1)
+            self._pack_all(frames)
+            self.layers_packed += len(self.layers)
+            return
+        voxels = frame.reshape((1, len(self.layers), -1))
+        if not self._all_voxels:
+            voxels = np.take(
+                voxels, self.chain.voxels, axis=-1, out=self._selected)
+        np.not_equal(voxels[0], self.frame, out=self._changed)
+        changed = np.flatnonzero(self._changed.any(axis=1))
+        self.layers_packed += len(changed)
+        self.layers_skipped += len(self.layers) - len(changed)
+        if len(changed) > len(self.layers) // 2:
+            self._pack_all(voxels)
+        else:
+            for layer in changed:
+                self._pack_layer(voxels, layer)
+        self.frame[...] = voxels[0]
+
+    def _pack_all(self, voxels):
+        """ Pack (steps, layers, voxels) intensities for all layers. """
+        if self.lut is not None:
+            self.lut.pack(np.ascontiguousarray(voxels), out=self.lut_view)
+            return
+        self._set_levels(voxels, self.pwm_values)
+        self.packer.pack(self.pwm_values, out=self.packed)
+
+    def _pack_layer(self, voxels, layer):
+        """ Pack (steps, layers, voxels) intensities for a single layer. """
+        if self.lut is not None:
+            self.lut.pack(
+                np.ascontiguousarray(voxels[:, layer]),
+                out=self.lut_view[:, :, layer])
+            return
+        self._set_levels(voxels[:, layer], self.pwm_values[:, :, layer])
+        self.layer_packer.pack(
+            self.pwm_values[:, :, layer], out=self.packed[:, :, layer])
+
+    def _set_levels(self, voxels, pwm_values):
+        """ Set the PWM values of the voxel outputs from intensities. """
+        outputs = self._voxel_outputs
+        if isinstance(outputs, slice):
+            np.take(
+                self.levels, voxels, axis=1, out=pwm_values[..., outputs],
+                mode='clip')
+        else:
+            pwm_values[..., outputs] = np.take(
+                self.levels, voxels, axis=1, mode='clip')
+
+
+class ChainBuffers(object):
+    """ PWMBuffers for every chain of a multi-chain topology.
+
+        :param list chain_buffers:
+            The PWMBuffers for each chain.
+
+        ``.buffers`` and ``.step_buffers`` hold, for each layer write, a
+        tuple of the packed buffers for each chain (see
+        ``ParallelChains.write_layer``).
+    """
+
+    def __init__(self, chain_buffers):
+        self.chain_buffers = list(chain_buffers)
+        self.step_buffers = [
+            list(zip(*step_buffers))
+            for step_buffers in zip(
+                *[b.step_buffers for b in self.chain_buffers])]
+        self.buffers = self.step_buffers[-1]
+
+    @property
+    def sweeps_per_refresh(self):
+        """ The number of sweeps through the layers per complete refresh. """
+        return self.chain_buffers[0].sweeps_per_refresh
+
+    @property
+    def layers_packed(self):
+        return sum(b.layers_packed for b in self.chain_buffers)
+
+    @property
+    def layers_skipped(self):
+        return sum(b.layers_skipped for b in self.chain_buffers)
+
+    def update(self, frame):
+        for pwm_buffers in self.chain_buffers:
+            pwm_buffers.update(frame)
+
+
+class FrameReceiver(threading.Thread):
+    """ Receive and pack frames in a background thread.
+
+        :param frame_source:
+            The transport.ZmqSubscriber or transport.ShmSubscriber to
+            receive frames from.
+        :param list pwm_buffers:
+            A pair of PWMBuffers to double-buffer frames into.
+        :param list sweeps:
+            An optional pair of lists of SpiSweeps (one per interpolation
+            step) to load the packed buffers into. Default: None.
+        :param int poll_timeout:
+            Milliseconds to wait for a frame before checking whether the
+            receiver has been stopped. Default: 100.
+        :param tuple frame_shape:
+            The shape of the frames received. Default:
+            frame_utils.FRAME_SHAPE.
+        :param envelope.PlayoutBuffer playout:
+            The buffer to hold frames in until their display time.
+            Default: None (display frames as soon as they arrive).
+
+        The sweep loop displays ``pwm_buffers[receiver.front]`` and calls
+        ``.swap()`` once per refresh. The receiver packs each new frame into
+        the other set of buffers and then publishes its index as
+        ``.ready``; ``.swap()`` makes it the new front. Publishing and
+        swapping are single attribute assignments, so the sweep loop never
+        takes a lock or waits on the receiver.
+
+        If several frames arrive before the receiver has packed the
+        previous one, or before the sweep loop has swapped to it, only
+        the newest is packed and the rest are counted as dropped. Frames
+        identical to the previously packed frame are not packed or
+        swapped in at all and are counted as unchanged. Frames from shared
+        memory are packed in place, and are dropped if the publisher
+        overwrites them while they are being packed.
+
+        With a scheduled playout buffer, frames are held (as copies) until
+        their display time and then packed. Frames that are passed over
+        because a newer frame is also due are counted as dropped. Lost and
+        late frames are counted by the playout buffer.
+
+        If receiving or packing a frame fails (e.g. a socket error or a
+        malformed frame), the receiver stops and stores the exception in
+        ``.error`` for the sweep loop to report.
+    """
+
+    def __init__(self, frame_source, pwm_buffers, sweeps=None,
+                 poll_timeout=100, frame_shape=frame_utils.FRAME_SHAPE,
+                 playout=None):
+        super(FrameReceiver, self).__init__(name="frame-receiver")
+        self.daemon = True
+        self.frame_shape = frame_shape
+        self.frame_source = frame_source
+        self.pwm_buffers = pwm_buffers
+        self.sweeps = sweeps
+        self.poll_timeout = poll_timeout
+        self.front = 0
+        self.ready = None
+        self.received_at = [time.time(), time.time()]
+        self._received_at = time.time()
+        self.error = None
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.frames_unchanged = 0
+        self.frames_packed = 0
+        self._last_frame = None
+        if playout is None:
+            playout = envelope.PlayoutBuffer(frame_shape, scheduled=False)
+        self.playout = playout
+        self.pack_time_total = 0.0
+        self.pack_time_max = 0.0
+        self._consumed = threading.Event()
+        self._stopped = threading.Event()
+
+    def stop(self):
+        """ Ask the receiver thread to stop. """
+        self._stopped.set()
+        self._consumed.set()
+
+    def swap(self):
+        """ Swap to the most recently packed buffers, if any.
+
+            :return bool:
+                True if the front buffers changed, False otherwise.
+        """
+        ready = self.ready
+        if ready is None:
+            return False
+        self.front = ready
+        self.ready = None
+        self._consumed.set()
+        return True
+
+    @property
+    def frames_lost(self):
+        """ The number of frames the publisher sent that never arrived. """
+        return self.playout.frames_lost
+
+    @property
+    def frames_late(self):
+        """ The number of frames that arrived after their display time. """
+        return self.playout.frames_late
+
+    def run(self):
+        try:
+            while not self._stopped.is_set():
+                if self.playout.scheduled:
+                    frame = self._recv_scheduled()
+                else:
+                    frame = self._recv_latest(self.poll_timeout)
+                if frame is None:
+                    continue
+                if self._last_frame is not None and np.array_equal(
+                        frame, self._last_frame):
+                    self.frames_unchanged += 1
+                    continue
+                if self.ready is not None:
+                    # the sweep loop hasn't swapped to the previous frame
+                    # yet, so wait until it does before overwriting the
+                    # back buffers
+                    self._consumed.wait()
+                    if self.playout.scheduled:
+                        frame = self._pop_due(frame)
+                    else:
+                        frame = self._recv_latest(0, frame)
+                if self._pack(frame, self._received_at):
+                    # keep a copy, since shared memory slots are reused
+                    if self._last_frame is None:
+                        self._last_frame = frame.copy()
+                    else:
+                        np.copyto(self._last_frame, frame)
+        except Exception as err:
+            # report the error from the sweep loop, rather than leaving it
+            # showing the last frame forever
+            self.error = err
+
+    def _recv_latest(self, timeout, frame=None):
+        """ Return the newest frame waiting on the frame source.
+
+            :param int timeout:
+                Milliseconds to wait for a frame to arrive.
+            :param numpy.ndarray frame:
+                A frame already received but not yet packed, which is
+                counted as dropped if a newer frame is waiting. Default:
+                None.
+
+            :return numpy.ndarray:
+                The newest frame, or ``frame`` if no frames arrived.
+        """
+        if not self.frame_source.poll(timeout):
+            return frame
+        while True:
+            data = self.frame_source.recv_nowait()
+            if data is None:
+                return frame
+            self.frames_received += 1
+            self._received_at = time.time()
+            _, latest = self.playout.receive(data, self._received_at)
+            if latest is None:
+                continue
+            if frame is not None:
+                self.frames_dropped += 1
+            frame = latest
+
+    def _recv_scheduled(self):
+        """ Receive frames into the playout buffer and return the newest
+            frame due for display, if any.
+        """
+        timeout = self.poll_timeout
+        due = self.playout.next_due()
+        if due is not None:
+            timeout = min(timeout, max(0, int(
+                math.ceil((due - time.time()) * 1000))))
+        if self.frame_source.poll(timeout):
+            while True:
+                data = self.frame_source.recv_nowait()
+                if data is None:
+                    break
+                self.frames_received += 1
+                self._received_at = time.time()
+                self.playout.push(data, self._received_at)
+        return self._pop_due()
+
+    def _pop_due(self, frame=None):
+        """ Return the newest frame due for display, or ``frame`` if none
+            are due. Frames passed over are counted as dropped.
+        """
+        skipped = self.playout.frames_skipped
+        due = self.playout.pop(time.time())
+        self.frames_dropped += self.playout.frames_skipped - skipped
+        if due is None:
+            return frame
+        if frame is not None:
+            self.frames_dropped += 1
+        return due
+
+    def _pack(self, frame, received_at):
+        start = time.time()
+        back = 1 - self.front
+        self.pwm_buffers[back].update(frame)
+        if not self.playout.scheduled and self.frame_source.overwritten():
+            # the publisher lapped the ring while the frame was packed, so
+            # the packed frame may be torn; a newer frame is waiting
+            self.frames_dropped += 1
+            return False
+        if self.sweeps is not None:
+            for sweep, buffers in zip(
+                    self.sweeps[back], self.pwm_buffers[back].step_buffers):
+                sweep.load(buffers)
+        pack_time = time.time() - start
+        self.frames_packed += 1
+        self.pack_time_total += pack_time
+        self.pack_time_max = max(self.pack_time_max, pack_time)
+        self.received_at[back] = received_at
+        self._consumed.clear()
+        self.ready = back
+        return True
+
+    def frame_age(self, now=None):
+        """ Return the seconds since the frame currently being displayed
+            was received.
+        """
+        if now is None:
+            now = time.time()
+        return now - self.received_at[self.front]
+
+    def layers_packed(self):
+        """ Return the total number of layers packed. """
+        return sum(b.layers_packed for b in self.pwm_buffers)
+
+    def layers_skipped(self):
+        """ Return the total number of unchanged layers not repacked. """
+        return sum(b.layers_skipped for b in self.pwm_buffers)
+
+    def stats_text(self):
+        """ Return a summary of the receiver counters. """
+        mean = self.pack_time_total / max(self.frames_packed, 1)
+        return (
+            "Frames: {} received, {} dropped, {} unchanged, {} lost,"
+            " {} late; layers: {} packed, {} skipped;"
+            " packing: {:.1f} us mean, {:.1f} us max".format(
+                self.frames_received, self.frames_dropped,
+                self.frames_unchanged, self.frames_lost, self.frames_late,
+                self.layers_packed(),
+                self.layers_skipped(), mean * 1e6, self.pack_time_max * 1e6))
+
+
+class RefreshRate:
+    """ Measure and periodically report the refresh rate of the cube.
+
+        :param int sweeps_per_refresh:
+            The number of sweeps through the layers in one complete refresh.
+        :param float interval:
+            The number of seconds between reports.
+        :param function report:
+            Function to call with the report text. Default: click.echo.
+        :param function details:
+            Optional function returning extra text to report after the
+            refresh rate. Default: None.
+    """
+
+    def __init__(self, sweeps_per_refresh, interval, report=click.echo,
+                 details=None):
+        self.sweeps_per_refresh = sweeps_per_refresh
+        self.interval = interval
+        self.report = report
+        self.details = details
+        self.refreshes = 0
+        self.start = time.time()
+
+    def tick(self):
+        """ Record one complete refresh and report if the interval is up. """
+        self.refreshes += 1
+        now = time.time()
+        elapsed = now - self.start
+        if elapsed >= self.interval:
+            rate = self.refreshes / elapsed
+            self.report(
+                "Refresh rate: {:.1f} Hz ({:.1f} layer sweeps / s)".format(
+                    rate, rate * self.sweeps_per_refresh))
+            if self.details is not None:
+                self.report(self.details())
+            self.refreshes = 0
+            self.start = now
 
 
 class Tester:
@@ -267,22 +1317,251 @@ class Tester:
         click.echo("Test complete.")
 
 
-@click.command(context_settings={"auto_envvar_prefix": "TSC"})
+# 3 906 250  Hz is the maximum SPI bus speed at which we can
+# correctly clock data into the TLC chips. The factor of 4 was
+# emperically determined as a good balance between time spent
+# in Python code and time spent clocking data in the SPI (faster SPI
+# writes gives faster rendering of each layer, but looping through the
+# layers more often means the LEDs appear less bright because they are only
+# lit while the SPI clock is being toggled). Use the tune command to
+# find the best speed for a particular Pi.
+MAX_SPISPEED = 3906250
+DEFAULT_SPISPEED = MAX_SPISPEED // 4
+
+
+def create_tlcs(backend, spispeed, xlat_on_cs=False, gpio_mode="wiringpi",
+                gpiomem_path="/dev/gpiomem", wait=True, chain=None):
+    """ Create the Tesseract's chain of TLCs.
+
+        :param str backend:
+            Either "spidev" (for real TLCs) or "sim" (for a simulated
+            chain, see tessled.tlc_sim).
+        :param int spispeed:
+            The SPI speed in Hz.
+        :param bool xlat_on_cs:
+            Whether XLAT and BLANK are wired to the SPI chip-select.
+        :param str gpio_mode:
+            The GPIO control to use with "spidev" (see HardwareBackend).
+        :param str gpiomem_path:
+            The GPIO register file to use with "gpiomem".
+        :param bool wait:
+            Whether simulated writes take as long as they would on the
+            real chain (so that measured refresh rates are realistic).
+        :param topology.Chain chain:
+            The chain to create the TLCs for. Default: the Tesseract's
+            5 chips on SPI bus 0, device 0.
+    """
+    if chain is None:
+        chain = topology.default_topology().chains[0]
+    if backend == 'sim':
+        backend = tlc_sim.SimBackend(
+            xlat_on_cs=xlat_on_cs, wait=wait, chain=chain)
+    else:
+        backend = HardwareBackend(gpio=gpio_mode, gpiomem_path=gpiomem_path)
+    return TLCs(
+        tlcs=chain.chips,
+        blank=3, vprg=5, xlat=6, dcprg=7,
+        spibus=chain.spibus, spidevice=chain.spidevice, spispeed=spispeed,
+        backend=backend)
+
+
+def profile_options(ctx, path):
+    """ Return the options from a tuning profile that were not given
+        explicitly on the command line (or in the environment).
+    """
+    try:
+        profile = tuning.load_profile(path)
+    except (IOError, tuning.ProfileError) as err:
+        raise click.ClickException(str(err))
+    default = click.core.ParameterSource.DEFAULT
+    return dict(
+        (name, value) for name, value in profile.items()
+        if ctx.get_parameter_source(name) == default)
+
+
+def write_dc_file(tlcs, path):
+    """ Write the dot correction values from a calibration file to the
+        TLCs, reporting (but otherwise ignoring) invalid files.
+    """
+    try:
+        dc_values = calibration.load_dc(path, tlcs.n_outputs)
+    except (IOError, calibration.CalibrationError) as err:
+        click.echo("Dot correction not written: {}".format(err))
+        return False
+    tlcs.write_dc(dc_values)
+    click.echo("Dot correction written from {}.".format(path))
+    return True
+
+
+@click.group(
+    invoke_without_command=True,
+    context_settings={"auto_envvar_prefix": "TSC"})
 @click.option(
     '--fps', default=10,
     help='Frames per second.')
 @click.option(
     '--frame-addr', default='tcp://127.0.0.1:5556',
-    help='ZeroMQ address to publish frames too.')
+    help='ZeroMQ address to receive frames from, or shm://<name> to read'
+         ' them from a shared memory ring.')
+@click.option(
+    '--playout/--no-playout', default=True,
+    help='Hold frames until the display time set by the effectbox (the'
+         ' default), or display them as soon as they arrive.')
+@click.option(
+    '--playout-max-delay', default=1.0, type=float,
+    help='Longest time in seconds to hold a frame for with --playout.')
 @click.option(
     '--test-io', default=False, type=bool,
     help='Test IO pins')
-def main(fps, frame_addr, test_io):
+@click.option(
+    '--bcm-bits', default=None, type=click.IntRange(1, 8),
+    help='Display brightness levels using binary code modulation with'
+         ' this many bit-planes (e.g. 3 gives 8 levels). Default: LEDs'
+         ' are either on or off.')
+@click.option(
+    '--report-interval', default=10.0,
+    help='Seconds between refresh rate reports (0 to disable).')
+@click.option(
+    '--ioctl-sweep/--no-ioctl-sweep', default=False,
+    help='Write layers using prebuilt spidev ioctl transfers from a'
+         ' single contiguous buffer.')
+@click.option(
+    '--xlat-on-cs/--no-xlat-on-cs', default=False,
+    help='Latch layers using the SPI chip-select line (requires XLAT and'
+         ' BLANK to be wired to chip-select). Implies --ioctl-sweep.')
+@click.option(
+    '--spi-batch', default=8, type=click.IntRange(1, 511),
+    help='Maximum number of layers per ioctl with --xlat-on-cs.')
+@click.option(
+    '--spispeed', default=DEFAULT_SPISPEED, type=click.IntRange(1, None),
+    help='SPI clock speed in Hz.')
+@click.option(
+    '--profile', default=tuning.DEFAULT_PROFILE,
+    type=click.Path(dir_okay=False),
+    help='Tuning profile (written by the tune command) to load --spispeed,'
+         ' --layer-dwell-us and --spi-batch from, unless they are given'
+         ' explicitly.')
+@click.option(
+    '--spi-delay-us', default=0, type=click.IntRange(0, 65535),
+    help='Microseconds to wait after each layer transfer with'
+         ' --ioctl-sweep.')
+@click.option(
+    '--gamma', default=None, type=float,
+    help='Gamma correction for brightness levels. Without --bcm-bits'
+         ' this enables 12-bit greyscale PWM.')
+@click.option(
+    '--brightness', default=1.0, type=click.FloatRange(0.0, 1.0),
+    help='Brightness scale factor. Without --bcm-bits or --gamma this'
+         ' sets the PWM value of lit LEDs.')
+@click.option(
+    '--lut/--no-lut', default=True,
+    help='Pack frames using precomputed lookup tables.')
+@click.option(
+    '--realtime/--no-realtime', 'realtime_', default=False,
+    help='Turn on all of the real-time settings below that are not'
+         ' explicitly set.')
+@click.option(
+    '--cpu', default=None, type=int,
+    help='Pin the layer sweep loop to this CPU. Default with --realtime:'
+         ' the last CPU.')
+@click.option(
+    '--sched-fifo/--no-sched-fifo', default=None,
+    help='Run the layer sweep loop with the SCHED_FIFO scheduler.')
+@click.option(
+    '--fifo-priority', default=50, type=click.IntRange(1, 99),
+    help='SCHED_FIFO priority.')
+@click.option(
+    '--mlockall/--no-mlockall', default=None,
+    help='Lock the driver memory into RAM.')
+@click.option(
+    '--gc', 'gc_mode', default=None, type=click.Choice(realtime.GC_MODES),
+    help='Garbage collector mode during the sweep. Default with'
+         ' --realtime: freeze.')
+@click.option(
+    '--layer-dwell-us', default=0, type=click.IntRange(0, None),
+    help='Target time in microseconds that each layer is lit for.'
+         ' Default: as short as the SPI write allows.')
+@click.option(
+    '--spin-us', default=100, type=click.IntRange(0, None),
+    help='Spin (rather than sleep) for the last microseconds of each'
+         ' layer dwell.')
+@click.option(
+    '--timing/--no-timing', default=False,
+    help='Record layer dwell and sweep time histograms (implied by'
+         ' --layer-dwell-us). Send SIGUSR1 to print them.')
+@click.option(
+    '--timing-file', default=None, type=click.Path(dir_okay=False),
+    help='Also write the timing histograms to this JSON file on SIGUSR1.')
+@click.option(
+    '--stats-addr', default=None,
+    help='ZeroMQ address to publish driver statistics on.')
+@click.option(
+    '--stats-file', default=None, type=click.Path(dir_okay=False),
+    help='File to periodically write driver statistics to.')
+@click.option(
+    '--stats-interval', default=10.0,
+    help='Seconds between publishing driver statistics.')
+@click.option(
+    '--interpolate-steps', default=1, type=click.IntRange(1, 64),
+    help='Blend from the previous frame to each new frame in this many'
+         ' steps over one frame interval (1 / --fps). Default: 1 (no'
+         ' blending).')
+@click.option(
+    '--backend', default='spidev', type=click.Choice(['spidev', 'sim']),
+    help='Drive real TLCs with spidev and wiringpi, or a simulated chain'
+         ' of TLCs (see tessled.tlc_sim) that decodes what is written and'
+         ' models the SPI clock time.')
+@click.option(
+    '--topology', 'topology_file', default=None,
+    type=click.Path(dir_okay=False),
+    help='JSON file describing the chains of TLCs and how they are wired'
+         ' to the cube (see tessled.topology). Default: the Tesseract.')
+@click.option(
+    '--gpio', 'gpio_mode', default='wiringpi',
+    type=click.Choice(['wiringpi', 'gpiomem']),
+    help='Control the BLANK, XLAT, VPRG and DCPRG pins using wiringpi or'
+         ' by writing directly to the memory mapped GPIO registers.')
+@click.option(
+    '--gpiomem-path', default='/dev/gpiomem',
+    type=click.Path(dir_okay=False),
+    help='File to map the GPIO registers from with --gpio=gpiomem.')
+@click.option(
+    '--dc-file', default=None, type=click.Path(dir_okay=False),
+    help='Dot correction calibration file to write to the TLCs at'
+         ' startup and whenever SIGHUP is received.')
+@click.pass_context
+def main(ctx, fps, frame_addr, playout, playout_max_delay, test_io,
+         bcm_bits, report_interval, ioctl_sweep, xlat_on_cs, spi_batch,
+         spispeed, profile, spi_delay_us,
+         gamma, brightness, lut,
+         realtime_, cpu, sched_fifo, fifo_priority, mlockall, gc_mode,
+         layer_dwell_us, spin_us, timing, timing_file,
+         stats_addr, stats_file, stats_interval, backend, topology_file,
+         gpio_mode, gpiomem_path, dc_file, interpolate_steps):
+    if ctx.invoked_subcommand is not None:
+        # hardware options are shared with subcommands
+        ctx.obj = {
+            "backend": backend, "gpio_mode": gpio_mode,
+            "gpiomem_path": gpiomem_path, "xlat_on_cs": xlat_on_cs,
+            "bcm_bits": bcm_bits, "profile": profile,
+        }
+        return
     click.echo("Tesseract spidev LED driver running.")
+    options = profile_options(ctx, profile)
+    if options:
+        click.echo("Tuning profile {}: {}.".format(profile, ", ".join(
+            "{}={}".format(name, value)
+            for name, value in sorted(options.items()))))
+        spispeed = options.get("spispeed", spispeed)
+        layer_dwell_us = options.get("layer_dwell_us", layer_dwell_us)
+        spi_batch = options.get("spi_batch", spi_batch)
+    if xlat_on_cs and not spi_delay_us and layer_dwell_us > 65535:
+        # the dwell becomes the transfer's delay_usecs, which is 16 bits
+        raise click.BadParameter(
+            "at most 65535 with --xlat-on-cs (got {}).".format(
+                layer_dwell_us), param_hint="'--layer-dwell-us'")
     context = zmq.Context()
-    frame_socket = context.socket(zmq.SUB)
-    frame_socket.connect(frame_addr)
-    frame_socket.setsockopt_string(zmq.SUBSCRIBE, u"")  # receive everything
+    frame_source = transport.open_subscriber(frame_addr, context)
 
     if test_io:
         tester = Tester(
@@ -290,38 +1569,234 @@ def main(fps, frame_addr, test_io):
         tester.test_pins()
         return
 
-    # 3 906 250  Hz is the maximum SPI bus speed at which we can
-    # correctly clock data into the TLC chips. The factor of 4 was
-    # emperically determined as a good balance between time spent
-    # in Python code and time spent clocking data in the SPI (faster SPI
-    # writes gives faster rendering of each layer, but looping through the
-    # layers more often means the LEDs appear less bright because they are only
-    # lit while the SPI clock is being toggled).
-    max_spispeed = 3906250
-    spispeed = max_spispeed / 4
-
-    tlcs = TLCs(
-        tlcs=5,
-        blank=3, vprg=5, xlat=6, dcprg=7,
-        spibus=0, spidevice=0, spispeed=spispeed)
+    if topology_file is not None:
+        try:
+            topo = topology.load_topology(topology_file)
+        except (IOError, topology.TopologyError) as err:
+            raise click.ClickException(str(err))
+    else:
+        topo = topology.default_topology()
+    if len(topo.chains) > 1 and (ioctl_sweep or xlat_on_cs):
+        raise click.ClickException(
+            "--ioctl-sweep and --xlat-on-cs only support a single chain.")
+    chain_tlcs = [
+        create_tlcs(
+            backend, spispeed, xlat_on_cs=xlat_on_cs, gpio_mode=gpio_mode,
+            gpiomem_path=gpiomem_path, chain=chain)
+        for chain in topo.chains]
+    sims = [t.backend.chain for t in chain_tlcs if t.backend.name == 'sim']
+
+    fc = frame_utils.FrameConstants(
+        fps=fps, ttype="tesseract", frame_shape=topo.frame_shape)
+
+    # double buffered so that frames can be received and packed while
+    # the previous frame is displayed
+    previous = [fc.empty_frame() for _ in topo.chains]
 
-    fc = frame_utils.FrameConstants(fps=fps, ttype="tesseract")
+    def chain_buffers(i):
+        return PWMBuffers(
+            chain_tlcs[i], fc, bcm_bits=bcm_bits, gamma=gamma,
+            brightness=brightness, lut=lut, steps=interpolate_steps,
+            previous=previous[i], chain=topo.chains[i])
 
-    pwm_buffers = PWMBuffers(tlcs, fc)
+    chains = None
+    if len(topo.chains) == 1:
+        tlcs = chain_tlcs[0]
+        pwm_buffers = [chain_buffers(0) for _ in range(2)]
+    else:
+        tlcs = chains = ParallelChains(chain_tlcs)
+        pwm_buffers = [
+            ChainBuffers([chain_buffers(i) for i in range(len(chain_tlcs))])
+            for _ in range(2)]
+        click.echo("Driving {} chains of TLCs in parallel.".format(
+            len(chain_tlcs)))
+    sweeps = None
+    if ioctl_sweep or xlat_on_cs:
+        if xlat_on_cs and not spi_delay_us:
+            # layers latched by chip-select are held by the kernel
+            spi_delay_us = layer_dwell_us
+        sweeps = [
+            [SpiSweep(
+                tlcs, len(step_buffers), xlat_on_cs=xlat_on_cs,
+                batch=spi_batch, delay_usecs=spi_delay_us)
+             for step_buffers in buffers.step_buffers]
+            for buffers in pwm_buffers]
+        for step_sweeps, buffers in zip(sweeps, pwm_buffers):
+            for sweep, step_buffers in zip(
+                    step_sweeps, buffers.step_buffers):
+                sweep.load(step_buffers)
+        click.echo("Sweeping with {} ioctl calls per refresh.".format(
+            sweeps[0][0].syscalls_per_sweep))
+
+    receiver = FrameReceiver(
+        frame_source, pwm_buffers, sweeps=sweeps, frame_shape=fc.frame_shape,
+        playout=envelope.PlayoutBuffer(
+            fc.frame_shape, scheduled=playout, max_delay=playout_max_delay))
+
+    dwell = None
+    publish_stats = stats_addr is not None or stats_file is not None
+    if timing or layer_dwell_us or timing_file or publish_stats:
+        dwell = DwellTimer(layer_dwell_us * 1000, spin_ns=spin_us * 1000)
+
+        def print_timing(signum, frame):
+            click.echo(dwell.report())
+            if timing_file:
+                dwell.export(timing_file)
+
+        signal.signal(signal.SIGUSR1, print_timing)
+
+    def details():
+        return "\n".join(
+            [receiver.stats_text()] + [sim.stats_text() for sim in sims])
+
+    refresh_rate = None
+    if report_interval > 0:
+        refresh_rate = RefreshRate(
+            pwm_buffers[0].sweeps_per_refresh, report_interval,
+            details=details)
+
+    stats = None
+    if publish_stats:
+        stats_socket = None
+        if stats_addr is not None:
+            stats_socket = context.socket(zmq.PUB)
+            stats_socket.bind(stats_addr)
+        stats = DriverStats(
+            receiver, dwell, pwm_buffers[0].sweeps_per_refresh,
+            stats_interval, socket=stats_socket, path=stats_file)
 
     tlcs.init_tlcs()
+    dc_reload = []
+    if dc_file is not None:
+        write_dc_file(tlcs, dc_file)
+        signal.signal(
+            signal.SIGHUP, lambda signum, frame: dc_reload.append(signum))
+    receiver.start()
+    # apply real-time settings after starting the receiver so that only
+    # the sweep loop is pinned and prioritised
+    if realtime_:
+        cpu = realtime.default_cpu() if cpu is None else cpu
+        sched_fifo = True if sched_fifo is None else sched_fifo
+        mlockall = True if mlockall is None else mlockall
+        gc_mode = "freeze" if gc_mode is None else gc_mode
+    realtime.apply_realtime(
+        cpu=cpu, fifo_priority=fifo_priority if sched_fifo else None,
+        mlock=bool(mlockall), gc_mode=gc_mode or "enabled")
+    step, last_step = 0, interpolate_steps - 1
+    steps_per_second = interpolate_steps * fps
+    shown_at = time.time()
     while True:
-        rlist, _, elist = zmq.select(
-            [frame_socket], [], [frame_socket], timeout=0)
-        if elist:
-            click.echo("Frame socket error.")
-            click.abort()
-        if rlist:
-            data = frame_socket.recv()
-            frame = np.frombuffer(data, dtype=frame_utils.FRAME_DTYPE)
-            frame.shape = frame_utils.FRAME_SHAPE
-            pwm_buffers.update(frame)
-        for pwm_buffer in pwm_buffers.buffers:
-            tlcs.write_pwm_packed(pwm_buffer)
+        if dc_reload:
+            # reload between refreshes so as not to interrupt a layer write
+            del dc_reload[:]
+            write_dc_file(tlcs, dc_file)
+        if receiver.swap():
+            shown_at = time.time()
+            step = 0
+        elif step < last_step:
+            step = min(int((time.time() - shown_at) * steps_per_second),
+                       last_step)
+        if receiver.error is not None:
+            click.echo("Frame receiver error: {!r}".format(receiver.error))
+            raise click.Abort()
+        if sweeps is not None:
+            sweeps[receiver.front][step].write(dwell)
+        elif chains is not None:
+            for layer_buffers in pwm_buffers[receiver.front].step_buffers[
+                    step]:
+                chains.write_layer(layer_buffers, dwell)
+        else:
+            for pwm_buffer in pwm_buffers[receiver.front].step_buffers[step]:
+                tlcs.write_pwm_packed(pwm_buffer, dwell)
+        if dwell is not None:
+            dwell.sweep()
+        if refresh_rate is not None:
+            refresh_rate.tick()
+        if stats is not None:
+            stats.tick()
 
     click.echo("Tesseract spidev LED driver exited.")
+
+
+@main.command()
+@click.option(
+    '--spispeed-divisor', 'divisors', multiple=True,
+    default=(1, 2, 3, 4, 6, 8), type=click.IntRange(1, None),
+    help='Try an SPI speed of the maximum speed divided by this (may be'
+         ' given several times).')
+@click.option(
+    '--layer-dwell-us', 'dwells_us', multiple=True, default=(0, 100, 250),
+    type=click.IntRange(0, None),
+    help='Try this layer dwell time (may be given several times).')
+@click.option(
+    '--spi-batch', 'batches', multiple=True, default=(1, 8, 56),
+    type=click.IntRange(1, 511),
+    help='Try this many layers per ioctl with --xlat-on-cs (may be given'
+         ' several times).')
+@click.option(
+    '--seconds', default=1.0, type=click.FloatRange(0.01, None),
+    help='Seconds to measure each combination for.')
+@click.option(
+    '--min-refresh-rate', default=100.0,
+    help='Lowest acceptable refresh rate in Hz. The brightest combination'
+         ' that refreshes at least this fast is chosen.')
+@click.option(
+    '--save/--no-save', default=True,
+    help='Save the best combination to the tuning profile (see --profile).')
+@click.pass_obj
+def tune(obj, divisors, dwells_us, batches, seconds, min_refresh_rate, save):
+    """ Measure the refresh rate and lit duty cycle for combinations of
+        SPI speed, layer dwell time and batching and save the best.
+    """
+    xlat_on_cs = obj["xlat_on_cs"]
+    tlcs = create_tlcs(
+        obj["backend"], DEFAULT_SPISPEED, xlat_on_cs=xlat_on_cs,
+        gpio_mode=obj["gpio_mode"], gpiomem_path=obj["gpiomem_path"])
+    tlcs.init_tlcs()
+    fc = frame_utils.FrameConstants(ttype="tesseract")
+    frame = fc.empty_frame()
+    frame[...] = 255
+    pwm_buffers = PWMBuffers(tlcs, fc, bcm_bits=obj["bcm_bits"])
+    pwm_buffers.update(frame)
+    buffers = pwm_buffers.buffers
+    if not xlat_on_cs:
+        batches = (1,)
+
+    spispeeds = sorted(set(MAX_SPISPEED // d for d in divisors), reverse=True)
+    results = []
+    for candidate in tuning.candidates(spispeeds, dwells_us, batches):
+        spispeed = candidate["spispeed"]
+        dwell_us = candidate["layer_dwell_us"]
+        tlcs.spi.max_speed_hz = spispeed
+        lit_ns = None
+        if xlat_on_cs:
+            sweep = SpiSweep(
+                tlcs, len(buffers), xlat_on_cs=True,
+                batch=candidate["spi_batch"], delay_usecs=dwell_us)
+            sweep.load(buffers)
+            lit_ns = len(buffers) * (
+                8e9 * sweep.n_bytes / spispeed + 1e3 * dwell_us)
+
+            def write_refresh(dwell):
+                sweep.write()
+        else:
+            def write_refresh(dwell):
+                for pwm_buffer in buffers:
+                    tlcs.write_pwm_packed(pwm_buffer, dwell)
+
+        result = tuning.measure(
+            write_refresh, dwell_us, seconds, lit_ns_per_refresh=lit_ns)
+        result.update(candidate)
+        results.append(result)
+        click.echo(
+            "spispeed={spispeed} layer_dwell_us={layer_dwell_us}"
+            " spi_batch={spi_batch}: {refreshes_per_second:.1f} Hz,"
+            " duty cycle {duty_cycle:.2f}".format(**result))
+
+    best = tuning.choose_best(results, min_refresh_rate)
+    click.echo(
+        "Best: spispeed={spispeed} layer_dwell_us={layer_dwell_us}"
+        " spi_batch={spi_batch}.".format(**best))
+    if save:
+        tuning.save_profile(obj["profile"], best)
+        click.echo("Tuning profile saved to {}.".format(obj["profile"]))
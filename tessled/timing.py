@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+""" Timing utilities for the LED drivers.
+
+    Provides a log-linear (HDR-style) histogram for recording durations
+    cheaply in a hot loop, and a timer that holds each layer on for a
+    fixed dwell time using a hybrid of sleeping and spinning.
+
+    All durations are in nanoseconds, as returned by
+    ``time.perf_counter_ns``.
+"""
+
+import json
+import time
+
+
+class HdrHistogram(object):
+    """ A histogram of non-negative integer values with buckets whose
+        width grows with the value, so that every value is recorded with
+        the same relative precision.
+
+        :param str name:
+            The name of the histogram (used when formatting).
+        :param int sub_bucket_bits:
+            Values below ``2 ** sub_bucket_bits`` are recorded exactly.
+            Larger values are recorded with a relative precision of
+            ``2 ** -(sub_bucket_bits - 1)``. Default: 6 (~3%).
+    """
+
+    PERCENTILES = (50.0, 90.0, 99.0, 99.9, 100.0)
+
+    def __init__(self, name, sub_bucket_bits=6):
+        self.name = name
+        self.sub_bucket_bits = sub_bucket_bits
+        self._half = 2 ** (sub_bucket_bits - 1)
+        self.counts = [0] * ((64 - sub_bucket_bits + 2) * self._half)
+        self.reset()
+
+    def reset(self):
+        """ Remove all recorded values. """
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def bucket_index(self, value):
+        """ Return the index of the bucket that holds value. """
+        exponent = value.bit_length() - self.sub_bucket_bits
+        if exponent <= 0:
+            return value
+        return exponent * self._half + (value >> exponent)
+
+    def bucket_value(self, index):
+        """ Return the lowest value held by the bucket at index. """
+        if index < 2 * self._half:
+            return index
+        exponent = index // self._half - 1
+        return (index - exponent * self._half) << exponent
+
+    def record(self, value):
+        """ Record a value. """
+        self.counts[self.bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def mean(self):
+        """ Return the mean of the recorded values. """
+        if not self.count:
+            return 0.0
+        return float(self.total) / self.count
+
+    def percentile(self, percentile):
+        """ Return (approximately) the given percentile of the recorded
+            values.
+        """
+        if not self.count:
+            return 0
+        if percentile >= 100:
+            return self.max
+        target = max(1, self.count * percentile / 100.)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return max(min(self.bucket_value(index), self.max), self.min)
+        return self.max
+
+    def format(self, unit="us"):
+        """ Return a one-line summary of the histogram. """
+        scale = {"ns": 1., "us": 1e3, "ms": 1e6}[unit]
+        if not self.count:
+            return "{}: no values".format(self.name)
+        parts = ["{}: n={} mean={:.1f}{}".format(
+            self.name, self.count, self.mean() / scale, unit)]
+        for percentile in self.PERCENTILES:
+            parts.append("p{:g}={:.1f}".format(
+                percentile, self.percentile(percentile) / scale))
+        return " ".join(parts)
+
+    def to_dict(self):
+        """ Return the histogram as a JSON serializable dictionary. """
+        return {
+            "name": self.name,
+            "unit": "ns",
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean(),
+            "percentiles": dict(
+                ("p{:g}".format(p), self.percentile(p))
+                for p in self.PERCENTILES),
+            "buckets": [
+                [self.bucket_value(index), count]
+                for index, count in enumerate(self.counts) if count],
+        }
+
+
+class DwellTimer(object):
+    """ Hold each layer on for a fixed dwell time and record the
+        actual dwell and sweep times.
+
+        :param int dwell_ns:
+            The target time each layer is lit for, in nanoseconds. If 0,
+            layers are not held on but dwell times are still recorded.
+        :param int spin_ns:
+            Sleeping is imprecise, so the timer sleeps until this many
+            nanoseconds before the deadline and then spins. Default:
+            100000 (100 us).
+
+        Call ``.begin()`` when a layer is turned on, ``.end()`` just before
+        it is turned off and ``.sweep()`` once per complete refresh. The
+        time between ``.begin()`` and ``.end()`` (i.e. the time taken to
+        write the next layer, before any waiting) is also recorded.
+    """
+
+    def __init__(self, dwell_ns, spin_ns=100000):
+        self.dwell_ns = dwell_ns
+        self.spin_ns = spin_ns
+        self.writes = HdrHistogram("spi write")
+        self.dwells = HdrHistogram("layer dwell")
+        self.sweeps = HdrHistogram("sweep")
+        self._start = time.perf_counter_ns()
+        self._last_sweep = None
+
+    def begin(self):
+        """ Mark the start of a layer dwell. """
+        self._start = time.perf_counter_ns()
+
+    def end(self):
+        """ Wait for the end of the layer dwell and record its length. """
+        deadline = self._start + self.dwell_ns
+        now = time.perf_counter_ns()
+        self.writes.record(now - self._start)
+        remaining = deadline - now
+        if remaining > self.spin_ns:
+            time.sleep((remaining - self.spin_ns) / 1e9)
+        now = time.perf_counter_ns()
+        while now < deadline:
+            now = time.perf_counter_ns()
+        self.dwells.record(now - self._start)
+
+    def sweep(self):
+        """ Record the time since the previous complete refresh. """
+        now = time.perf_counter_ns()
+        if self._last_sweep is not None:
+            self.sweeps.record(now - self._last_sweep)
+        self._last_sweep = now
+
+    def histograms(self):
+        """ Return the list of recorded histograms. """
+        return [self.writes, self.dwells, self.sweeps]
+
+    def report(self):
+        """ Return a text report of the recorded histograms. """
+        return "\n".join(h.format() for h in self.histograms())
+
+    def export(self, path):
+        """ Write the recorded histograms to a JSON file. """
+        with open(path, "w") as f:
+            json.dump({
+                "dwell_ns": self.dwell_ns,
+                "histograms": [h.to_dict() for h in self.histograms()],
+            }, f, indent=2)
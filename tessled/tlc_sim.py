@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+
+""" A simulated chain of TLC5940 chips for running the spidev driver
+    without a Raspberry Pi.
+
+    The simulation stands in for the spidev and wiringpi modules. Bytes
+    written to the simulated SPI device are shifted into the chain's
+    shift register and decoded back into output values whenever XLAT is
+    pulsed (or, with ``xlat_on_cs``, whenever the chip-select is
+    released). Each latch of grayscale data is recorded against the
+    layer whose select output is lit, so the frame that the chain is
+    displaying can be read back and compared with the frame that was
+    sent.
+
+    The time the SPI clock takes to shift each write into the chain is
+    modelled from the configured SPI speed, and each change of a GPIO pin
+    is counted, so that the cost of a sweep on real hardware can be
+    estimated.
+"""
+
+import ctypes
+import struct
+import time
+
+import numpy as np
+
+# struct spi_ioc_transfer from linux/spi/spidev.h
+SPI_IOC_TRANSFER = struct.Struct("=QQIIHBBBBBB")
+
+
+def unpack_12bit(buf):
+    """ Unpack bytes packed by ``spidev_driver.pack_to_12bit``. """
+    b = np.frombuffer(bytes(buf), dtype=np.uint8).astype(np.uint16)
+    values = np.zeros(2 * len(b) // 3, dtype=np.uint16)
+    values[0::2] = (b[0::3] << 4) + (b[1::3] >> 4)
+    values[1::2] = ((b[1::3] % 16) << 8) + b[2::3]
+    return values
+
+
+def unpack_6bit(buf):
+    """ Unpack bytes packed by ``spidev_driver.pack_to_6bit``. """
+    b = np.frombuffer(bytes(buf), dtype=np.uint8)
+    values = np.zeros(4 * len(b) // 3, dtype=np.uint8)
+    values[0::4] = b[0::3] >> 2
+    values[1::4] = ((b[0::3] % 4) << 4) + (b[1::3] >> 4)
+    values[2::4] = ((b[1::3] % 16) << 2) + (b[2::3] >> 6)
+    values[3::4] = b[2::3] % 64
+    return values
+
+
+class SimulatedChain(object):
+    """ A simulated chain of TLC5940 chips.
+
+        :param int tlcs:
+            The number of TLC chips connected in series.
+        :param int blank:
+            The GPIO pin connected to the TLC BLANK line.
+        :param int vprg:
+            The GPIO pin connected to the TLC VPRG line.
+        :param int xlat:
+            The GPIO pin connected to the TLC XLAT line.
+        :param int dcprg:
+            The GPIO pin connected to the TLC DCPRG line.
+        :param bool inverted:
+            Whether the SPI data and GPIO signals are inverted on their
+            way to the chips. Default: True.
+        :param list layer_outputs:
+            The outputs that select each layer. Default: outputs 0-7.
+        :param list voxel_outputs:
+            The outputs that drive the voxels in a layer. Default: the
+            outputs from 16 onwards.
+        :param bool wait:
+            Whether each SPI write should take (at least) as long as
+            the modelled SPI clock time. Default: False.
+
+        When exactly one layer select output is on after a latch, the
+        voxel outputs are recorded as that layer's values (see
+        ``.frame()``).
+    """
+
+    SPIN_SECONDS = 100e-6
+
+    def __init__(self, tlcs, blank, vprg, xlat, dcprg, inverted=True,
+                 layer_outputs=None, voxel_outputs=None, wait=False):
+        self.n_tlcs = tlcs
+        self.n_outputs = 16 * tlcs
+        self.blank = blank
+        self.vprg = vprg
+        self.xlat = xlat
+        self.dcprg = dcprg
+        self.inverted = inverted
+        if layer_outputs is None:
+            layer_outputs = range(8)
+        if voxel_outputs is None:
+            voxel_outputs = range(16, self.n_outputs)
+        self.layer_outputs = np.array(layer_outputs, dtype=np.intp)
+        self.voxel_outputs = np.array(voxel_outputs, dtype=np.intp)
+        self.wait = wait
+        self.xlat_on_cs = False
+        self.speed_hz = 500000
+        self.register = bytearray(3 * self.n_outputs // 2)
+        self.pins = {}
+        self.record_latched = False
+        self.reset()
+
+    def reset(self):
+        """ Reset the outputs and all of the recorded statistics. """
+        self.gs = np.zeros(self.n_outputs, dtype=np.uint16)
+        self.dc = np.zeros(self.n_outputs, dtype=np.uint8)
+        self.layers = np.zeros(
+            (len(self.layer_outputs), len(self.voxel_outputs)),
+            dtype=np.uint16)
+        self.latched = []
+        self.bytes_written = 0
+        self.writes = 0
+        self.ioctls = 0
+        self.spi_seconds = 0.0
+        self.gpio_writes = 0
+        self.toggles = {}
+        self._busy_until = 0.0
+
+    def level(self, pin):
+        """ Return the level of a TLC input pin (as seen by the chip).
+            Pins start low.
+        """
+        return self.pins.get(pin, 0)
+
+    def pin_write(self, pin, value):
+        """ Record a GPIO write and latch data on a rising XLAT edge. """
+        self.gpio_writes += 1
+        level = int(bool(value) != self.inverted)
+        previous = self.level(pin)
+        self.pins[pin] = level
+        if previous != level:
+            self.toggles[pin] = self.toggles.get(pin, 0) + 1
+        if pin == self.xlat and level and not previous:
+            self.latch()
+
+    def spi_write(self, data, speed_hz=None):
+        """ Shift bytes into the chain, modelling the SPI clock time. """
+        data = np.frombuffer(bytes(data), dtype=np.uint8)
+        if self.inverted:
+            data = np.bitwise_not(data)
+        n = len(self.register)
+        self.register = (self.register + bytearray(data.tobytes()))[-n:]
+        self.writes += 1
+        self.bytes_written += len(data)
+        seconds = 8. * len(data) / (speed_hz or self.speed_hz)
+        self.spi_seconds += seconds
+        if self.wait:
+            # sleep (releasing the GIL for other chains) and then spin
+            now = time.perf_counter()
+            deadline = max(now, self._busy_until) + seconds
+            if deadline - now > 2 * self.SPIN_SECONDS:
+                time.sleep(deadline - now - self.SPIN_SECONDS)
+            while now < deadline:
+                now = time.perf_counter()
+            self._busy_until = deadline
+
+    def spi_ioctl(self, request, arg):
+        """ Perform the transfers in an SPI_IOC_MESSAGE ioctl. """
+        self.ioctls += 1
+        size = (request >> 16) & 0x3fff
+        for offset in range(0, size, SPI_IOC_TRANSFER.size):
+            (tx_buf, _, length, speed_hz, delay_usecs, _, cs_change,
+             _, _, _, _) = SPI_IOC_TRANSFER.unpack_from(arg, offset)
+            self.spi_write(ctypes.string_at(tx_buf, length), speed_hz)
+            self.spi_seconds += delay_usecs / 1e6
+            last = offset + SPI_IOC_TRANSFER.size >= size
+            if self.xlat_on_cs and (cs_change or last):
+                self.latch()
+        return 0
+
+    def latch(self):
+        """ Latch the shift register into the grayscale or DC registers.
+        """
+        if self.level(self.vprg):
+            n = 3 * self.n_outputs // 4
+            self.dc[:] = unpack_6bit(self.register[-n:])[::-1]
+            return
+        self.gs[:] = unpack_12bit(self.register)[::-1]
+        if self.record_latched:
+            self.latched.append(self.gs.copy())
+        lit = np.flatnonzero(self.gs[self.layer_outputs])
+        if len(lit) == 1:
+            self.layers[lit[0]] = self.gs[self.voxel_outputs]
+
+    def frame(self, shape=None):
+        """ Return the most recently latched values for each layer.
+
+            :param tuple shape:
+                The shape to return the values in. Default: (layers,
+                voxels per layer).
+        """
+        if shape is None:
+            return self.layers.copy()
+        return self.layers.reshape(shape).copy()
+
+    def stats(self):
+        """ Return a dictionary of the recorded statistics. """
+        return {
+            "writes": self.writes,
+            "ioctls": self.ioctls,
+            "bytes_written": self.bytes_written,
+            "spi_seconds": self.spi_seconds,
+            "gpio_writes": self.gpio_writes,
+            "gpio_toggles": sum(self.toggles.values()),
+        }
+
+    def stats_text(self):
+        """ Return a summary of the recorded statistics. """
+        return (
+            "Simulated TLCs: {writes} SPI writes in {ioctls} ioctls,"
+            " {bytes_written} bytes, {spi_seconds:.3f}s SPI clock,"
+            " {gpio_toggles} GPIO toggles".format(**self.stats()))
+
+
+class SimulatedSpiDev(object):
+    """ A simulated spidev.SpiDev connected to a SimulatedChain. """
+
+    FD = -2
+
+    def __init__(self, chain):
+        self.chain = chain
+        self.mode = 0
+        self.bus = None
+        self.device = None
+
+    def open(self, bus, device):
+        self.bus = bus
+        self.device = device
+
+    def fileno(self):
+        return self.FD
+
+    @property
+    def max_speed_hz(self):
+        return self.chain.speed_hz
+
+    @max_speed_hz.setter
+    def max_speed_hz(self, speed_hz):
+        self.chain.speed_hz = speed_hz
+
+
+class SimulatedGPIO(object):
+    """ A simulated wiringpi.GPIO connected to a SimulatedChain. """
+
+    OUTPUT = 1
+    HIGH = 1
+    LOW = 0
+
+    def __init__(self, chain):
+        self.chain = chain
+        self.chains = [chain]
+        self.pin_modes = {}
+
+    def share(self, other):
+        """ Also drive the chain connected to another SimulatedGPIO (i.e.
+            simulate chains whose GPIO lines are wired together).
+        """
+        self.chains.append(other.chain)
+
+    def pinMode(self, pin, mode):
+        self.pin_modes[pin] = mode
+
+    def digitalWrite(self, pin, value):
+        for chain in self.chains:
+            chain.pin_write(pin, value)
+
+
+class SimBackend(object):
+    """ Driver backend that writes to a SimulatedChain.
+
+        :param bool xlat_on_cs:
+            Whether XLAT and BLANK are wired to the SPI chip-select.
+            Default: False.
+        :param bool wait:
+            Whether SPI writes take as long as they would on the real
+            chain. Default: False.
+        :param topology.Chain chain:
+            The layer select and voxel outputs of the chain. Default: the
+            Tesseract's.
+
+        The chain itself is created when TLCs are connected to the
+        backend and is available as ``.chain``.
+    """
+
+    name = "sim"
+
+    def __init__(self, xlat_on_cs=False, wait=False, chain=None):
+        self.xlat_on_cs = xlat_on_cs
+        self.wait = wait
+        self.topology_chain = chain
+        self.chain = None
+
+    def connect(self, tlcs):
+        """ Create the simulated chain for a TLCs object. """
+        layer_outputs = voxel_outputs = None
+        if self.topology_chain is not None:
+            layer_outputs = self.topology_chain.layer_outputs or []
+            voxel_outputs = self.topology_chain.voxel_outputs
+        self.chain = SimulatedChain(
+            tlcs.n_tlcs, tlcs.blank, tlcs.vprg, tlcs.xlat, tlcs.dcprg,
+            inverted=tlcs.inverted, layer_outputs=layer_outputs,
+            voxel_outputs=voxel_outputs, wait=self.wait)
+        self.chain.xlat_on_cs = self.xlat_on_cs
+        return SimulatedSpiDev(self.chain), SimulatedGPIO(self.chain)
+
+    def write(self, fd, data):
+        self.chain.spi_write(data)
+        return len(data)
+
+    def ioctl(self, fd, request, arg):
+        return self.chain.spi_ioctl(request, arg)
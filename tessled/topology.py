@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+""" Descriptions of how a cube's LEDs are wired to chains of TLC chips.
+
+    A cube is driven one layer at a time. Each chain of TLCs is connected
+    to its own SPI device and drives some of the voxels in every layer
+    (through the ground lines) and, optionally, the layer select lines.
+    All chains share the BLANK, XLAT, VPRG and DCPRG lines so that every
+    chain latches each layer at the same time.
+
+    A topology file is a JSON object such as::
+
+        {
+            "frame_shape": [16, 16, 16],
+            "chains": [
+                {"chips": 5, "spibus": 0, "spidevice": 0,
+                 "layer_outputs": {"start": 0, "count": 16},
+                 "voxels": {"start": 0, "count": 64},
+                 "voxel_outputs": {"start": 16}},
+                {"chips": 4, "spibus": 0, "spidevice": 1,
+                 "voxels": {"start": 64, "count": 64},
+                 "voxel_outputs": {"start": 0}},
+                ...
+            ]
+        }
+
+    ``voxels`` are indices into a layer of the frame (in ravel order) and
+    ``voxel_outputs`` are the TLC outputs that drive them (in the same
+    order). ``layer_outputs`` are the outputs that select each layer.
+    Each may be a list of integers or a ``{"start": ..., "count": ...}``
+    range (``voxel_outputs`` takes its count from ``voxels``).
+
+    Packing is fastest when a chain's voxel outputs are the consecutive
+    outputs at the end of the chain (as in the default Tesseract
+    topology), since packing lookup tables can then be used.
+"""
+
+import json
+
+import numpy as np
+
+from . import frame_utils
+
+
+class TopologyError(ValueError):
+    """ Raised when a topology is invalid. """
+
+
+class Chain(object):
+    """ One chain of TLCs connected to an SPI device.
+
+        :param int chips:
+            The number of TLC chips in the chain.
+        :param list voxels:
+            The indices (within a layer, in ravel order) of the voxels
+            driven by the chain.
+        :param list voxel_outputs:
+            The TLC output that drives each voxel.
+        :param list layer_outputs:
+            The TLC output that selects each layer or None if the chain
+            does not drive the layer select lines. Default: None.
+        :param int spibus:
+            The SPI bus number. Default: 0.
+        :param int spidevice:
+            The SPI device number. Default: 0.
+    """
+
+    def __init__(self, chips, voxels, voxel_outputs, layer_outputs=None,
+                 spibus=0, spidevice=0):
+        self.chips = chips
+        self.n_outputs = 16 * chips
+        self.voxels = np.asarray(voxels, dtype=np.intp)
+        self.voxel_outputs = np.asarray(voxel_outputs, dtype=np.intp)
+        self.layer_outputs = (
+            None if layer_outputs is None else list(layer_outputs))
+        self.spibus = spibus
+        self.spidevice = spidevice
+
+    def voxel_block(self):
+        """ Return the (start, stop) outputs of the voxels if they are
+            driven by consecutive outputs in voxel order, else None.
+        """
+        if not len(self.voxel_outputs):
+            return None
+        start = int(self.voxel_outputs[0])
+        stop = start + len(self.voxel_outputs)
+        if not np.array_equal(self.voxel_outputs, np.arange(start, stop)):
+            return None
+        return start, stop
+
+    def validate(self, layers, voxels_per_layer):
+        """ Check that the chain's outputs are consistent. """
+        name = "chain on SPI {}.{}".format(self.spibus, self.spidevice)
+        if len(self.voxels) != len(self.voxel_outputs):
+            raise TopologyError(
+                "{}: {} voxels but {} voxel outputs".format(
+                    name, len(self.voxels), len(self.voxel_outputs)))
+        if len(self.voxels) and not (
+                0 <= self.voxels.min() and
+                self.voxels.max() < voxels_per_layer):
+            raise TopologyError(
+                "{}: voxels must be in the range 0-{}".format(
+                    name, voxels_per_layer - 1))
+        outputs = list(self.voxel_outputs)
+        if self.layer_outputs is not None:
+            if len(self.layer_outputs) != layers:
+                raise TopologyError(
+                    "{}: {} layer outputs for {} layers".format(
+                        name, len(self.layer_outputs), layers))
+            outputs += self.layer_outputs
+        if outputs and not (
+                0 <= min(outputs) and max(outputs) < self.n_outputs):
+            raise TopologyError(
+                "{}: outputs must be in the range 0-{}".format(
+                    name, self.n_outputs - 1))
+        if len(set(outputs)) != len(outputs):
+            raise TopologyError("{}: outputs used twice".format(name))
+
+
+class Topology(object):
+    """ The wiring of a cube to one or more chains of TLCs.
+
+        :param tuple frame_shape:
+            The shape of the frames displayed (layers, rows, columns).
+        :param list chains:
+            The Chains that drive the cube.
+    """
+
+    def __init__(self, frame_shape, chains):
+        self.frame_shape = tuple(frame_shape)
+        self.layers = self.frame_shape[0]
+        self.voxels_per_layer = int(np.prod(self.frame_shape[1:]))
+        self.chains = list(chains)
+
+    def validate(self):
+        """ Check that every voxel and layer is driven exactly once. """
+        if not self.chains:
+            raise TopologyError("A topology needs at least one chain.")
+        for chain in self.chains:
+            chain.validate(self.layers, self.voxels_per_layer)
+        voxels = np.concatenate([chain.voxels for chain in self.chains])
+        if not np.array_equal(
+                np.sort(voxels), np.arange(self.voxels_per_layer)):
+            raise TopologyError(
+                "Every voxel in a layer must be driven by exactly one"
+                " chain output.")
+        if not any(c.layer_outputs is not None for c in self.chains):
+            raise TopologyError("No chain drives the layer select lines.")
+        devices = [(c.spibus, c.spidevice) for c in self.chains]
+        if len(set(devices)) != len(devices):
+            raise TopologyError("Each chain needs its own SPI device.")
+        return self
+
+
+def default_topology(chips=5, frame_shape=frame_utils.FRAME_SHAPE):
+    """ Return the topology of the Tesseract: a single chain with the
+        layer select lines on the first outputs and the voxels of each
+        layer on the outputs from 16 onwards.
+    """
+    layers = frame_shape[0]
+    n_voxels = int(np.prod(frame_shape[1:]))
+    chain = Chain(
+        chips, voxels=np.arange(n_voxels),
+        voxel_outputs=np.arange(16, 16 + n_voxels),
+        layer_outputs=range(layers))
+    return Topology(frame_shape, [chain]).validate()
+
+
+def _indices(value, count=None):
+    """ Return a list of indices from a list or a start/count range. """
+    if isinstance(value, dict):
+        count = value.get("count", count)
+        if "start" not in value or count is None:
+            raise TopologyError(
+                "Ranges need a start and a count: {!r}".format(value))
+        return list(range(value["start"], value["start"] + count))
+    if not isinstance(value, list) or not all(
+            isinstance(v, int) for v in value):
+        raise TopologyError("Expected a list of integers: {!r}".format(value))
+    return value
+
+
+def parse_topology(data):
+    """ Return the Topology described by a dictionary (see the module
+        documentation for the format).
+    """
+    try:
+        frame_shape = data.get("frame_shape", frame_utils.FRAME_SHAPE)
+        chains = []
+        for chain in data["chains"]:
+            voxels = _indices(chain["voxels"])
+            layer_outputs = chain.get("layer_outputs")
+            if layer_outputs is not None:
+                layer_outputs = _indices(layer_outputs, frame_shape[0])
+            chains.append(Chain(
+                chain["chips"], voxels,
+                _indices(chain["voxel_outputs"], len(voxels)),
+                layer_outputs=layer_outputs,
+                spibus=chain.get("spibus", 0),
+                spidevice=chain.get("spidevice", 0)))
+    except (KeyError, TypeError, AttributeError) as err:
+        raise TopologyError("Invalid topology: {!r}".format(err))
+    return Topology(frame_shape, chains).validate()
+
+
+def load_topology(path):
+    """ Load a topology from a JSON file. """
+    with open(path) as f:
+        try:
+            data = json.load(f)
+        except ValueError as err:
+            raise TopologyError("{}: {}".format(path, err))
+    return parse_topology(data)
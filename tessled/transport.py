@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+
+""" Frame transports between the effectbox and the drivers.
+
+    Frame addresses are either ZeroMQ addresses (e.g.
+    ``tcp://127.0.0.1:5556``), which work across machines, or
+    ``shm://<name>`` addresses, which use a ring of frame slots in a
+    memory mapped file (``/dev/shm/<name>``, or an absolute path, e.g.
+    ``shm:///tmp/frames``) and so only work between processes on the same
+    machine.
+
+    With shared memory each frame is copied once into its slot by the
+    publisher and is read in place by the subscriber, with no system calls
+    per frame.
+
+    The ring file starts with a header::
+
+        magic (4 bytes), version (uint32), slots (uint32),
+        slot size (uint32), frame size (uint32), padding (uint32),
+        latest sequence number (uint64)
+
+    followed by the slots. Each slot starts with the sequence number of
+    the frame it holds (uint64, 0 while it is being written), followed by
+    the frame's message. Frame ``n`` is written to slot ``n % slots``. A
+    subscriber checks the slot's sequence number both before and after
+    using a frame to detect frames overwritten while being read.
+
+    Frames are wrapped in envelopes (see ``tessled.envelope``) carrying
+    their sequence number and render and display times.
+
+    Publishers have a ``.publish(frame, display_at=None)`` method.
+    Subscribers have ``.poll(timeout)``, which waits up to ``timeout``
+    milliseconds for a frame, ``.recv_nowait()``, which returns the next
+    message (oldest first) or None, and ``.overwritten()``, which returns
+    True if the last message returned has since been overwritten.
+"""
+
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+import zmq
+
+from . import envelope
+from . import frame_codec
+
+SHM_PREFIX = "shm://"
+SHM_DIR = "/dev/shm"
+SHM_MAGIC = b"TSCF"
+SHM_VERSION = 1
+SHM_HEADER = struct.Struct("=4sIIIIIQ")
+SHM_SLOT_HEADER = 8
+SHM_SLOTS = 8
+
+# offset of the latest sequence number in the header (in uint64 words)
+_LATEST = (SHM_HEADER.size - 8) // 8
+
+
+def shm_path(addr):
+    """ Return the file for a shm:// address, or None if the address is
+        not a shared memory one.
+    """
+    if not addr.startswith(SHM_PREFIX):
+        return None
+    path = addr[len(SHM_PREFIX):]
+    if not path.startswith("/"):
+        path = os.path.join(SHM_DIR, path)
+    return path
+
+
+class ShmRing(object):
+    """ A memory mapped ring of frame slots.
+
+        :param str path:
+            The file holding the ring.
+        :param int frame_size:
+            The size of each frame message in bytes. If given, the file is
+            created (or replaced) with this frame size. Otherwise the
+            ring is read from an existing file.
+        :param int slots:
+            The number of slots when creating the ring. Default: 8.
+    """
+
+    def __init__(self, path, frame_size=None, slots=SHM_SLOTS):
+        self.path = path
+        if frame_size is not None:
+            self._create(frame_size, slots)
+        fd = os.open(path, os.O_RDWR)
+        try:
+            stat = os.fstat(fd)
+            size = stat.st_size
+            self.inode = stat.st_ino
+            if size < SHM_HEADER.size:
+                raise ValueError("{}: not a frame ring".format(path))
+            self._mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        (magic, version, self.slots, self.slot_size, self.frame_size,
+         _, _) = SHM_HEADER.unpack_from(self._mmap)
+        if magic != SHM_MAGIC or version != SHM_VERSION or (
+                size < SHM_HEADER.size + self.slots * self.slot_size):
+            self._mmap.close()
+            raise ValueError("{}: not a frame ring".format(path))
+        self.words = memoryview(self._mmap).cast("Q")
+
+    def _create(self, frame_size, slots):
+        # round slots up to whole uint64 words
+        slot_size = SHM_SLOT_HEADER + 8 * ((frame_size + 7) // 8)
+        tmp_path = "{}.tmp".format(self.path)
+        with open(tmp_path, "wb") as f:
+            f.write(SHM_HEADER.pack(
+                SHM_MAGIC, SHM_VERSION, slots, slot_size, frame_size, 0, 0))
+            f.truncate(SHM_HEADER.size + slots * slot_size)
+        os.rename(tmp_path, self.path)
+
+    def close(self):
+        self.words.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # frames are still in use; the mapping is released with them
+            pass
+
+    @property
+    def latest(self):
+        """ The sequence number of the most recently published frame. """
+        return self.words[_LATEST]
+
+    def slot_seq(self, seq):
+        """ Return the sequence number stored in the slot for frame seq. """
+        return self.words[
+            (SHM_HEADER.size + (seq % self.slots) * self.slot_size) // 8]
+
+    def frame_view(self, seq, shape=None, dtype=np.uint8):
+        """ Return a numpy array viewing the slot for frame seq. """
+        offset = (
+            SHM_HEADER.size + (seq % self.slots) * self.slot_size +
+            SHM_SLOT_HEADER)
+        view = np.frombuffer(
+            self._mmap, dtype=np.uint8, count=self.frame_size, offset=offset)
+        if shape is not None:
+            view = view.view(dtype).reshape(shape)
+        return view
+
+    def begin_write(self, seq):
+        """ Mark the slot for frame seq as being written. """
+        self.words[
+            (SHM_HEADER.size + (seq % self.slots) * self.slot_size) // 8] = 0
+
+    def end_write(self, seq):
+        """ Mark frame seq as written and publish it. """
+        self.words[
+            (SHM_HEADER.size + (seq % self.slots) * self.slot_size) // 8] = seq
+        self.words[_LATEST] = seq
+
+
+class ShmPublisher(object):
+    """ Publish frames to a shared memory ring.
+
+        :param str path:
+            The file to create the ring in.
+        :param tuple frame_shape:
+            The shape of the frames.
+        :param dtype:
+            The numpy dtype of the frames. Default: numpy.uint8.
+        :param int slots:
+            The number of frame slots. Default: 8.
+    """
+
+    def __init__(self, path, frame_shape, dtype=np.uint8, slots=SHM_SLOTS):
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.ring = ShmRing(
+            path, frame_size=envelope.message_size(frame_shape, dtype),
+            slots=slots)
+        self.seq = self.ring.latest
+        self._messages = [
+            self.ring.frame_view(seq) for seq in range(slots)]
+        self._slots = [
+            message[envelope.ENVELOPE_HEADER.size:].view(
+                self.dtype).reshape(self.frame_shape)
+            for message in self._messages]
+
+    def next_slot(self):
+        """ Return the array that the next frame will be published from, so
+            that frames can be rendered straight into it.
+        """
+        return self._slots[(self.seq + 1) % self.ring.slots]
+
+    def publish(self, frame, display_at=None):
+        """ Copy a frame into the next slot (unless it was rendered there)
+            and publish it.
+
+            :param numpy.ndarray frame:
+                The frame to publish.
+            :param float display_at:
+                When the frame should be displayed. Default: None (now).
+        """
+        seq = self.seq + 1
+        index = seq % self.ring.slots
+        slot = self._slots[index]
+        rendered_at = time.time()
+        self.ring.begin_write(seq)
+        envelope.pack_header(
+            self._messages[index], seq, rendered_at,
+            rendered_at if display_at is None else display_at,
+            self.frame_shape, self.dtype)
+        if frame is not slot:
+            np.copyto(slot, frame)
+        self.ring.end_write(seq)
+        self.seq = seq
+
+    def close(self):
+        self._messages = self._slots = []
+        self.ring.close()
+
+
+class ShmSubscriber(object):
+    """ Receive frames from a shared memory ring.
+
+        :param str path:
+            The file holding the ring. It need not exist yet.
+        :param float poll_interval:
+            Seconds to sleep between checks for new frames in ``.poll()``.
+            Default: 0.001.
+
+        Frames are returned as read-only memoryviews of their slot (which
+        are only valid until the slot is reused, see ``.overwritten()``).
+        If the subscriber falls more than a ring's worth of frames behind,
+        the frames it missed are counted in ``.frames_lost``. If the
+        publisher restarts (replacing the ring), the subscriber switches
+        to the new ring the next time ``.poll()`` times out.
+    """
+
+    def __init__(self, path, poll_interval=0.001):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.ring = None
+        self.seq = None
+        self.frames_lost = 0
+        self._returned = None
+
+    def _attach(self, from_start=False):
+        if self.ring is None:
+            try:
+                self.ring = ShmRing(self.path)
+            except (IOError, OSError, ValueError):
+                return False
+            self.seq = 0 if from_start else self.ring.latest
+            self._views = [
+                memoryview(self.ring.frame_view(seq)).toreadonly()
+                for seq in range(self.ring.slots)]
+        return True
+
+    def poll(self, timeout):
+        """ Wait up to timeout milliseconds for a frame to be available. """
+        deadline = time.time() + timeout / 1000.
+        while True:
+            if self._attach() and self.ring.latest > self.seq:
+                return True
+            if time.time() >= deadline:
+                if self._replaced():
+                    self.close()
+                    return self._attach(from_start=True) and (
+                        self.ring.latest > self.seq)
+                return False
+            time.sleep(self.poll_interval)
+
+    def _replaced(self):
+        """ Return True if the ring file has been replaced. """
+        if self.ring is None:
+            return False
+        try:
+            return os.stat(self.path).st_ino != self.ring.inode
+        except OSError:
+            return False
+
+    def recv_nowait(self):
+        """ Return the next unread frame or None if there isn't one. """
+        if not self._attach():
+            return None
+        ring = self.ring
+        latest = ring.latest
+        if latest <= self.seq:
+            return None
+        seq = max(self.seq + 1, latest - ring.slots + 1)
+        self.frames_lost += seq - self.seq - 1
+        self.seq = seq
+        if ring.slot_seq(seq) != seq:
+            # overwritten before it could be read
+            self.frames_lost += 1
+            return self.recv_nowait()
+        self._returned = seq
+        return self._views[seq % ring.slots]
+
+    def overwritten(self):
+        """ Return True if the last frame returned has been overwritten. """
+        seq = self._returned
+        return seq is not None and self.ring.slot_seq(seq) != seq
+
+    def close(self):
+        if self.ring is not None:
+            self._views = []
+            self.ring.close()
+            self.ring = None
+            self._returned = None
+
+
+class ZmqPublisher(object):
+    """ Publish frames on a ZeroMQ PUB socket bound to addr.
+
+        :param zmq.Context context:
+            The ZeroMQ context.
+        :param str addr:
+            The address to bind to.
+        :param tuple frame_shape:
+            The shape of the frames.
+        :param dtype:
+            The numpy dtype of the frames. Default: numpy.uint8.
+        :param str encoding:
+            How to encode frames: "raw", "rle" or "delta" (see
+            tessled.frame_codec). Default: "raw".
+        :param int keyframe_interval:
+            Frames between keyframes with the "delta" encoding. Default: 30.
+    """
+
+    def __init__(self, context, addr, frame_shape, dtype=np.uint8,
+                 encoding="raw", keyframe_interval=30):
+        self.socket = context.socket(zmq.PUB)
+        self.socket.bind(addr)
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.seq = 0
+        self.encoder = None
+        if encoding != "raw":
+            self.encoder = frame_codec.FrameEncoder(
+                frame_shape, dtype, encoding, keyframe_interval)
+        self.bytes_sent = 0
+        self._message = bytearray(envelope.message_size(frame_shape, dtype))
+        self._frame = np.frombuffer(
+            self._message, dtype=self.dtype,
+            offset=envelope.ENVELOPE_HEADER.size).reshape(self.frame_shape)
+
+    def next_slot(self):
+        """ Return the array that the next frame will be published from. """
+        return self._frame
+
+    def publish(self, frame, display_at=None):
+        """ Publish a frame (see ShmPublisher.publish). """
+        self.seq += 1
+        rendered_at = time.time()
+        if display_at is None:
+            display_at = rendered_at
+        if self.encoder is not None:
+            encoding, payload = self.encoder.encode(frame)
+            envelope.pack_header(
+                self._message, self.seq, rendered_at, display_at,
+                self.frame_shape, self.dtype, encoding)
+            message = self._message[:envelope.ENVELOPE_HEADER.size] + payload
+        else:
+            envelope.pack_header(
+                self._message, self.seq, rendered_at, display_at,
+                self.frame_shape, self.dtype)
+            if frame is not self._frame:
+                np.copyto(self._frame, frame)
+            message = self._message
+        self.socket.send(message)
+        self.bytes_sent += len(message)
+
+    def close(self):
+        self.socket.close()
+
+
+class ZmqSubscriber(object):
+    """ Receive frames from a ZeroMQ socket.
+
+        :param zmq.Socket socket:
+            A connected SUB (or PAIR) socket.
+    """
+
+    def __init__(self, socket):
+        self.socket = socket
+
+    def poll(self, timeout):
+        return bool(self.socket.poll(timeout, zmq.POLLIN))
+
+    def recv_nowait(self):
+        try:
+            return self.socket.recv(flags=zmq.NOBLOCK)
+        except zmq.ZMQError as err:
+            if err.errno != zmq.EAGAIN:
+                raise
+            return None
+
+    def overwritten(self):
+        # received messages are owned by the subscriber
+        return False
+
+    def close(self):
+        self.socket.close()
+
+
+def open_publisher(addr, frame_shape, dtype=np.uint8, context=None,
+                   encoding="raw", keyframe_interval=30):
+    """ Return a publisher for a frame address. Frames sent over shared
+        memory are never encoded.
+    """
+    path = shm_path(addr)
+    if path is not None:
+        return ShmPublisher(path, frame_shape, dtype)
+    if context is None:
+        context = zmq.Context.instance()
+    return ZmqPublisher(
+        context, addr, frame_shape, dtype, encoding, keyframe_interval)
+
+
+def open_subscriber(addr, context=None):
+    """ Return a subscriber for a frame address. """
+    path = shm_path(addr)
+    if path is not None:
+        return ShmSubscriber(path)
+    if context is None:
+        context = zmq.Context.instance()
+    socket = context.socket(zmq.SUB)
+    socket.connect(addr)
+    socket.setsockopt_string(zmq.SUBSCRIBE, u"")  # receive everything
+    return ZmqSubscriber(socket)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+""" Tuning profiles for the spidev driver.
+
+    Faster SPI writes render each layer sooner but the LEDs are only lit
+    while the SPI clock is running (it also drives the TLC grayscale
+    clock), so the best SPI speed, layer dwell time and batching depend
+    on the Pi and the wiring. ``tesseract-spidev-driver tune`` measures
+    the refresh rate and lit duty cycle for combinations of these and
+    saves the best to a profile file, which the driver loads at startup.
+
+    A profile is a JSON object such as::
+
+        {
+            "spispeed": 976562,
+            "layer_dwell_us": 0,
+            "spi_batch": 8,
+            "measured": {"refreshes_per_second": 124.1, "duty_cycle": 0.97}
+        }
+
+    Only the keys in ``PROFILE_OPTIONS`` are applied to the driver.
+"""
+
+import itertools
+import json
+import os
+import time
+
+from .driver_stats import write_json_atomic
+from .timing import DwellTimer
+
+DEFAULT_PROFILE = os.path.join("~", ".config", "tessled", "spidev-driver.json")
+
+PROFILE_OPTIONS = ("spispeed", "layer_dwell_us", "spi_batch")
+
+
+class ProfileError(ValueError):
+    """ Raised when a profile file is invalid. """
+
+
+def load_profile(path):
+    """ Load a tuning profile.
+
+        :param str path:
+            The profile file to read.
+
+        :return dict:
+            The driver options from the profile, or an empty dictionary
+            if the file does not exist.
+    """
+    path = os.path.expanduser(path)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        try:
+            profile = json.load(f)
+        except ValueError as err:
+            raise ProfileError("{}: invalid profile: {}".format(path, err))
+    if not isinstance(profile, dict):
+        raise ProfileError("{}: profile is not a JSON object".format(path))
+    options = {}
+    for name in PROFILE_OPTIONS:
+        if name not in profile:
+            continue
+        if not isinstance(profile[name], int) or profile[name] < 0:
+            raise ProfileError("{}: {} must be a non-negative integer".format(
+                path, name))
+        options[name] = profile[name]
+    return options
+
+
+def save_profile(path, result):
+    """ Save a tuning result (see ``measure``) as a profile.
+
+        :param str path:
+            The profile file to write.
+        :param dict result:
+            The settings and measurements to save.
+    """
+    path = os.path.expanduser(path)
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    profile = dict((name, result[name]) for name in PROFILE_OPTIONS)
+    profile["measured"] = {
+        "refreshes_per_second": result["refreshes_per_second"],
+        "duty_cycle": result["duty_cycle"],
+    }
+    write_json_atomic(path, profile)
+
+
+def candidates(spispeeds, layer_dwells_us, spi_batches):
+    """ Return every combination of settings to try. """
+    return [
+        {"spispeed": spispeed, "layer_dwell_us": dwell_us, "spi_batch": batch}
+        for spispeed, dwell_us, batch in itertools.product(
+            spispeeds, layer_dwells_us, spi_batches)]
+
+
+def measure(write_refresh, layer_dwell_us, seconds, lit_ns_per_refresh=None):
+    """ Measure the refresh rate and lit duty cycle for one setting.
+
+        :param function write_refresh:
+            Function that writes one complete refresh. It is called with
+            a DwellTimer to hold each layer for.
+        :param int layer_dwell_us:
+            The target layer dwell time in microseconds.
+        :param float seconds:
+            How long to measure for.
+        :param float lit_ns_per_refresh:
+            The time layers are lit for per refresh, if it cannot be
+            measured by the DwellTimer (e.g. when layers are latched by
+            the SPI chip-select). Default: None (use the measured dwell
+            times).
+
+        :return dict:
+            The refresh rate and the fraction of the time that layers were
+            lit (i.e. that BLANK was low).
+    """
+    dwell = DwellTimer(layer_dwell_us * 1000)
+    refreshes = 0
+    start = time.perf_counter_ns()
+    deadline = start + int(seconds * 1e9)
+    now = start
+    while now < deadline:
+        write_refresh(dwell)
+        refreshes += 1
+        now = time.perf_counter_ns()
+    elapsed = now - start
+    if lit_ns_per_refresh is None:
+        lit_ns = dwell.dwells.total
+    else:
+        lit_ns = refreshes * lit_ns_per_refresh
+    return {
+        "refreshes_per_second": refreshes * 1e9 / elapsed,
+        "duty_cycle": min(float(lit_ns) / elapsed, 1.0),
+    }
+
+
+def choose_best(results, min_refresh_rate):
+    """ Choose the best tuning result.
+
+        :param list results:
+            Dictionaries of settings and their measurements.
+        :param float min_refresh_rate:
+            The lowest acceptable refresh rate (to avoid visible flicker).
+
+        :return dict:
+            The result with the highest lit duty cycle (i.e. brightness)
+            out of those that refresh fast enough, or the fastest result
+            if none do. Duty cycles within a percent of each other are
+            treated as equal and the faster result is chosen.
+    """
+    fast_enough = [
+        r for r in results if r["refreshes_per_second"] >= min_refresh_rate]
+    if fast_enough:
+        return max(fast_enough, key=lambda r: (
+            round(r["duty_cycle"], 2), r["refreshes_per_second"]))
+    return max(results, key=lambda r: r["refreshes_per_second"])
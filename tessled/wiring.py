@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+""" Wiring maps: which virtual voxel each physical voxel of a cube shows.
+
+    The built in tesseract types (see frame_utils.FrameConstants) only
+    flip axes. A wiring file describes any other layout, e.g. a cube with
+    a few LEDs soldered to the wrong wires, as a JSON object such as::
+
+        {
+            "frame_shape": [8, 8, 8],
+            "base": "tesseract",
+            "swap": [
+                [[0, 3, 4], [0, 3, 5]],
+                [17, 18]
+            ]
+        }
+
+    ``base`` is the tesseract type to start from (default: "simulator",
+    i.e. physical frames are laid out like virtual ones). ``swap`` lists
+    pairs of physical voxels whose wires are crossed, each given as
+    ``[layer, row, column]`` or as an index into the flattened frame.
+    Alternatively, ``map`` lists the virtual voxel (as an index into the
+    flattened frame) shown by every physical voxel, in ravel order, and
+    replaces ``base``.
+
+    However it is described, a wiring compiles to a single flat index
+    array, so converting a frame is one gather (see frame_utils.FrameMapper).
+"""
+
+import hashlib
+import json
+
+import numpy as np
+
+from . import frame_utils
+
+
+class WiringError(ValueError):
+    """ Raised when a wiring map is invalid. """
+
+
+class Wiring(object):
+    """ A wiring map.
+
+        :param tuple frame_shape:
+            The shape of the frames.
+        :param numpy.ndarray index:
+            The index (into the flattened virtual frame) of the voxel
+            shown by each physical voxel.
+        :param str name:
+            A name for the wiring, e.g. the file it was loaded from.
+            Default: "wiring".
+    """
+
+    def __init__(self, frame_shape, index, name="wiring"):
+        self.frame_shape = tuple(frame_shape)
+        self.index = np.asarray(index, dtype=np.intp)
+        self.name = name
+
+    def validate(self):
+        """ Check that every virtual voxel is shown exactly once. """
+        n_voxels = int(np.prod(self.frame_shape))
+        if self.index.shape != (n_voxels,) or not np.array_equal(
+                np.sort(self.index), np.arange(n_voxels)):
+            raise WiringError(
+                "{}: a wiring must show each of the {} voxels exactly"
+                " once.".format(self.name, n_voxels))
+        return self
+
+    def digest(self):
+        """ Return a hash of the wiring, e.g. for cache keys. """
+        return hashlib.sha256(
+            json.dumps(list(self.frame_shape)).encode("utf-8") +
+            self.index.astype("<i8").tobytes()).hexdigest()
+
+
+def _voxel(value, frame_shape):
+    """ Return the flat index of a voxel given as an index or coordinates.
+    """
+    if isinstance(value, int):
+        return value
+    if not isinstance(value, list) or len(value) != len(frame_shape) or (
+            not all(isinstance(v, int) for v in value)):
+        raise WiringError("Expected a voxel: {!r}".format(value))
+    try:
+        return int(np.ravel_multi_index(value, frame_shape))
+    except ValueError:
+        raise WiringError("Voxel out of range: {!r}".format(value))
+
+
+def parse_wiring(data, name="wiring"):
+    """ Return the Wiring described by a dictionary (see the module
+        documentation for the format).
+    """
+    try:
+        frame_shape = tuple(data.get("frame_shape", frame_utils.FRAME_SHAPE))
+        n_voxels = int(np.prod(frame_shape))
+        if "map" in data:
+            index = np.array(data["map"], dtype=np.intp)
+        else:
+            base = data.get("base", "simulator")
+            if base not in frame_utils.FrameConstants.TESSERACT_TYPES:
+                raise WiringError(
+                    "{}: unknown base tesseract type {!r}".format(
+                        name, base))
+            index = frame_utils.layout_index(base, frame_shape).copy()
+        for pair in data.get("swap", []):
+            a, b = [_voxel(voxel, frame_shape) for voxel in pair]
+            if not (0 <= a < n_voxels and 0 <= b < n_voxels):
+                raise WiringError("Voxel out of range: {!r}".format(pair))
+            index[[a, b]] = index[[b, a]]
+    except WiringError:
+        raise
+    except (KeyError, TypeError, AttributeError, ValueError) as err:
+        raise WiringError("Invalid wiring: {!r}".format(err))
+    return Wiring(frame_shape, index, name=name).validate()
+
+
+def load_wiring(path):
+    """ Load a wiring map from a JSON file. """
+    with open(path) as f:
+        try:
+            data = json.load(f)
+        except ValueError as err:
+            raise WiringError("{}: {}".format(path, err))
+    return parse_wiring(data, name=path)
@@ -4,8 +4,17 @@
 
 import sys
 
+import pytest
+
 from .fakes import spidev_fake, wiringpi_fake
 
 
 sys.modules['spidev'] = spidev_fake()
 sys.modules['wiringpi'] = wiringpi_fake()
+
+
+@pytest.fixture(autouse=True)
+def reset_fakes():
+    """ Reset the state of the fake hardware modules between tests. """
+    sys.modules['spidev'].fake.reset()
+    sys.modules['wiringpi'].fake.reset()
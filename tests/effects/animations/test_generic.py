@@ -8,7 +8,9 @@
 
 import glob
 import os
+import tracemalloc
 
+import numpy as np
 import pytest
 
 import tessled.effects.animations as animations
@@ -47,3 +49,40 @@ def test_generates_one_hundred_frames(animation_cls):
         frame = engine.next_frame()
         assert frame.shape == fc.frame_shape
         assert frame.dtype == fc.frame_dtype
+
+
+@pytest.mark.parametrize("animation_cls", [
+    a for a in ANIMATIONS if a.ALLOCATION_FREE])
+def test_steady_state_allocates_no_arrays(animation_cls):
+    """ Tests that animations marked as ALLOCATION_FREE render frames
+        without allocating arrays once they are running.
+    """
+    fc = FrameConstants()
+    engine = EffectEngine(fc=fc, tick=1. / 10, transition=60)
+    engine.add_animation_type(animation_cls)
+    tracemalloc.start()
+    try:
+        for i in range(10):
+            engine.next_frame()
+        first = engine.next_frame()
+        allocated = fc.frame_pool.allocated
+        domain = tracemalloc.DomainFilter(True, np.lib.tracemalloc_domain)
+        arrays = tracemalloc.take_snapshot().filter_traces([domain])
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(100):
+            frame = engine.next_frame()
+        current, peak = tracemalloc.get_traced_memory()
+        grown, peak = current - before, peak - before
+        new_arrays = tracemalloc.take_snapshot().filter_traces(
+            [domain]).compare_to(arrays, "lineno")
+    finally:
+        tracemalloc.stop()
+    # the frame pool was reused and no arrays were kept ...
+    assert frame is first
+    assert fc.frame_pool.allocated == allocated
+    assert [stat for stat in new_arrays if stat.size_diff] == []
+    assert grown < fc.empty_frame().nbytes
+    # ... and no temporary arrays were allocated for calculations over
+    # the whole cube (allowing for small Python objects and scalars)
+    assert peak < np.zeros(fc.frame_shape).nbytes
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+""" Tests for tessled.effects.blending and layer compositing. """
+
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from tessled.effects import blending
+from tessled.effects.engine import Animation, EffectEngine
+from tessled.frame_utils import FrameConstants, FramePool
+
+DST = np.array([0, 10, 100, 200, 255, 255, 0], dtype=np.uint8)
+SRC = np.array([0, 0, 100, 100, 255, 0, 255], dtype=np.uint8)
+
+
+def blended(mode, alpha=1.0):
+    dst = DST.copy()
+    blending.blend(dst, SRC, mode, alpha)
+    return dst.tolist()
+
+
+class Fill(Animation):
+
+    ANIMATION = __name__ + ".fill"
+    VALUE = 100
+
+    def render(self, frame):
+        frame[:4] = self.VALUE
+
+
+class Dot(Animation):
+
+    ANIMATION = __name__ + ".dot"
+
+    def render(self, frame):
+        frame[0, 0, 0] = 255
+        frame[7, 7, 7] = 50
+
+
+class TestBlendModes:
+    def test_max(self):
+        assert blended("max") == [0, 10, 100, 200, 255, 255, 255]
+
+    def test_add(self):
+        assert blended("add") == [0, 10, 200, 255, 255, 255, 255]
+
+    def test_multiply(self):
+        assert blended("multiply") == [0, 0, 39, 78, 255, 0, 0]
+
+    def test_mask(self):
+        assert blended("mask") == [0, 0, 100, 200, 255, 0, 0]
+
+    @pytest.mark.parametrize("alpha, expected", [
+        (1.0, SRC.tolist()),
+        (0.0, DST.tolist()),
+        (0.5, [0, 5, 100, 150, 255, 127, 128]),
+    ])
+    def test_alpha(self, alpha, expected):
+        assert blended("alpha", alpha) == expected
+
+    @pytest.mark.parametrize("alpha", [-0.5, 1.5])
+    def test_alpha_out_of_range(self, alpha):
+        with pytest.raises(ValueError):
+            blended("alpha", alpha)
+
+    @pytest.mark.parametrize("mode", sorted(blending.BLEND_MODES))
+    def test_allocates_no_arrays(self, mode):
+        fc = FrameConstants()
+        pool = FramePool(fc.frame_shape)
+        dst = np.random.randint(0, 256, size=fc.frame_shape).astype(np.uint8)
+        src = np.random.randint(0, 256, size=fc.frame_shape).astype(np.uint8)
+        tracemalloc.start()
+        try:
+            blending.blend(dst, src, mode, 0.5, pool)
+            allocated = pool.allocated
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            for i in range(10):
+                blending.blend(dst, src, mode, 0.5, pool)
+            peak = tracemalloc.get_traced_memory()[1] - before
+        finally:
+            tracemalloc.stop()
+        assert pool.allocated == allocated
+        assert peak < dst.nbytes
+
+
+class TestLayers:
+    def mk_engine(self):
+        fc = FrameConstants()
+        engine = EffectEngine(fc=fc, tick=0.1, transition=60)
+        engine.add_animation_type(Fill)
+        engine.add_animation_type(Dot)
+        engine.set_next_transition(60)
+        engine.add_animation(Fill.ANIMATION, layer="background")
+        engine.add_animation(Dot.ANIMATION, layer="foreground")
+        return fc, engine
+
+    def test_default_max(self):
+        fc, engine = self.mk_engine()
+        frame = engine.next_frame()
+        assert frame[0, 0, 0] == 255
+        assert frame[0, 1, 0] == 100
+        assert frame[7, 7, 7] == 50
+        assert frame[7, 7, 6] == 0
+
+    def test_mask(self):
+        fc, engine = self.mk_engine()
+        engine.set_layer_blend("foreground", "mask")
+        frame = engine.next_frame()
+        assert frame[0, 0, 0] == 100
+        assert frame[0, 1, 0] == 0
+        assert frame[7, 7, 7] == 0
+        assert frame.sum() == 100
+
+    def test_alpha(self):
+        fc, engine = self.mk_engine()
+        engine.set_layer_blend("foreground", "alpha", alpha=0.5)
+        frame = engine.next_frame()
+        assert frame[0, 0, 0] == 178
+        assert frame[0, 1, 0] == 50
+        assert frame[7, 7, 7] == 25
+
+    def test_pool_reused(self):
+        fc, engine = self.mk_engine()
+        engine.set_layer_blend("foreground", "alpha", alpha=0.5)
+        for i in range(5):
+            engine.next_frame()
+        # the frame, the foreground layer and two blending scratch arrays
+        assert fc.frame_pool.allocated == 4
+
+    def test_invalid(self):
+        fc, engine = self.mk_engine()
+        with pytest.raises(ValueError):
+            engine.set_layer_blend("overlay", "max")
+        with pytest.raises(ValueError):
+            engine.set_layer_blend("foreground", "screen")
+        with pytest.raises(ValueError):
+            engine.set_layer_blend("foreground", "alpha", alpha=1.5)
+        with pytest.raises(ValueError):
+            engine.set_layer_blend("foreground", "alpha", alpha=-0.1)
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+""" Tests for tessled.effects.transitions and engine crossfades. """
+
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from tessled.effects import transitions
+from tessled.effects.engine import Animation, EffectEngine
+from tessled.frame_utils import FrameConstants, FramePool
+
+FRAME_SHAPE = (8, 8, 8)
+
+
+class Bright(Animation):
+
+    ANIMATION = __name__ + ".bright"
+
+    def post_init(self):
+        self.closed = False
+
+    def render(self, frame):
+        frame[...] = 200
+
+    def close(self):
+        self.closed = True
+        super(Bright, self).close()
+
+
+class Dark(Animation):
+
+    ANIMATION = __name__ + ".dark"
+
+
+class TestWeightTable:
+    @pytest.mark.parametrize("mask", transitions.MASKS)
+    def test_shape(self, mask):
+        weights = transitions.weight_table(mask, 5, FRAME_SHAPE)
+        assert weights.shape == (5,) + FRAME_SHAPE
+        assert weights.dtype == np.uint16
+        assert weights.min() >= 0
+        assert weights.max() <= 255
+
+    @pytest.mark.parametrize("mask", transitions.MASKS)
+    def test_monotonic(self, mask):
+        weights = transitions.weight_table(mask, 10, FRAME_SHAPE)
+        assert (np.diff(weights.astype(np.int32), axis=0) >= 0).all()
+        # part way between the outgoing and incoming animations
+        assert weights[0].mean() < 64
+        assert weights[-1].mean() > 192
+
+    def test_fade(self):
+        weights = transitions.weight_table("fade", 4, FRAME_SHAPE)
+        assert [int(w.min()) for w in weights] == [51, 102, 153, 204]
+        assert [int(w.max()) for w in weights] == [51, 102, 153, 204]
+
+    def test_wipe(self):
+        weights = transitions.weight_table("wipe", 4, FRAME_SHAPE)
+        middle = weights[1]
+        # the incoming animation sweeps along the X axis
+        assert (middle[..., 0] == 255).all()
+        assert (middle[..., -1] == 0).all()
+        assert (np.diff(middle[0, 0].astype(np.int32)) <= 0).all()
+
+    def test_dissolve(self):
+        weights = transitions.weight_table("dissolve", 4, FRAME_SHAPE)
+        assert set(np.unique(weights)) <= set([0, 255])
+        assert [int((w == 255).sum()) for w in weights] == [
+            103, 205, 308, 410]
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            transitions.weight_table("spiral", 4, FRAME_SHAPE)
+
+
+class TestTransition:
+    def mk_transition(self, mask="fade", steps=4):
+        weights = transitions.weight_table(mask, steps, FRAME_SHAPE)
+        outgoing = Bright(FrameConstants())
+        return outgoing, transitions.Transition(
+            [outgoing], weights, 255 - weights)
+
+    def test_mix(self):
+        _, transition = self.mk_transition()
+        pool = FramePool(FRAME_SHAPE)
+        outgoing = np.full(FRAME_SHAPE, 200, dtype=np.uint8)
+        mixed = []
+        for i in range(4):
+            frame = np.full(FRAME_SHAPE, 100, dtype=np.uint8)
+            transition.mix(frame, outgoing, pool)
+            assert (frame == frame[0, 0, 0]).all()
+            mixed.append(int(frame[0, 0, 0]))
+        assert mixed == [180, 160, 140, 120]
+        assert transition.done()
+
+    def test_mix_extremes(self):
+        _, transition = self.mk_transition("dissolve", steps=1)
+        pool = FramePool(FRAME_SHAPE)
+        frame = np.full(FRAME_SHAPE, 255, dtype=np.uint8)
+        outgoing = np.zeros(FRAME_SHAPE, dtype=np.uint8)
+        transition.mix(frame, outgoing, pool)
+        assert set(np.unique(frame)) == set([0, 255])
+        assert (frame == 255).sum() == 256
+
+    def test_mix_reuses_pool(self):
+        _, transition = self.mk_transition()
+        pool = FramePool(FRAME_SHAPE)
+        frame = np.zeros(FRAME_SHAPE, dtype=np.uint8)
+        for i in range(4):
+            transition.mix(frame, frame, pool)
+        assert pool.allocated == 2
+
+    def test_close(self):
+        outgoing, transition = self.mk_transition()
+        transition.close()
+        assert outgoing.closed
+
+
+class TestCrossfade:
+    def mk_engine(self, crossfade=0.4, transition_mask="fade"):
+        fc = FrameConstants()
+        engine = EffectEngine(
+            fc=fc, tick=0.1, transition=60, crossfade=crossfade,
+            transition_mask=transition_mask)
+        engine.add_animation_type(Bright)
+        engine.add_animation_type(Dark)
+        return fc, engine
+
+    def start_bright(self, engine):
+        engine.set_next_transition(60)
+        engine.add_animation(Bright.ANIMATION)
+        outgoing = engine._animations["default"][0]
+        # switch to the dark animation on the next frame
+        engine.set_next_transition(0)
+        return outgoing
+
+    def test_fade(self):
+        fc, engine = self.mk_engine()
+        outgoing = self.start_bright(engine)
+        levels = [int(engine.next_frame().max()) for i in range(6)]
+        assert levels == [160, 120, 80, 40, 0, 0]
+        assert outgoing.closed
+
+    def test_no_crossfade(self):
+        fc, engine = self.mk_engine(crossfade=0)
+        outgoing = self.start_bright(engine)
+        assert engine.next_frame().max() == 0
+        assert outgoing.closed
+
+    @pytest.mark.parametrize("mask", list(transitions.MASKS) + ["random"])
+    def test_masks(self, mask):
+        fc, engine = self.mk_engine(transition_mask=mask)
+        self.start_bright(engine)
+        lit = [int((engine.next_frame() > 0).sum()) for i in range(5)]
+        assert lit[0] > 0
+        assert lit[-1] == 0
+
+    def test_interrupted(self):
+        fc, engine = self.mk_engine()
+        first = self.start_bright(engine)
+        engine.next_frame()
+        # a new transition before the crossfade is over closes it
+        engine.set_next_transition(0)
+        engine.next_frame()
+        assert first.closed
+        assert len(engine._crossfades) == 1
+
+    def test_pool_reused(self):
+        fc, engine = self.mk_engine()
+        self.start_bright(engine)
+        for i in range(10):
+            engine.next_frame()
+        # the frame, the outgoing frame and two mixing scratch arrays
+        assert fc.frame_pool.allocated == 4
+
+    def test_timing(self):
+        fc, engine = self.mk_engine()
+        self.start_bright(engine)
+        for i in range(6):
+            engine.next_frame()
+        assert engine.crossfade_times.count == 4
+        assert engine.render_times.count == 2
+        assert engine.frames_over_budget == 0
+
+    def test_over_budget(self, capsys):
+        fc = FrameConstants()
+        engine = EffectEngine(
+            fc=fc, tick=1e-9, transition=60, crossfade=4e-9)
+        engine.add_animation_type(Bright)
+        engine.add_animation_type(Dark)
+        self.start_bright(engine)
+        for i in range(5):
+            engine.next_frame()
+        assert engine.frames_over_budget == 5
+        assert "longer than the" in capsys.readouterr().out
+
+    def test_allocates_no_arrays(self):
+        fc, engine = self.mk_engine(crossfade=60)
+        self.start_bright(engine)
+        tracemalloc.start()
+        try:
+            frame = engine.next_frame()
+            allocated = fc.frame_pool.allocated
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            for i in range(100):
+                assert engine.next_frame() is frame
+            peak = tracemalloc.get_traced_memory()[1] - before
+        finally:
+            tracemalloc.stop()
+        assert engine._crossfades
+        assert fc.frame_pool.allocated == allocated
+        assert peak < frame.nbytes
@@ -2,18 +2,51 @@
 
 """ Fakes for hardware modules only available on the Raspberry Pi. """
 
+import ctypes
+import struct
 from types import ModuleType
 
+# struct spi_ioc_transfer from linux/spi/spidev.h
+SPI_IOC_TRANSFER = struct.Struct("=QQIIHBBBBBB")
+
 
 class SpiDev:
     """ A dummy SPI device. """
 
     def __init__(self):
         self.fake_state = {}
+        self.fake_ioctls = []
 
     def fileno(self):
         return 4
 
+    def fake_ioctl(self, fd, request, arg):
+        """ A fake fcntl.ioctl that decodes SPI_IOC_MESSAGE requests.
+
+            Each ioctl call is recorded as a list of the transfers it
+            contained. Each transfer is a dictionary with the bytes
+            sent and the transfer settings.
+        """
+        assert fd == self.fileno()
+        assert (request >> 30) == 1  # _IOC_WRITE
+        assert (request & 0xffff) == (ord("k") << 8)  # SPI_IOC_MESSAGE
+        size = (request >> 16) & 0x3fff
+        assert size == len(arg)
+        transfers = []
+        for offset in range(0, size, SPI_IOC_TRANSFER.size):
+            (tx_buf, rx_buf, length, speed_hz, delay_usecs, bits_per_word,
+             cs_change, _, _, _, _) = SPI_IOC_TRANSFER.unpack_from(
+                 arg, offset)
+            transfers.append({
+                "data": ctypes.string_at(tx_buf, length),
+                "speed_hz": speed_hz,
+                "delay_usecs": delay_usecs,
+                "bits_per_word": bits_per_word,
+                "cs_change": cs_change,
+            })
+        self.fake_ioctls.append(transfers)
+        return 0
+
     def open(self, spibus, spidevice):
         self.fake_state.update({
             "open": True,
@@ -28,6 +61,9 @@ class FakeSpidev:
     def __init__(self):
         self.spidevs = []
 
+    def reset(self):
+        del self.spidevs[:]
+
     def SpiDev(self):
         dev = SpiDev()
         self.spidevs.append(dev)
@@ -54,6 +90,11 @@ class GPIO:
 
     def __init__(self):
         self.fake_state = {}
+        self.fake_writes = []
+
+    def reset(self):
+        self.fake_state.clear()
+        del self.fake_writes[:]
 
     def __call__(self, mode):
         self.fake_state.update({
@@ -67,6 +108,9 @@ class GPIO:
             "pin-{}".format(pin): mode,
         })
 
+    def digitalWrite(self, pin, value):
+        self.fake_writes.append((pin, value))
+
 
 class FakeWiringpi:
     """ Holder for internal state of a fake wiringpi module. """
@@ -74,6 +118,9 @@ class FakeWiringpi:
     def __init__(self):
         self.GPIO = GPIO()
 
+    def reset(self):
+        self.GPIO.reset()
+
 
 def wiringpi_fake():
     """ Returns a fake wiringpi module. """
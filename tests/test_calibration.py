@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+""" Tests for tessled.calibration. """
+
+import numpy as np
+import pytest
+
+from tessled.calibration import (
+    CalibrationError, default_dc, load_dc, save_dc)
+
+
+class TestLoadSaveDC:
+    def test_round_trip(self, tmpdir):
+        path = str(tmpdir.join("dc.txt"))
+        dc_values = np.arange(80, dtype=np.uint8) % 64
+        save_dc(path, dc_values)
+        loaded = load_dc(path)
+        assert np.array_equal(loaded, dc_values)
+        assert loaded.dtype == np.uint8
+
+    def test_comments_and_blank_lines(self, tmpdir):
+        path = tmpdir.join("dc.txt")
+        path.write("# header\n\n" + "63 " * 40 + "# first half\n" +
+                   "\n".join(["10"] * 40) + "\n")
+        loaded = load_dc(str(path))
+        assert list(loaded) == [63] * 40 + [10] * 40
+
+    def test_wrong_count(self, tmpdir):
+        path = tmpdir.join("dc.txt")
+        path.write("63 " * 79)
+        with pytest.raises(CalibrationError) as err:
+            load_dc(str(path))
+        assert "expected 80 DC values but found 79" in str(err.value)
+
+    def test_out_of_range(self, tmpdir):
+        path = tmpdir.join("dc.txt")
+        path.write("63 " * 79 + "\n64\n")
+        with pytest.raises(CalibrationError) as err:
+            load_dc(str(path))
+        assert ":2: DC value 64 is not in the range 0-63" in str(err.value)
+
+    def test_invalid_value(self, tmpdir):
+        path = tmpdir.join("dc.txt")
+        path.write("bright")
+        with pytest.raises(CalibrationError) as err:
+            load_dc(str(path))
+        assert "invalid DC value 'bright'" in str(err.value)
+
+    def test_default(self):
+        assert list(default_dc(3)) == [63, 63, 63]
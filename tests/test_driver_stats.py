@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+""" Tests for tessled.driver_stats. """
+
+import json
+
+import zmq
+
+from tessled.driver_stats import DriverStats, write_json_atomic
+from tessled.timing import DwellTimer
+
+
+class FakeReceiver(object):
+    frames_received = 10
+    frames_dropped = 2
+    frames_unchanged = 1
+    frames_lost = 3
+    frames_late = 4
+    frames_packed = 7
+    pack_time_total = 8e-5
+    pack_time_max = 2e-5
+
+    def frame_age(self, now):
+        return 0.25
+
+    def layers_packed(self):
+        return 40
+
+    def layers_skipped(self):
+        return 16
+
+
+def mk_stats(**kw):
+    timer = DwellTimer(0)
+    for _ in range(4):
+        timer.begin()
+        timer.end()
+    return DriverStats(FakeReceiver(), timer, 7, interval=10, **kw)
+
+
+class TestWriteJsonAtomic:
+    def test_write(self, tmpdir):
+        path = str(tmpdir.join("stats.json"))
+        write_json_atomic(path, {"a": 1})
+        write_json_atomic(path, {"a": 2})
+        with open(path) as f:
+            assert json.load(f) == {"a": 2}
+        assert tmpdir.listdir() == [tmpdir.join("stats.json")]
+
+
+class TestDriverStats:
+    def test_snapshot(self):
+        stats = mk_stats()
+        stats.refreshes = 20
+        snapshot = stats.snapshot(stats.start + 2.0)
+        assert snapshot["interval"] == 2.0
+        assert snapshot["refreshes_per_second"] == 10.0
+        assert snapshot["sweeps_per_second"] == 70.0
+        assert snapshot["frames_received"] == 10
+        assert snapshot["frames_dropped"] == 2
+        assert snapshot["frames_unchanged"] == 1
+        assert snapshot["frames_lost"] == 3
+        assert snapshot["frames_late"] == 4
+        assert snapshot["frames_packed"] == 7
+        assert snapshot["layers_packed"] == 40
+        assert snapshot["layers_skipped"] == 16
+        assert abs(snapshot["pack_time_mean_us"] - 80 / 7.) < 1e-9
+        assert abs(snapshot["pack_time_max_us"] - 20.0) < 1e-9
+        assert snapshot["frame_age_ms"] == 250.0
+        assert snapshot["spi_write_us"]["count"] == 4
+        assert sorted(snapshot["spi_write_us"]) == [
+            "count", "p100", "p50", "p90", "p99", "p99.9"]
+
+    def test_tick_publishes_to_file(self, tmpdir):
+        path = str(tmpdir.join("stats.json"))
+        stats = mk_stats(path=path)
+        stats.interval = 0
+        stats.tick()
+        with open(path) as f:
+            data = json.load(f)
+        assert data["frames_received"] == 10
+        assert stats.refreshes == 0
+        assert stats.timer.writes.count == 0
+
+    def test_tick_publishes_to_socket(self):
+        context = zmq.Context()
+        pub = context.socket(zmq.PAIR)
+        pub.bind("inproc://stats")
+        sub = context.socket(zmq.PAIR)
+        sub.connect("inproc://stats")
+        try:
+            stats = mk_stats(socket=pub)
+            stats.interval = 0
+            stats.tick()
+            assert sub.poll(1000)
+            data = sub.recv_json()
+            assert data["frames_dropped"] == 2
+        finally:
+            pub.close()
+            sub.close()
+            context.term()
+
+    def test_tick_waits_for_interval(self, tmpdir):
+        path = str(tmpdir.join("stats.json"))
+        stats = mk_stats(path=path)
+        stats.tick()
+        assert stats.refreshes == 1
+        assert tmpdir.listdir() == []
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+""" Tests for tessled.envelope. """
+
+import numpy as np
+import pytest
+
+from tessled import envelope, frame_codec
+
+SHAPE = (2, 2, 2)
+
+
+def mk_message(seq, display_at, value=0, shape=SHAPE, rendered_at=0.0):
+    message = bytearray(envelope.message_size(shape))
+    envelope.pack_header(message, seq, rendered_at, display_at, shape)
+    message[envelope.ENVELOPE_HEADER.size:] = bytearray(
+        [value] * int(np.prod(shape)))
+    return bytes(message)
+
+
+class TestEnvelope:
+    def test_round_trip(self):
+        header, frame = envelope.unpack(
+            mk_message(7, 2.5, value=3, rendered_at=1.5), SHAPE)
+        assert header == envelope.FrameHeader(
+            7, 1.5, 2.5, SHAPE, np.dtype(np.uint8), frame_codec.ENCODING_RAW)
+        assert frame.shape == SHAPE
+        assert frame.tolist() == np.full(SHAPE, 3).tolist()
+
+    def test_bare_frame(self):
+        header, frame = envelope.unpack(bytes(bytearray(range(8))), SHAPE)
+        assert header is None
+        assert frame.ravel().tolist() == list(range(8))
+
+    @pytest.mark.parametrize("data", [
+        mk_message(1, 0.0, shape=(2, 2)), b"\x00" * 7])
+    def test_invalid(self, data):
+        with pytest.raises(envelope.EnvelopeError):
+            envelope.unpack(data, SHAPE)
+
+
+class TestPlayoutBuffer:
+    def test_scheduled(self):
+        playout = envelope.PlayoutBuffer(SHAPE)
+        playout.push(mk_message(3, 11.0, value=2), now=10.0)
+        playout.push(mk_message(2, 10.5, value=1), now=10.0)
+        assert playout.frames_late == 1  # out of order
+        assert len(playout) == 1
+        assert playout.next_due() == 11.0
+        assert playout.pop(10.9) is None
+        assert playout.pop(11.0).ravel().tolist() == [2] * 8
+        assert playout.next_due() is None
+
+    def test_skips_frames_passed_over(self):
+        playout = envelope.PlayoutBuffer(SHAPE, max_delay=5.0)
+        for seq in (1, 2, 3):
+            playout.push(mk_message(seq, 10.0 + seq, value=seq), now=10.0)
+        assert playout.pop(12.5).ravel().tolist() == [2] * 8
+        assert playout.frames_skipped == 1
+        assert len(playout) == 1
+
+    def test_lost_and_late(self):
+        playout = envelope.PlayoutBuffer(SHAPE)
+        playout.push(mk_message(1, 11.0), now=10.0)
+        playout.push(mk_message(4, 9.0), now=10.0)
+        assert playout.frames_lost == 2
+        assert playout.frames_late == 1
+        # late frames are still displayed straight away
+        assert playout.next_due() == 9.0
+
+    def test_restart(self):
+        playout = envelope.PlayoutBuffer(SHAPE)
+        playout.push(mk_message(5, 11.0), now=10.0)
+        playout.push(mk_message(1, 11.0), now=10.0)
+        assert playout.frames_late == 0
+        assert len(playout) == 2
+
+    def test_max_delay(self):
+        playout = envelope.PlayoutBuffer(SHAPE, max_delay=0.5)
+        playout.push(mk_message(1, 100.0), now=10.0)
+        assert playout.next_due() == 10.5
+
+    def test_bare_frames(self):
+        playout = envelope.PlayoutBuffer(SHAPE)
+        playout.push(b"\x01" * 8, now=10.0)
+        assert playout.pop(10.0).ravel().tolist() == [1] * 8
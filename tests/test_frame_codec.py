@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+""" Tests for tessled.frame_codec. """
+
+import time
+
+import numpy as np
+import pytest
+import zmq
+
+from tessled import envelope, frame_codec, transport
+
+SHAPE = (8, 8, 8)
+
+
+def sparse_frame(rng, lit=20):
+    frame = np.zeros(SHAPE, dtype=np.uint8)
+    frame.flat[rng.choice(frame.size, lit, replace=False)] = rng.randint(
+        1, 256, size=lit)
+    return frame
+
+
+class TestRunLength:
+    @pytest.mark.parametrize("data", [
+        [0] * 10, [1] * 10, [0, 0, 3, 4, 0, 5], [7, 0, 0, 8], [9]])
+    def test_round_trip(self, data):
+        data = np.array(data, dtype=np.uint8)
+        out = np.full(len(data), 99, dtype=np.uint8)
+        frame_codec.rle_decode(frame_codec.rle_encode(data), out)
+        assert out.tolist() == data.tolist()
+
+    def test_size(self):
+        data = np.zeros(512, dtype=np.uint8)
+        data[100:103] = 1
+        # run count, three runs and three literals
+        assert len(frame_codec.rle_encode(data)) == 2 + 3 * 2 + 3
+
+    def test_corrupt(self):
+        payload = frame_codec.rle_encode(np.arange(4, dtype=np.uint8))
+        with pytest.raises(frame_codec.CodecError):
+            frame_codec.rle_decode(payload[:-1], np.zeros(4, np.uint8))
+
+
+class TestFrameCodec:
+    def round_trip(self, encoder, decoder, frames, skip=()):
+        encodings, decoded = [], []
+        for seq, frame in enumerate(frames, 1):
+            encoding, payload = encoder.encode(frame)
+            encodings.append(encoding)
+            if seq in skip:
+                continue
+            result = decoder.decode(seq, encoding, payload)
+            decoded.append(None if result is None else result.copy())
+        return encodings, decoded
+
+    def test_delta(self):
+        rng = np.random.RandomState(1)
+        frames = [sparse_frame(rng)]
+        for _ in range(6):
+            frame = frames[-1].copy()
+            frame.flat[rng.randint(0, 512)] = 5
+            frames.append(frame)
+        encoder = frame_codec.FrameEncoder(
+            SHAPE, encoding="delta", keyframe_interval=4)
+        encodings, decoded = self.round_trip(
+            encoder, frame_codec.FrameDecoder(SHAPE), frames)
+        assert encodings == [1, 2, 2, 2, 1, 2, 2]
+        assert all(np.array_equal(a, b) for a, b in zip(frames, decoded))
+
+    def test_lost_frame(self):
+        rng = np.random.RandomState(2)
+        frames = [sparse_frame(rng) for _ in range(5)]
+        encoder = frame_codec.FrameEncoder(
+            SHAPE, encoding="delta", keyframe_interval=4)
+        _, decoded = self.round_trip(
+            encoder, frame_codec.FrameDecoder(SHAPE), frames, skip=[2])
+        assert decoded[1] is None and decoded[2] is None
+        assert np.array_equal(decoded[3], frames[4])
+
+    def test_raw_fallback(self):
+        rng = np.random.RandomState(3)
+        frames = [
+            sparse_frame(rng), rng.randint(1, 256, SHAPE).astype(np.uint8)]
+        frames.append(frames[1].copy())
+        frames[2][0, 0, 0] ^= 1
+        encoder = frame_codec.FrameEncoder(SHAPE, encoding="delta")
+        encodings, decoded = self.round_trip(
+            encoder, frame_codec.FrameDecoder(SHAPE), frames)
+        assert encodings == [1, 0, 2]
+        assert all(np.array_equal(a, b) for a, b in zip(frames, decoded))
+
+
+class TestZmqEncoding:
+    def test_publish(self):
+        context = zmq.Context()
+        publisher = transport.open_publisher(
+            "inproc://frames", SHAPE, context=context, encoding="delta")
+        subscriber = transport.open_subscriber("inproc://frames", context)
+        time.sleep(0.05)
+        playout = envelope.PlayoutBuffer(SHAPE, scheduled=False)
+        rng = np.random.RandomState(4)
+        frames = [sparse_frame(rng) for _ in range(3)]
+        try:
+            for frame in frames:
+                publisher.publish(frame)
+                assert subscriber.poll(1000)
+                _, received = playout.receive(subscriber.recv_nowait(), 0)
+                assert np.array_equal(received, frame)
+        finally:
+            publisher.close()
+            subscriber.close()
+            context.term()
+        assert publisher.bytes_sent < 3 * envelope.message_size(SHAPE) / 2
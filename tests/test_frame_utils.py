@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+""" Tests for tessled.frame_utils. """
+
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from tessled import effectbox
+from tessled.effects.animations import ExploringSphere
+from tessled.effects.engine import EffectEngine
+from tessled.frame_utils import FrameConstants, FrameMapper, FramePool
+
+TTYPES = sorted(FrameConstants.TESSERACT_TYPES)
+
+
+def mk_frame(shape=(8, 8, 8)):
+    return np.arange(np.prod(shape), dtype=np.uint16).astype(
+        np.uint8).reshape(shape)
+
+
+class FakePublisher:
+    def __init__(self):
+        self.frames = []
+        self.closed = False
+
+    def publish(self, frame, display_at=None):
+        self.frames.append((frame.copy(), display_at))
+
+    def close(self):
+        self.closed = True
+
+
+class TestFramePool:
+    def test_reuse(self):
+        pool = FramePool((2, 3))
+        frame = pool.acquire()
+        assert frame.shape == (2, 3)
+        assert frame.dtype == np.uint8
+        frame[:] = 7
+        pool.release(frame)
+        assert pool.acquire() is frame
+        assert frame.tolist() == [[0, 0, 0], [0, 0, 0]]
+        assert pool.allocated == 1
+
+    def test_no_clear(self):
+        pool = FramePool((2, 3))
+        frame = pool.acquire()
+        frame[:] = 7
+        pool.release(frame)
+        assert pool.acquire(clear=False)[0, 0] == 7
+
+    def test_shapes(self):
+        pool = FramePool((2, 3))
+        frame = pool.acquire()
+        scratch = pool.acquire((4,), np.float64)
+        assert scratch.dtype == np.float64
+        pool.release(frame)
+        pool.release(scratch)
+        assert pool.acquire((4,), np.float64) is scratch
+        assert pool.acquire() is frame
+        assert pool.allocated == 2
+
+    def test_engine_releases_scratch(self):
+        fc = FrameConstants()
+        engine = EffectEngine(fc=fc, tick=0.1, transition=0.15)
+        engine.add_animation_type(ExploringSphere)
+        for i in range(10):
+            engine.next_frame()
+        # a frame and two spheres' scratch arrays, reused by each new
+        # ExploringSphere after a transition
+        assert fc.frame_pool.allocated == 7
+
+
+class TestFrameMapper:
+    @pytest.mark.parametrize("ttype", TTYPES)
+    def test_from_virtual(self, ttype):
+        frame = mk_frame()
+        mapper = FrameMapper(None, ttype)
+        expected = FrameConstants.TESSERACT_TYPES[ttype](frame)
+        assert mapper(frame).tolist() == expected.tolist()
+
+    @pytest.mark.parametrize("src", TTYPES)
+    @pytest.mark.parametrize("dst", TTYPES)
+    def test_between_types(self, src, dst):
+        frame = mk_frame((4, 2, 3))
+        mapper = FrameMapper(src, dst, frame_shape=(4, 2, 3))
+        physical = FrameConstants.TESSERACT_TYPES[src](frame)
+        expected = FrameConstants.TESSERACT_TYPES[dst](frame)
+        assert mapper(physical).tolist() == expected.tolist()
+
+    def test_identity(self):
+        frame = mk_frame()
+        assert FrameMapper(None, "simulator")(frame) is frame
+        assert FrameMapper("minicube", "minicube")(frame) is frame
+        assert not FrameMapper("minicube", "tesseract").identity
+
+
+class TestFanOut:
+    def test_publish(self):
+        frame = mk_frame()
+        targets = [
+            (FrameMapper(None, ttype), FakePublisher()) for ttype in TTYPES]
+        publisher = effectbox.FanOutPublisher(targets)
+        publisher.publish(frame, display_at=12.5)
+        publisher.close()
+        for ttype, (_, target) in zip(TTYPES, targets):
+            [(published, display_at)] = target.frames
+            assert display_at == 12.5
+            assert published.tolist() == (
+                FrameConstants.TESSERACT_TYPES[ttype](frame).tolist())
+            assert target.closed
+
+    def test_invalid_target(self):
+        result = CliRunner().invoke(
+            effectbox.main, ["--target", "cube=tcp://127.0.0.1:5557"])
+        assert result.exit_code == 2
+        assert "not TTYPE=ADDR" in result.output
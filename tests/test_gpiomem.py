@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+""" Tests for tessled.gpiomem. """
+
+import struct
+
+import numpy as np
+import pytest
+
+from tessled import gpiomem
+from tessled.gpiomem import GPIOMem, WIRINGPI_TO_BCM
+from tessled.spidev_driver import HardwareBackend, TLCs
+
+
+@pytest.fixture
+def registers(tmpdir):
+    path = tmpdir.join("gpiomem")
+    path.write_binary(b"\x00" * gpiomem.REGISTER_BLOCK_SIZE)
+    return str(path)
+
+
+def read_register(path, offset):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return struct.unpack("=I", f.read(4))[0]
+
+
+class TestGPIOMem:
+    def test_pin_mode(self, registers):
+        gpio = GPIOMem(registers)
+        # wiringpi pins 3 and 5 are BCM 22 and 24 (GPFSEL2)
+        gpio.pinMode(3, gpio.OUTPUT)
+        gpio.pinMode(5, gpio.OUTPUT)
+        assert read_register(registers, 0x08) == (1 << 6) | (1 << 12)
+        gpio.pinMode(3, gpio.INPUT)
+        assert read_register(registers, 0x08) == 1 << 12
+        gpio.close()
+
+    def test_digital_write(self, registers):
+        gpio = GPIOMem(registers)
+        gpio.digitalWrite(6, gpio.HIGH)
+        assert read_register(registers, gpiomem.GPSET0) == 1 << 25
+        gpio.digitalWrite(7, gpio.LOW)
+        assert read_register(registers, gpiomem.GPCLR0) == 1 << 4
+        gpio.close()
+
+    def test_write_masks(self, registers):
+        gpio = GPIOMem(registers)
+        mask = gpio.mask([3, 6])
+        assert mask == (1 << WIRINGPI_TO_BCM[3]) | (1 << WIRINGPI_TO_BCM[6])
+        gpio.write_masks(set_mask=mask, clear_mask=gpio.mask([5]))
+        assert read_register(registers, gpiomem.GPSET0) == mask
+        assert read_register(registers, gpiomem.GPCLR0) == 1 << 24
+        gpio.close()
+
+
+class TestTLCsWithGPIOMem:
+    def test_write_pwm_packed(self, registers):
+        backend = HardwareBackend(gpio="gpiomem", gpiomem_path=registers)
+        tlcs = TLCs(
+            tlcs=5, blank=3, vprg=5, xlat=6, dcprg=7, backend=backend)
+        written = []
+        tlcs.write = lambda fd, data: written.append(bytes(data))
+        tlcs.write_pwm_packed(np.zeros(120, dtype=np.uint8))
+        assert written == [b"\x00" * 120]
+        # inverted: BLANK and XLAT are raised by clearing both pins and
+        # XLAT is lowered again by setting it
+        blank, xlat = 1 << 22, 1 << 25
+        assert read_register(registers, gpiomem.GPCLR0) == blank | xlat
+        assert read_register(registers, gpiomem.GPSET0) == xlat
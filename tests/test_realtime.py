@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+""" Tests for tessled.realtime. """
+
+import gc
+import os
+
+import pytest
+
+from tessled import realtime
+
+
+@pytest.fixture
+def restore_affinity():
+    affinity = os.sched_getaffinity(0)
+    yield
+    os.sched_setaffinity(0, affinity)
+
+
+@pytest.fixture
+def restore_gc():
+    yield
+    if hasattr(gc, "unfreeze"):
+        gc.unfreeze()
+    gc.enable()
+
+
+class TestPinToCPU:
+    def test_pin(self, restore_affinity):
+        cpu = realtime.default_cpu()
+        realtime.pin_to_cpu(cpu)
+        assert os.sched_getaffinity(0) == {cpu}
+
+    def test_invalid_cpu(self, restore_affinity):
+        with pytest.raises(realtime.RealtimeUnavailable) as err:
+            realtime.pin_to_cpu(100000)
+        assert "Could not pin to CPU 100000" in str(err.value)
+
+
+class TestSetGCMode:
+    def test_disable(self, restore_gc):
+        realtime.set_gc_mode("disable")
+        assert not gc.isenabled()
+
+    def test_freeze(self, restore_gc):
+        realtime.set_gc_mode("freeze")
+        assert gc.isenabled()
+        assert gc.get_freeze_count() > 0
+
+    def test_enabled(self, restore_gc):
+        gc.disable()
+        realtime.set_gc_mode("enabled")
+        assert gc.isenabled()
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            realtime.set_gc_mode("sometimes")
+
+
+class TestApplyRealtime:
+    def test_nothing_requested(self):
+        reports = []
+        assert realtime.apply_realtime(report=reports.append) == {}
+        assert reports == []
+
+    def test_reports_each_setting(self, restore_affinity, restore_gc):
+        reports = []
+        cpu = realtime.default_cpu()
+        applied = realtime.apply_realtime(
+            cpu=cpu, gc_mode="disable", report=reports.append)
+        assert applied == {"cpu": True, "gc": True}
+        assert reports == [
+            "Realtime: pinned to CPU {}.".format(cpu),
+            "Realtime: garbage collector mode disable.",
+        ]
+
+    def test_reports_unavailable(self, monkeypatch):
+        def unavailable():
+            raise realtime.RealtimeUnavailable("Could not lock memory: nope")
+        monkeypatch.setattr(realtime, "lock_memory", unavailable)
+        reports = []
+        applied = realtime.apply_realtime(mlock=True, report=reports.append)
+        assert applied == {"mlock": False}
+        assert reports == ["Realtime: Could not lock memory: nope (skipped)."]
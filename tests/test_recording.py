@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+""" Tests for tessled.recording. """
+
+import threading
+import time
+
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from tessled import envelope, recording, transport
+
+SHAPE = (2, 3, 4)
+
+
+def mk_recording(path, n=5, interval=0.5):
+    writer = recording.RecordingWriter(path, SHAPE)
+    frames = [np.full(SHAPE, i, dtype=np.uint8) for i in range(n)]
+    for i, frame in enumerate(frames):
+        writer.write(frame, 100.0 + i * interval)
+    writer.close()
+    return frames
+
+
+class TestRecording:
+    def test_round_trip(self, tmpdir):
+        path = str(tmpdir.join("show.rec"))
+        frames = mk_recording(path)
+        rec = recording.Recording(path)
+        assert len(rec) == 5
+        assert rec.frame_shape == SHAPE
+        assert rec.dtype == np.uint8
+        assert rec.duration() == 2.0
+        assert rec.frames[3].tolist() == frames[3].tolist()
+        assert rec.times.tolist() == [100.0, 100.5, 101.0, 101.5, 102.0]
+
+    def test_truncated(self, tmpdir):
+        path = tmpdir.join("show.rec")
+        mk_recording(str(path))
+        with open(str(path), "ab") as f:
+            f.write(b"\x00" * 5)
+        assert len(recording.Recording(str(path))) == 5
+
+    def test_empty(self, tmpdir):
+        path = str(tmpdir.join("show.rec"))
+        recording.RecordingWriter(path, SHAPE).close()
+        rec = recording.Recording(path)
+        assert len(rec) == 0
+        assert rec.index_at(1.0) == 0
+
+    def test_not_a_recording(self, tmpdir):
+        path = tmpdir.join("show.rec")
+        path.write("nope")
+        with pytest.raises(recording.RecordingError):
+            recording.Recording(str(path))
+
+    def test_index_at(self, tmpdir):
+        path = str(tmpdir.join("show.rec"))
+        mk_recording(path)
+        rec = recording.Recording(path)
+        assert [rec.index_at(t) for t in (0, 0.4, 0.5, 1.9, 9)] == [
+            0, 0, 1, 3, 4]
+
+
+class TestSchedule:
+    def test_fps(self, tmpdir):
+        path = str(tmpdir.join("show.rec"))
+        mk_recording(path, n=3)
+        rec = recording.Recording(path)
+        frames = recording._frames(rec, 10, 0.1, loop=True)
+        assert [next(frames) for _ in range(4)] == [
+            (1, 0.0), (2, 0.1), (0, 0.2), (1, pytest.approx(0.3))]
+
+    def test_recorded_timing(self, tmpdir):
+        path = str(tmpdir.join("show.rec"))
+        mk_recording(path, n=3)
+        rec = recording.Recording(path)
+        assert list(recording._frames(rec, None, 0.5, loop=False)) == [
+            (1, 0.0), (2, 0.5)]
+        frames = recording._frames(rec, None, 0, loop=True)
+        assert [next(frames) for _ in range(4)] == [
+            (0, 0.0), (1, 0.5), (2, 1.0), (0, 1.5)]
+
+    def test_start_past_end(self, tmpdir):
+        path = str(tmpdir.join("show.rec"))
+        mk_recording(path, n=3)
+        rec = recording.Recording(path)
+        assert list(recording._frames(rec, 10, 5, loop=False)) == [(2, 0.0)]
+        frames = recording._frames(rec, 10, 0.5, loop=True)
+        assert [next(frames) for _ in range(3)] == [
+            (2, 0.0), (0, 0.1), (1, 0.2)]
+        assert list(recording._frames(rec, None, 5, loop=False)) == [
+            (2, 0.0)]
+        frames = recording._frames(rec, None, 2.0, loop=True)
+        assert [next(frames) for _ in range(3)] == [
+            (1, 0.0), (2, 0.5), (0, 1.0)]
+        # and a start before the beginning plays from the first frame
+        for fps in (10, None):
+            for loop in (False, True):
+                frames = recording._frames(rec, fps, -0.3, loop=loop)
+                assert next(frames) == (0, 0.0)
+
+
+class TestCommands:
+    def test_play(self, tmpdir):
+        path = str(tmpdir.join("show.rec"))
+        frames = mk_recording(path, n=3)
+        addr = "shm://" + str(tmpdir.join("frames"))
+        result = CliRunner().invoke(recording.play, [
+            path, "--frame-addr", addr, "--fps", "100"])
+        assert result.exit_code == 0, result.output
+        ring = transport.ShmRing(transport.shm_path(addr))
+        header, frame = envelope.unpack(
+            ring.frame_view(ring.latest).tobytes(), SHAPE)
+        assert header.seq == 3
+        assert frame.tolist() == frames[2].tolist()
+        ring.close()
+
+    @pytest.mark.parametrize("args", [
+        ["--start", "-1"], ["--fps", "0"], ["--fps", "-10"]])
+    def test_play_invalid(self, tmpdir, args):
+        path = str(tmpdir.join("show.rec"))
+        mk_recording(path, n=3)
+        result = CliRunner().invoke(recording.play, [path] + args)
+        assert result.exit_code == 2
+        assert "Invalid value" in result.output
+
+    def test_record(self, tmpdir):
+        path = str(tmpdir.join("show.rec"))
+        ring_path = str(tmpdir.join("frames"))
+        publisher = transport.ShmPublisher(ring_path, SHAPE)
+        stop = threading.Event()
+
+        def publish():
+            value = 0
+            while not stop.is_set():
+                value += 1
+                publisher.publish(np.full(SHAPE, value, dtype=np.uint8))
+                time.sleep(0.01)
+
+        thread = threading.Thread(target=publish)
+        thread.start()
+        try:
+            result = CliRunner().invoke(recording.record, [
+                path, "--frame-addr", "shm://" + ring_path,
+                "--max-frames", "3", "--seconds", "5"])
+        finally:
+            stop.set()
+            thread.join()
+        assert result.exit_code == 0, result.output
+        assert "Recorded 3 frames (0 lost)." in result.output
+        rec = recording.Recording(path)
+        assert rec.frame_shape == SHAPE
+        values = [int(frame.flat[0]) for frame in rec.frames]
+        assert values == list(range(values[0], values[0] + 3))
+        assert np.all(np.diff(rec.times) > 0)
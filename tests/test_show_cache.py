@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+""" Tests for tessled.show_cache. """
+
+import inspect
+
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from tessled import effectbox, recording, show_cache
+from tessled.effects.animations import DEFAULT_ANIMATIONS, import_animation
+from tessled.effects.engine import EffectEngine
+from tessled.frame_utils import FrameConstants
+
+ANIMATIONS = DEFAULT_ANIMATIONS[:2]
+
+
+def mk_params(fps=10, seed=1, transition=5.0, ttype="tesseract"):
+    fc = FrameConstants(fps=fps, ttype=ttype)
+    return fc, show_cache.cache_params(ANIMATIONS, transition, fc, seed)
+
+
+def mk_cache(path, seconds=1.0, **kw):
+    fc, params = mk_params(**kw)
+    show_cache.seed_random(params["seed"])
+    engine = EffectEngine(fc=fc, tick=1. / fc.fps, transition=5.0)
+    for animation_cls in ANIMATIONS:
+        engine.add_animation_type(animation_cls)
+    n_frames = show_cache.prerender(engine, fc, path, seconds, params)
+    return fc, params, n_frames
+
+
+class TestCacheKey:
+    def test_stable(self):
+        assert (
+            show_cache.cache_key(mk_params()[1]) ==
+            show_cache.cache_key(mk_params()[1]))
+
+    @pytest.mark.parametrize("kw", [
+        {"fps": 20}, {"seed": 2}, {"seed": None}, {"transition": 2.0},
+    ])
+    def test_changes(self, kw):
+        assert (
+            show_cache.cache_key(mk_params()[1]) !=
+            show_cache.cache_key(mk_params(**kw)[1]))
+
+    def test_sprite_source(self, tmpdir, monkeypatch):
+        path = str(tmpdir.join("show.cache"))
+        fc, params, _ = mk_cache(path)
+        getsource = inspect.getsource
+
+        def patched(module):
+            source = getsource(module)
+            if module.__name__ == "tessled.effects.sprites.sphere":
+                source += "\n# changed\n"
+            return source
+
+        monkeypatch.setattr(inspect, "getsource", patched)
+        with pytest.raises(show_cache.StaleCacheError) as err:
+            show_cache.open_cache(path, mk_params()[1])
+        assert "changed: source" in str(err.value)
+
+    def test_animations(self):
+        fc, params = mk_params()
+        other = show_cache.cache_params(ANIMATIONS[:1], 5.0, fc, 1)
+        assert show_cache.cache_key(params) != show_cache.cache_key(other)
+
+
+class TestCache:
+    def test_round_trip(self, tmpdir):
+        path = str(tmpdir.join("show.cache"))
+        fc, params, n_frames = mk_cache(path)
+        assert n_frames == 10
+        cache = show_cache.open_cache(path, params)
+        assert len(cache) == 10
+        assert cache.frame_shape == fc.frame_shape
+        assert cache.times[1] == pytest.approx(0.1)
+
+    def test_deterministic(self, tmpdir):
+        first = str(tmpdir.join("first.cache"))
+        second = str(tmpdir.join("second.cache"))
+        mk_cache(first)
+        mk_cache(second)
+        assert np.array_equal(
+            recording.Recording(first).frames,
+            recording.Recording(second).frames)
+
+    @pytest.mark.parametrize("animation", [
+        "fxyt.mexican_hat", "exploringsphere"])
+    def test_animations_move(self, tmpdir, animation):
+        # animations follow the engine's clock, not the wall clock, so
+        # frames rendered faster than real time still move
+        path = str(tmpdir.join("show.cache"))
+        name, _, subname = animation.partition(".")
+        animation_cls = import_animation(name, subname)
+        fc = FrameConstants(fps=10)
+        params = show_cache.cache_params([animation_cls], 60, fc, 1)
+        engine = EffectEngine(fc=fc, tick=1. / fc.fps, transition=60)
+        engine.add_animation_type(animation_cls)
+        show_cache.prerender(engine, fc, path, 5.0, params)
+        frames = recording.Recording(path).frames
+        changes = sum(
+            not np.array_equal(a, b) for a, b in zip(frames, frames[1:]))
+        assert changes > len(frames) // 4
+
+    def test_stale(self, tmpdir):
+        path = str(tmpdir.join("show.cache"))
+        mk_cache(path)
+        with pytest.raises(show_cache.StaleCacheError) as err:
+            show_cache.open_cache(path, mk_params(fps=20, seed=2)[1])
+        assert "changed: fps, seed" in str(err.value)
+
+    def test_not_a_cache(self, tmpdir):
+        path = str(tmpdir.join("show.rec"))
+        writer = recording.RecordingWriter(path, (2, 2))
+        writer.write(np.zeros((2, 2), dtype=np.uint8), 0.0)
+        writer.close()
+        with pytest.raises(show_cache.StaleCacheError):
+            show_cache.open_cache(path, mk_params()[1])
+
+    def test_empty(self, tmpdir):
+        path = str(tmpdir.join("show.cache"))
+        fc, params, _ = mk_cache(path, seconds=0)
+        with pytest.raises(show_cache.StaleCacheError) as err:
+            show_cache.open_cache(path, params)
+        assert "cache is empty" in str(err.value)
+
+
+class TestEffectbox:
+    def test_prerender(self, tmpdir):
+        path = str(tmpdir.join("show.cache"))
+        args = [
+            "--fps", "10", "--seed", "3",
+            "--animation", "expandingbox.slow,expandingbox.fast",
+        ]
+        result = CliRunner().invoke(
+            effectbox.main, args + ["--prerender", path, "--duration", "2"])
+        assert result.exit_code == 0, result.output
+        assert "Rendered 20 frames" in result.output
+        assert len(recording.Recording(path)) == 20
+
+        result = CliRunner().invoke(
+            effectbox.main, ["--fps", "20", "--from-cache", path])
+        assert result.exit_code != 0
+        assert "cache is stale" in result.output
@@ -3,13 +3,42 @@
 """ Tests for spidev_driver.
 """
 
+import time
+
 import numpy as np
+import pytest
+import zmq
+from click.testing import CliRunner
 
 # these are expected to be fakes at this point
 from spidev import fake as spidev_fake
 from wiringpi import fake as wiringpi_fake
 
-from tessled.spidev_driver import TLCs, pack_to_12bit, pack_to_6bit
+from tessled.envelope import (
+    ENVELOPE_HEADER, PlayoutBuffer, message_size, pack_header)
+from tessled.frame_utils import FrameConstants
+from tessled.spidev_driver import (
+    FrameBlender, FrameReceiver, TLCs, PWMBuffers, PWMPacker, PackingLUT,
+    RefreshRate, SpiSweep, bcm_plane_order, pack_to_12bit, pack_to_6bit,
+    main, pwm_levels, spi_ioc_message)
+from tessled.transport import ZmqSubscriber
+
+
+def mk_tlcs():
+    return TLCs(tlcs=5,
+                blank=3, vprg=5, xlat=6, dcprg=7,
+                spibus=0, spidevice=0, spispeed=500000)
+
+
+def unpack_pwm(pwm_buffer):
+    """ Invert and unpack a packed PWM buffer into PWM values in
+        output order.
+    """
+    b = np.bitwise_not(np.asarray(pwm_buffer)).astype(np.uint16)
+    values = np.zeros(2 * len(b) // 3, dtype=np.uint16)
+    values[0::2] = (b[0::3] << 4) + (b[1::3] >> 4)
+    values[1::2] = ((b[1::3] % 16) << 8) + b[2::3]
+    return values[::-1]
 
 
 class TestPackTo12Bit:
@@ -75,3 +104,440 @@ class TestTLCs:
         }
         assert dev.max_speed_hz == 500000
         assert dev.mode == 0b10
+
+
+class TestWriteDC:
+    def test_write_dc(self, monkeypatch):
+        writes = []
+        monkeypatch.setattr(
+            "tessled.spidev_driver.os.write",
+            lambda fd, data: writes.append((fd, bytes(data))))
+        tlcs = mk_tlcs()
+        tlcs.write_dc(np.array([63] * 80))
+        # dcprg high, vprg high, xlat pulse, vprg low (all inverted)
+        assert wiringpi_fake.GPIO.fake_writes == [
+            (7, 0), (5, 0), (6, 0), (6, 1), (5, 1)]
+        assert writes == [(4, bytes(bytearray(60)))]
+
+
+class TestBCMPlaneOrder:
+    def test_one_bit(self):
+        assert bcm_plane_order(1) == [0]
+
+    def test_three_bits(self):
+        assert bcm_plane_order(3) == [2, 1, 2, 0, 2, 1, 2]
+
+    def test_weights(self):
+        order = bcm_plane_order(4)
+        assert len(order) == 15
+        for plane in range(4):
+            assert order.count(plane) == 2 ** plane
+
+
+class TestPWMPacker:
+    def test_matches_pack_pwm(self):
+        tlcs = mk_tlcs()
+        pwm_values = np.random.randint(
+            0, 4096, size=(3, 8, 80)).astype(np.uint16)
+        out = np.zeros((3, 8, 120), dtype=np.uint8)
+        packer = PWMPacker(pwm_values.shape)
+        packer.pack(pwm_values, out=out)
+        for plane in range(3):
+            for layer in range(8):
+                assert np.array_equal(
+                    out[plane, layer],
+                    tlcs.pack_pwm(pwm_values[plane, layer]))
+
+
+class TestPWMLevels:
+    def test_on_off(self):
+        levels = pwm_levels()
+        assert levels.shape == (1, 256)
+        assert list(levels[0, 124:128]) == [0, 0, 4095, 4095]
+
+    def test_on_off_brightness(self):
+        levels = pwm_levels(brightness=0.5)
+        assert list(levels[0, 124:128]) == [0, 0, 2048, 2048]
+
+    def test_greyscale(self):
+        levels = pwm_levels(gamma=2.0, brightness=0.5)
+        assert levels.shape == (1, 256)
+        assert levels[0, 0] == 0
+        assert levels[0, 255] == 2048
+        assert np.all(np.diff(levels[0].astype(int)) >= 0)
+
+    def test_bcm(self):
+        levels = pwm_levels(bcm_bits=3)
+        assert levels.shape == (3, 256)
+        bits = sum((levels[plane] // 4095) << plane for plane in range(3))
+        assert np.array_equal(bits, np.arange(256) >> 5)
+
+
+class TestPackingLUT:
+    @pytest.mark.parametrize("kw", [
+        {}, {"gamma": 2.2}, {"bcm_bits": 3}, {"bcm_bits": 4, "gamma": 1.8},
+        {"bcm_bits": 3, "steps": 3},
+    ])
+    def test_matches_packer(self, kw):
+        fc = FrameConstants()
+        frame = np.random.randint(
+            0, 256, size=fc.frame_shape).astype(np.uint8)
+        expected = PWMBuffers(mk_tlcs(), fc, **kw)
+        expected.update(frame)
+        pwm_buffers = PWMBuffers(mk_tlcs(), fc, lut=True, **kw)
+        pwm_buffers.update(frame)
+        assert np.array_equal(pwm_buffers.packed, expected.packed)
+
+    def test_voxel_view(self):
+        packed = np.zeros((2, 8, 120), dtype=np.uint8)
+        lut = PackingLUT(pwm_levels())
+        view = lut.voxel_view(packed)
+        assert view.shape == (2, 8, 32, 3)
+        view[...] = 1
+        assert np.all(packed[:, :, :96] == 1)
+        assert np.all(packed[:, :, 96:] == 0)
+
+
+class TestFrameBlender:
+    def test_blend(self):
+        blender = FrameBlender((2,), steps=4)
+        previous = np.array([0, 200], dtype=np.uint8)
+        frame = np.array([255, 0], dtype=np.uint8)
+        blended = blender.blend(previous, frame)
+        assert blended.dtype == np.uint8
+        assert blended.tolist() == [[63, 150], [127, 100], [191, 50],
+                                    [255, 0]]
+
+    def test_one_step(self):
+        blender = FrameBlender((3,), steps=1)
+        frame = np.array([1, 2, 3], dtype=np.uint8)
+        blended = blender.blend(np.zeros(3, dtype=np.uint8), frame)
+        assert blended.tolist() == [[1, 2, 3]]
+
+
+class TestPWMBuffers:
+    def test_on_off(self):
+        fc = FrameConstants()
+        frame = fc.empty_frame()
+        frame[2, 0, 0] = 126
+        frame[2, 0, 1] = 125
+        pwm_buffers = PWMBuffers(mk_tlcs(), fc)
+        pwm_buffers.update(frame)
+        assert pwm_buffers.sweeps_per_refresh == 1
+        assert len(pwm_buffers.buffers) == 8
+        values = unpack_pwm(pwm_buffers.buffers[2])
+        assert list(values[:16]) == [0, 0, 4095] + [0] * 13
+        assert list(values[16:19]) == [4095, 0, 0]
+
+    def test_bcm(self):
+        fc = FrameConstants()
+        frame = fc.empty_frame()
+        frame[1, 0, 0:4] = [0, 32, 160, 255]
+        pwm_buffers = PWMBuffers(mk_tlcs(), fc, bcm_bits=3)
+        pwm_buffers.update(frame)
+        assert pwm_buffers.sweeps_per_refresh == 7
+        assert len(pwm_buffers.buffers) == 7 * 8
+        lit = np.zeros(4, dtype=int)
+        for i, pwm_buffer in enumerate(pwm_buffers.buffers):
+            values = unpack_pwm(pwm_buffer)
+            layer = i % 8
+            assert values[layer] == 4095
+            if layer == 1:
+                lit += values[16:20] // 4095
+        # levels are intensity >> 5, so lit for level out of 7 sub-sweeps
+        assert list(lit) == [0, 1, 5, 7]
+
+    @pytest.mark.parametrize("lut", [False, True])
+    def test_repacks_changed_layers(self, lut):
+        fc = FrameConstants()
+        pwm_buffers = PWMBuffers(mk_tlcs(), fc, bcm_bits=2, lut=lut)
+        frame = fc.empty_frame()
+        frame[1, 0, 0] = 255
+        pwm_buffers.update(frame)
+        assert pwm_buffers.layers_packed == 1
+        assert pwm_buffers.layers_skipped == 7
+        frame[5] = 128
+        frame[1, 0, 0] = 0
+        frame[2, 1, 1] = 255
+        pwm_buffers.update(frame)
+        assert pwm_buffers.layers_packed == 4
+        assert pwm_buffers.layers_skipped == 12
+        pwm_buffers.update(frame)
+        assert pwm_buffers.layers_skipped == 20
+        expected = PWMBuffers(mk_tlcs(), fc, bcm_bits=2, lut=lut)
+        expected.update(frame)
+        for got, want in zip(pwm_buffers.buffers, expected.buffers):
+            assert np.array_equal(got, want)
+        # more than half the layers changed, so everything is repacked
+        frame[...] = 64
+        pwm_buffers.update(frame)
+        assert pwm_buffers.layers_packed == 12
+        expected.update(frame)
+        for got, want in zip(pwm_buffers.buffers, expected.buffers):
+            assert np.array_equal(got, want)
+
+    @pytest.mark.parametrize("lut", [False, True])
+    def test_interpolation(self, lut):
+        fc = FrameConstants()
+        previous = fc.empty_frame()
+        pwm_buffers = PWMBuffers(
+            mk_tlcs(), fc, bcm_bits=2, lut=lut, steps=4, previous=previous)
+        assert len(pwm_buffers.step_buffers) == 4
+        assert pwm_buffers.buffers is pwm_buffers.step_buffers[-1]
+        frame = fc.empty_frame()
+        frame[0, 0, 0] = 255
+        pwm_buffers.update(frame)
+        assert np.array_equal(previous, frame)
+        # level (2 bits) of voxel 0 in layer 0 for each step
+        levels = []
+        for buffers in pwm_buffers.step_buffers:
+            planes = buffers[0::8]  # layer 0 of each of the 3 sub-sweeps
+            levels.append(sum(unpack_pwm(b)[16] // 4095 for b in planes))
+        assert levels == [0, 1, 2, 3]
+
+    def test_buffers_are_persistent(self):
+        fc = FrameConstants()
+        pwm_buffers = PWMBuffers(mk_tlcs(), fc)
+        buffers = list(pwm_buffers.buffers)
+        frame = fc.empty_frame()
+        frame[3] = 255
+        pwm_buffers.update(frame)
+        for old, new in zip(buffers, pwm_buffers.buffers):
+            assert old is new
+            assert np.shares_memory(new, pwm_buffers.packed)
+        assert list(unpack_pwm(buffers[3])[16:]) == [4095] * 64
+
+
+class TestRefreshRate:
+    def test_report(self):
+        reports = []
+        refresh_rate = RefreshRate(7, interval=0, report=reports.append)
+        refresh_rate.tick()
+        [report] = reports
+        assert report.startswith("Refresh rate: ")
+        assert "layer sweeps / s" in report
+
+
+class TestSpiIocMessage:
+    def test_one(self):
+        assert spi_ioc_message(1) == 0x40206b00
+
+    def test_eight(self):
+        assert spi_ioc_message(8) == 0x41006b00
+
+    def test_too_many(self):
+        with pytest.raises(ValueError):
+            spi_ioc_message(512)
+
+
+class TestSpiSweep:
+    def mk_sweep(self, n_buffers=8, **kw):
+        tlcs = mk_tlcs()
+        [dev] = spidev_fake.spidevs
+        sweep = SpiSweep(tlcs, n_buffers, ioctl=dev.fake_ioctl, **kw)
+        buffers = [
+            np.full(sweep.n_bytes, i, dtype=np.uint8)
+            for i in range(n_buffers)]
+        sweep.load(buffers)
+        return sweep, dev
+
+    def test_contiguous_buffer(self):
+        sweep, _ = self.mk_sweep()
+        assert sweep.buffer.shape == (8, 120)
+        assert sweep.buffer.flags.c_contiguous
+
+    def test_gpio_latched(self):
+        sweep, dev = self.mk_sweep(delay_usecs=5)
+        assert sweep.syscalls_per_sweep == 8
+        sweep.write()
+        assert len(dev.fake_ioctls) == 8
+        for i, [transfer] in enumerate(dev.fake_ioctls):
+            assert transfer == {
+                "data": bytes(bytearray([i] * 120)),
+                "speed_hz": 500000,
+                "delay_usecs": 5,
+                "bits_per_word": 8,
+                "cs_change": 0,
+            }
+        # blank low, blank high, xlat high, xlat low for each layer
+        assert wiringpi_fake.GPIO.fake_writes == [
+            (3, 1), (3, 0), (6, 0), (6, 1)] * 8
+
+    def test_cs_latched(self):
+        sweep, dev = self.mk_sweep(n_buffers=56, xlat_on_cs=True, batch=16)
+        assert sweep.syscalls_per_sweep == 4
+        sweep.write()
+        assert [len(transfers) for transfers in dev.fake_ioctls] == [
+            16, 16, 16, 8]
+        transfers = sum(dev.fake_ioctls, [])
+        assert [t["data"][0:1] for t in transfers] == [
+            bytes(bytearray([i])) for i in range(56)]
+        assert [t["cs_change"] for t in dev.fake_ioctls[0]] == (
+            [1] * 15 + [0])
+        assert wiringpi_fake.GPIO.fake_writes == []
+
+    def test_load_updates_in_place(self):
+        sweep, dev = self.mk_sweep(xlat_on_cs=True)
+        sweep.load([np.full(120, 7, dtype=np.uint8)] * 8)
+        sweep.write()
+        [transfers] = dev.fake_ioctls
+        assert all(t["data"] == bytes(bytearray([7] * 120))
+                   for t in transfers)
+
+
+class TestFrameReceiver:
+    @pytest.fixture
+    def sockets(self):
+        context = zmq.Context()
+        recv_socket = context.socket(zmq.PAIR)
+        recv_socket.bind("inproc://frames")
+        send_socket = context.socket(zmq.PAIR)
+        send_socket.connect("inproc://frames")
+        yield send_socket, recv_socket
+        send_socket.close()
+        recv_socket.close()
+        context.term()
+
+    def mk_receiver(self, recv_socket, playout=None):
+        fc = FrameConstants()
+        pwm_buffers = [PWMBuffers(mk_tlcs(), fc) for _ in range(2)]
+        return FrameReceiver(
+            ZmqSubscriber(recv_socket), pwm_buffers, poll_timeout=10,
+            playout=playout)
+
+    def wait_for_ready(self, receiver):
+        for _ in range(200):
+            if receiver.ready is not None:
+                return
+            time.sleep(0.01)
+        raise AssertionError("Receiver never became ready.")
+
+    def mk_frame(self, layer):
+        frame = FrameConstants().empty_frame()
+        frame[layer] = 255
+        return frame.tobytes()
+
+    def lit_layers(self, receiver):
+        buffers = receiver.pwm_buffers[receiver.front].buffers
+        return [
+            layer for layer, pwm_buffer in enumerate(buffers)
+            if unpack_pwm(pwm_buffer)[16:].any()]
+
+    def test_swap(self, sockets):
+        send_socket, recv_socket = sockets
+        receiver = self.mk_receiver(recv_socket)
+        receiver.start()
+        try:
+            assert receiver.swap() is False
+            send_socket.send(self.mk_frame(3))
+            self.wait_for_ready(receiver)
+            assert receiver.front == 0
+            assert receiver.swap() is True
+            assert receiver.front == 1
+            assert receiver.ready is None
+            assert self.lit_layers(receiver) == [3]
+            assert 0 <= receiver.frame_age() < 5
+            send_socket.send(self.mk_frame(5))
+            self.wait_for_ready(receiver)
+            assert receiver.swap() is True
+            assert receiver.front == 0
+            assert self.lit_layers(receiver) == [5]
+        finally:
+            receiver.stop()
+            receiver.join()
+        assert receiver.frames_received == 2
+        assert receiver.frames_dropped == 0
+        assert receiver.frames_packed == 2
+        assert receiver.error is None
+
+    def test_skips_unchanged_frames(self, sockets):
+        send_socket, recv_socket = sockets
+        receiver = self.mk_receiver(recv_socket)
+        receiver.start()
+        try:
+            send_socket.send(self.mk_frame(3))
+            self.wait_for_ready(receiver)
+            assert receiver.swap() is True
+            send_socket.send(self.mk_frame(3))
+            for _ in range(200):
+                if receiver.frames_unchanged:
+                    break
+                time.sleep(0.01)
+            assert receiver.swap() is False
+            assert self.lit_layers(receiver) == [3]
+        finally:
+            receiver.stop()
+            receiver.join()
+        assert receiver.frames_received == 2
+        assert receiver.frames_unchanged == 1
+        assert receiver.frames_packed == 1
+        assert receiver.layers_packed() == 1
+        assert receiver.layers_skipped() == 7
+
+    def test_drops_stale_frames(self, sockets):
+        send_socket, recv_socket = sockets
+        receiver = self.mk_receiver(recv_socket)
+        for layer in (1, 2, 3):
+            send_socket.send(self.mk_frame(layer))
+        time.sleep(0.05)
+        receiver.start()
+        try:
+            self.wait_for_ready(receiver)
+            receiver.swap()
+            assert self.lit_layers(receiver) == [3]
+        finally:
+            receiver.stop()
+            receiver.join()
+        assert receiver.frames_received == 3
+        assert receiver.frames_dropped == 2
+        assert receiver.stats_text().startswith(
+            "Frames: 3 received, 2 dropped, 0 unchanged, 0 lost, 0 late; ")
+
+    def test_malformed_frame(self, sockets):
+        send_socket, recv_socket = sockets
+        receiver = self.mk_receiver(recv_socket)
+        receiver.start()
+        try:
+            send_socket.send(b"\xff" * 10)
+            receiver.join(2)
+        finally:
+            receiver.stop()
+            receiver.join()
+        assert receiver.error is not None
+        assert receiver.ready is None
+
+    def test_playout(self, sockets):
+        send_socket, recv_socket = sockets
+        fc = FrameConstants()
+        receiver = self.mk_receiver(
+            recv_socket, playout=PlayoutBuffer(fc.frame_shape))
+        display_at = time.time() + 0.2
+        for seq, layer in ((1, 2), (3, 4)):
+            message = bytearray(message_size(fc.frame_shape))
+            pack_header(message, seq, 0.0, display_at, fc.frame_shape)
+            message[ENVELOPE_HEADER.size:] = self.mk_frame(layer)
+            send_socket.send(message)
+        receiver.start()
+        try:
+            time.sleep(0.05)
+            assert receiver.ready is None
+            self.wait_for_ready(receiver)
+            assert time.time() >= display_at
+            receiver.swap()
+            assert self.lit_layers(receiver) == [4]
+        finally:
+            receiver.stop()
+            receiver.join()
+        assert receiver.frames_received == 2
+        assert receiver.frames_dropped == 1
+        assert receiver.frames_lost == 1
+        assert receiver.frames_late == 0
+
+
+class TestMain:
+    def test_xlat_on_cs_dwell_too_long(self):
+        result = CliRunner().invoke(main, [
+            "--backend", "sim", "--xlat-on-cs", "--layer-dwell-us", "70000"])
+        assert result.exit_code == 2
+        assert "Invalid value for '--layer-dwell-us'" in result.output
+        assert "at most 65535" in result.output
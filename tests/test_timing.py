@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+""" Tests for tessled.timing. """
+
+import json
+import time
+
+import pytest
+
+from tessled.timing import DwellTimer, HdrHistogram
+
+
+class TestHdrHistogram:
+    def test_small_values_are_exact(self):
+        h = HdrHistogram("test", sub_bucket_bits=4)
+        for value in range(16):
+            assert h.bucket_value(h.bucket_index(value)) == value
+
+    @pytest.mark.parametrize("value", [
+        17, 100, 1000, 12345, 10 ** 6, 10 ** 9, 2 ** 62,
+    ])
+    def test_relative_precision(self, value):
+        h = HdrHistogram("test", sub_bucket_bits=6)
+        low = h.bucket_value(h.bucket_index(value))
+        assert low <= value
+        assert (value - low) / float(value) < 2 ** -5
+
+    def test_buckets_are_ordered(self):
+        h = HdrHistogram("test", sub_bucket_bits=4)
+        lows = [h.bucket_value(i) for i in range(len(h.counts))]
+        assert lows == sorted(set(lows))
+
+    def test_stats(self):
+        h = HdrHistogram("test")
+        for value in range(1, 101):
+            h.record(value * 1000)
+        assert h.count == 100
+        assert h.min == 1000
+        assert h.max == 100000
+        assert h.mean() == 50500.0
+        assert 48000 <= h.percentile(50) <= 50000
+        assert h.percentile(100) == 100000
+
+    def test_format(self):
+        h = HdrHistogram("dwell")
+        assert h.format() == "dwell: no values"
+        h.record(2000)
+        assert h.format() == (
+            "dwell: n=1 mean=2.0us p50=2.0 p90=2.0 p99=2.0 p99.9=2.0"
+            " p100=2.0")
+
+    def test_reset(self):
+        h = HdrHistogram("test")
+        h.record(5)
+        h.reset()
+        assert h.count == 0
+        assert sum(h.counts) == 0
+        assert h.max is None
+
+
+class TestDwellTimer:
+    def test_holds_dwell(self):
+        timer = DwellTimer(2 * 10 ** 6, spin_ns=5 * 10 ** 5)
+        for _ in range(5):
+            timer.begin()
+            timer.end()
+            timer.sweep()
+        assert timer.dwells.count == 5
+        assert timer.dwells.min >= 2 * 10 ** 6
+        assert timer.writes.count == 5
+        assert timer.writes.max < 2 * 10 ** 6
+        assert timer.sweeps.count == 4
+
+    def test_zero_dwell_only_measures(self):
+        timer = DwellTimer(0)
+        start = time.perf_counter_ns()
+        timer.begin()
+        timer.end()
+        assert timer.dwells.count == 1
+        assert time.perf_counter_ns() - start < 10 ** 7
+
+    def test_export(self, tmpdir):
+        timer = DwellTimer(0)
+        timer.begin()
+        timer.end()
+        path = str(tmpdir.join("timing.json"))
+        timer.export(path)
+        with open(path) as f:
+            data = json.load(f)
+        assert data["dwell_ns"] == 0
+        assert [h["name"] for h in data["histograms"]] == [
+            "spi write", "layer dwell", "sweep"]
+        assert data["histograms"][0]["count"] == 1
+        assert data["histograms"][1]["count"] == 1
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+""" Tests for tessled.tlc_sim. """
+
+import numpy as np
+import pytest
+
+from tessled.frame_utils import FrameConstants
+from tessled.spidev_driver import (
+    PWMBuffers, SpiSweep, TLCs, pack_to_6bit, pack_to_12bit)
+from tessled.tlc_sim import SimBackend, unpack_6bit, unpack_12bit
+
+
+def mk_tlcs(xlat_on_cs=False, spispeed=1000000):
+    backend = SimBackend(xlat_on_cs=xlat_on_cs)
+    tlcs = TLCs(
+        tlcs=5, blank=3, vprg=5, xlat=6, dcprg=7, spispeed=spispeed,
+        backend=backend)
+    tlcs.init_tlcs()
+    return tlcs, backend.chain
+
+
+class TestUnpack:
+    def test_12bit(self):
+        values = np.arange(0, 4096, 52, dtype=np.uint16)[:78]
+        assert list(unpack_12bit(pack_to_12bit(values))) == list(values)
+
+    def test_6bit(self):
+        values = np.arange(80, dtype=np.uint8) % 64
+        assert list(unpack_6bit(pack_to_6bit(values))) == list(values)
+
+
+class TestSimulatedChain:
+    def test_write_pwm(self):
+        tlcs, chain = mk_tlcs()
+        values = np.zeros(80, dtype=np.uint16)
+        values[2] = 4095
+        values[16:20] = [1, 2, 3, 4095]
+        tlcs.write_pwm(values)
+        assert list(chain.gs) == list(values)
+        assert list(chain.frame()[2, :4]) == [1, 2, 3, 4095]
+        assert not chain.frame()[[0, 1, 3, 4, 5, 6, 7]].any()
+
+    def test_write_dc(self):
+        tlcs, chain = mk_tlcs()
+        dc_values = np.arange(80, dtype=np.uint8) % 64
+        tlcs.write_dc(dc_values)
+        assert list(chain.dc) == list(dc_values)
+        assert not chain.gs.any()
+
+    def test_spi_time_and_toggles(self):
+        tlcs, chain = mk_tlcs(spispeed=960000)
+        chain.reset()
+        tlcs.write_pwm(np.zeros(80, dtype=np.uint16))
+        assert chain.writes == 1
+        assert chain.bytes_written == 120
+        assert abs(chain.spi_seconds - 0.001) < 1e-9
+        # BLANK low, BLANK high and an XLAT pulse
+        assert chain.gpio_writes == 4
+        assert chain.toggles == {3: 2, 6: 2}
+
+    @pytest.mark.parametrize("xlat_on_cs", [False, True])
+    def test_sweep_round_trip(self, xlat_on_cs):
+        tlcs, chain = mk_tlcs(xlat_on_cs=xlat_on_cs)
+        fc = FrameConstants()
+        frame = np.random.randint(0, 256, size=fc.frame_shape).astype(
+            np.uint8)
+        pwm_buffers = PWMBuffers(tlcs, fc, bcm_bits=2)
+        pwm_buffers.update(frame)
+        sweep = SpiSweep(
+            tlcs, len(pwm_buffers.buffers), xlat_on_cs=xlat_on_cs)
+        sweep.load(pwm_buffers.buffers)
+        chain.reset()
+        chain.record_latched = True
+        sweep.write()
+        assert len(chain.latched) == 3 * 8
+        voxels = frame.reshape(8, -1)
+        for i, latched in enumerate(chain.latched):
+            plane = pwm_buffers.plane_order[i // 8]
+            layer = i % 8
+            assert list(np.flatnonzero(latched[:16])) == [layer]
+            assert np.array_equal(
+                latched[16:], pwm_buffers.levels[plane][voxels[layer]])
+        assert chain.ioctls == (3 if xlat_on_cs else 24)
+        assert (chain.gpio_writes == 0) == xlat_on_cs
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+""" Tests for tessled.topology and multi-chain driving. """
+
+import os
+
+import numpy as np
+import pytest
+
+from tessled import topology
+from tessled.frame_utils import FrameConstants
+from tessled.spidev_driver import (
+    ChainBuffers, PWMBuffers, ParallelChains, create_tlcs)
+
+TOPOLOGY_16 = os.path.join(
+    os.path.dirname(__file__), os.pardir, "pi", "topology-16x16x16.json")
+
+
+def mk_chains(topo):
+    chain_tlcs = [
+        create_tlcs("sim", 1000000, wait=False, chain=chain)
+        for chain in topo.chains]
+    return chain_tlcs, ParallelChains(chain_tlcs)
+
+
+class TestTopology:
+    def test_default(self):
+        topo = topology.default_topology()
+        [chain] = topo.chains
+        assert topo.frame_shape == (8, 8, 8)
+        assert chain.n_outputs == 80
+        assert chain.layer_outputs == list(range(8))
+        assert chain.voxel_block() == (16, 80)
+
+    def test_load(self):
+        topo = topology.load_topology(TOPOLOGY_16)
+        assert topo.frame_shape == (16, 16, 16)
+        assert [c.chips for c in topo.chains] == [5, 4, 4, 4]
+        assert [c.voxel_block() for c in topo.chains] == [
+            (16, 80), (0, 64), (0, 64), (0, 64)]
+        assert topo.chains[0].layer_outputs == list(range(16))
+        assert topo.chains[1].layer_outputs is None
+        assert list(topo.chains[3].voxels[[0, -1]]) == [192, 255]
+
+    def test_irregular_outputs(self):
+        chain = topology.Chain(1, [0, 1, 2], [7, 5, 6], layer_outputs=[0])
+        assert chain.voxel_block() is None
+
+    @pytest.mark.parametrize("data, message", [
+        ({}, "Invalid topology"),
+        ({"chains": []}, "at least one chain"),
+        ({"frame_shape": [1, 2, 2], "chains": [
+            {"chips": 1, "voxels": [0, 1, 2, 3],
+             "voxel_outputs": [1, 2, 3, 4]}]},
+         "No chain drives the layer select"),
+        ({"frame_shape": [1, 2, 2], "chains": [
+            {"chips": 1, "layer_outputs": [0], "voxels": [0, 1, 2],
+             "voxel_outputs": [1, 2, 3]}]},
+         "exactly one chain output"),
+        ({"frame_shape": [1, 2, 2], "chains": [
+            {"chips": 1, "layer_outputs": [0], "voxels": [0, 1, 2, 3],
+             "voxel_outputs": [0, 1, 2, 3]}]},
+         "outputs used twice"),
+        ({"frame_shape": [1, 2, 2], "chains": [
+            {"chips": 1, "layer_outputs": [0], "voxels": [0, 1, 2, 3],
+             "voxel_outputs": {"start": 13}}]},
+         "range 0-15"),
+    ])
+    def test_invalid(self, data, message):
+        with pytest.raises(topology.TopologyError) as err:
+            topology.parse_topology(data)
+        assert message in str(err.value)
+
+
+class TestPWMBuffersChain:
+    @pytest.mark.parametrize("lut", [False, True])
+    def test_irregular_outputs(self, lut):
+        fc = FrameConstants(frame_shape=(2, 2, 2))
+        chain = topology.Chain(
+            1, voxels=[3, 1], voxel_outputs=[9, 4], layer_outputs=[15, 14])
+        tlcs = create_tlcs("sim", 1000000, wait=False, chain=chain)
+        pwm_buffers = PWMBuffers(tlcs, fc, lut=lut, chain=chain)
+        assert pwm_buffers.lut is None
+        frame = fc.empty_frame()
+        frame[1] = [[0, 255], [0, 255]]
+        pwm_buffers.update(frame)
+        for pwm_buffer in pwm_buffers.buffers:
+            tlcs.write_pwm_packed(pwm_buffer)
+        assert tlcs.backend.chain.frame().tolist() == [
+            [0, 0], [4095, 4095]]
+        assert list(np.flatnonzero(tlcs.backend.chain.gs)) == [4, 9, 14]
+
+
+class TestParallelChains:
+    def test_write_layers(self):
+        topo = topology.load_topology(TOPOLOGY_16)
+        fc = FrameConstants(frame_shape=topo.frame_shape)
+        chain_tlcs, chains = mk_chains(topo)
+        try:
+            pwm_buffers = ChainBuffers([
+                PWMBuffers(t, fc, bcm_bits=2, lut=True, chain=c)
+                for t, c in zip(chain_tlcs, topo.chains)])
+            frame = np.random.randint(
+                0, 256, size=fc.frame_shape).astype(np.uint8)
+            pwm_buffers.update(frame)
+            assert len(pwm_buffers.buffers) == 3 * 16
+            sims = [t.backend.chain for t in chain_tlcs]
+            for sim in sims:
+                sim.record_latched = True
+            chains.init_tlcs()
+            for layer_buffers in pwm_buffers.buffers:
+                chains.write_layer(layer_buffers)
+        finally:
+            chains.stop()
+        voxels = frame.reshape(16, -1)
+        levels = pwm_buffers.chain_buffers[0].levels
+        plane_order = pwm_buffers.chain_buffers[0].plane_order
+        for sim, chain in zip(sims, topo.chains):
+            assert len(sim.latched) == 3 * 16
+            for i, latched in enumerate(sim.latched):
+                plane, layer = plane_order[i // 16], i % 16
+                assert np.array_equal(
+                    latched[chain.voxel_outputs],
+                    levels[plane][voxels[layer, chain.voxels]])
+        # the GPIO lines are shared by every chain
+        assert sims[0].gpio_writes > 0
+        assert sims[1].gpio_writes == sims[0].gpio_writes
+
+    def test_write_dc(self):
+        topo = topology.load_topology(TOPOLOGY_16)
+        chain_tlcs, chains = mk_chains(topo)
+        try:
+            dc_values = np.arange(chains.n_outputs) % 64
+            chains.write_dc(dc_values)
+        finally:
+            chains.stop()
+        sims = [t.backend.chain for t in chain_tlcs]
+        assert list(sims[0].dc) == list(dc_values[:80])
+        assert list(sims[3].dc) == list(dc_values[-64:])
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+""" Tests for tessled.transport. """
+
+import time
+
+import numpy as np
+
+from tessled import envelope, transport
+from tessled.frame_utils import FrameConstants
+from tessled.spidev_driver import FrameReceiver, PWMBuffers, create_tlcs
+
+
+def mk_frame(value):
+    frame = FrameConstants().empty_frame()
+    frame[:] = value
+    return frame
+
+
+def recv_frame(subscriber):
+    header, frame = envelope.unpack(subscriber.recv_nowait(), (8, 8, 8))
+    return frame.tobytes()
+
+
+class TestAddresses:
+    def test_shm_path(self):
+        assert transport.shm_path("shm://frames") == "/dev/shm/frames"
+        assert transport.shm_path("shm:///tmp/frames") == "/tmp/frames"
+        assert transport.shm_path("tcp://127.0.0.1:5556") is None
+
+    def test_open(self, tmpdir):
+        addr = "shm://" + str(tmpdir.join("frames"))
+        publisher = transport.open_publisher(addr, (8, 8, 8))
+        subscriber = transport.open_subscriber(addr)
+        assert isinstance(publisher, transport.ShmPublisher)
+        assert isinstance(subscriber, transport.ShmSubscriber)
+        subscriber.close()
+        publisher.close()
+
+
+class TestShmRing:
+    def mk_pair(self, tmpdir, slots=4):
+        path = str(tmpdir.join("frames"))
+        publisher = transport.ShmPublisher(path, (8, 8, 8), slots=slots)
+        return publisher, transport.ShmSubscriber(path)
+
+    def test_round_trip(self, tmpdir):
+        publisher, subscriber = self.mk_pair(tmpdir)
+        assert subscriber.poll(0) is False
+        assert subscriber.recv_nowait() is None
+        publisher.publish(mk_frame(1))
+        frame = mk_frame(2)
+        # virtual_to_physical returns non-contiguous views
+        publisher.publish(frame[::-1, ::-1])
+        # subscribers only receive frames published after they attach
+        subscriber = transport.ShmSubscriber(publisher.ring.path)
+        assert subscriber.poll(0) is False
+        publisher.publish(mk_frame(3))
+        assert subscriber.poll(0) is True
+        header, frame = envelope.unpack(subscriber.recv_nowait(), (8, 8, 8))
+        assert frame.tobytes() == mk_frame(3).tobytes()
+        assert header.seq == 3
+        assert subscriber.overwritten() is False
+        assert subscriber.recv_nowait() is None
+
+    def test_in_order(self, tmpdir):
+        publisher, subscriber = self.mk_pair(tmpdir)
+        subscriber.poll(0)
+        for value in (1, 2):
+            publisher.publish(mk_frame(value))
+        assert recv_frame(subscriber) == mk_frame(1).tobytes()
+        assert recv_frame(subscriber) == mk_frame(2).tobytes()
+
+    def test_render_in_place(self, tmpdir):
+        publisher, subscriber = self.mk_pair(tmpdir)
+        subscriber.poll(0)
+        slot = publisher.next_slot()
+        slot[:] = 7
+        publisher.publish(slot)
+        assert recv_frame(subscriber) == mk_frame(7).tobytes()
+
+    def test_overwritten(self, tmpdir):
+        publisher, subscriber = self.mk_pair(tmpdir, slots=2)
+        subscriber.poll(0)
+        publisher.publish(mk_frame(1))
+        subscriber.recv_nowait()
+        publisher.publish(mk_frame(2))
+        assert subscriber.overwritten() is False
+        publisher.publish(mk_frame(3))
+        assert subscriber.overwritten() is True
+
+    def test_lapped(self, tmpdir):
+        publisher, subscriber = self.mk_pair(tmpdir, slots=2)
+        subscriber.poll(0)
+        for value in range(1, 6):
+            publisher.publish(mk_frame(value))
+        assert recv_frame(subscriber) == mk_frame(4).tobytes()
+        assert subscriber.frames_lost == 3
+
+    def test_publisher_restart(self, tmpdir):
+        publisher, subscriber = self.mk_pair(tmpdir)
+        subscriber.poll(0)
+        publisher.publish(mk_frame(1))
+        recv_frame(subscriber)
+        publisher.close()
+        publisher, _ = self.mk_pair(tmpdir)
+        publisher.publish(mk_frame(2))
+        assert subscriber.poll(0) is True
+        assert recv_frame(subscriber) == mk_frame(2).tobytes()
+
+    def test_not_a_ring(self, tmpdir):
+        path = tmpdir.join("frames")
+        path.write("not a ring")
+        subscriber = transport.ShmSubscriber(str(path))
+        assert subscriber.poll(1) is False
+
+
+class TestShmFrameReceiver:
+    def test_receive(self, tmpdir):
+        path = str(tmpdir.join("frames"))
+        publisher = transport.ShmPublisher(path, (8, 8, 8))
+        fc = FrameConstants()
+        pwm_buffers = [
+            PWMBuffers(create_tlcs("sim", 1000000, wait=False), fc)
+            for _ in range(2)]
+        receiver = FrameReceiver(
+            transport.ShmSubscriber(path), pwm_buffers, poll_timeout=10)
+        receiver.start()
+        try:
+            time.sleep(0.05)
+            frame = fc.empty_frame()
+            frame[2] = 255
+            publisher.publish(frame)
+            for _ in range(200):
+                if receiver.ready is not None:
+                    break
+                time.sleep(0.01)
+            assert receiver.swap() is True
+            assert np.array_equal(
+                receiver.pwm_buffers[receiver.front].frame,
+                frame.reshape(8, -1))
+        finally:
+            receiver.stop()
+            receiver.join()
+        assert receiver.frames_received == 1
+        assert receiver.error is None
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+""" Tests for tessled.tuning. """
+
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from tessled import tuning
+from tessled.spidev_driver import main
+
+
+class TestProfiles:
+    def test_missing(self, tmpdir):
+        assert tuning.load_profile(str(tmpdir.join("missing.json"))) == {}
+
+    def test_round_trip(self, tmpdir):
+        path = str(tmpdir.join("profiles", "driver.json"))
+        tuning.save_profile(path, {
+            "spispeed": 976562, "layer_dwell_us": 100, "spi_batch": 8,
+            "refreshes_per_second": 120.0, "duty_cycle": 0.9,
+        })
+        assert tuning.load_profile(path) == {
+            "spispeed": 976562, "layer_dwell_us": 100, "spi_batch": 8}
+        with open(path) as f:
+            assert json.load(f)["measured"] == {
+                "refreshes_per_second": 120.0, "duty_cycle": 0.9}
+
+    @pytest.mark.parametrize("content", [
+        "not json", "[1, 2]", '{"spispeed": 1.5}', '{"spi_batch": -1}'])
+    def test_invalid(self, tmpdir, content):
+        path = tmpdir.join("driver.json")
+        path.write(content)
+        with pytest.raises(tuning.ProfileError):
+            tuning.load_profile(str(path))
+
+
+class TestTuning:
+    def test_candidates(self):
+        assert tuning.candidates([2, 1], [0], [1, 8]) == [
+            {"spispeed": 2, "layer_dwell_us": 0, "spi_batch": 1},
+            {"spispeed": 2, "layer_dwell_us": 0, "spi_batch": 8},
+            {"spispeed": 1, "layer_dwell_us": 0, "spi_batch": 1},
+            {"spispeed": 1, "layer_dwell_us": 0, "spi_batch": 8},
+        ]
+
+    def test_measure(self):
+        def write_refresh(dwell):
+            dwell.begin()
+            dwell.end()
+
+        result = tuning.measure(write_refresh, 200, 0.02)
+        assert result["refreshes_per_second"] < 5000
+        assert 0.5 < result["duty_cycle"] <= 1.0
+
+    def test_measure_lit_time(self):
+        result = tuning.measure(
+            lambda dwell: None, 0, 0.01, lit_ns_per_refresh=0)
+        assert result["duty_cycle"] == 0.0
+
+    def test_choose_best(self):
+        results = [
+            {"name": "slow", "refreshes_per_second": 50.0, "duty_cycle": 1.},
+            {"name": "dim", "refreshes_per_second": 200.0, "duty_cycle": .5},
+            {"name": "ok", "refreshes_per_second": 120.0, "duty_cycle": .9},
+            {"name": "fast", "refreshes_per_second": 150.0,
+             "duty_cycle": .901},
+        ]
+        assert tuning.choose_best(results, 100)["name"] == "fast"
+        assert tuning.choose_best(results, 300)["name"] == "dim"
+
+
+class TestTuneCommand:
+    def test_sim(self, tmpdir):
+        path = str(tmpdir.join("driver.json"))
+        result = CliRunner().invoke(main, [
+            "--backend", "sim", "--profile", path, "tune",
+            "--seconds", "0.01", "--spispeed-divisor", "4",
+            "--layer-dwell-us", "0", "--min-refresh-rate", "1"])
+        assert result.exit_code == 0, result.output
+        assert "Best: spispeed=976562 layer_dwell_us=0" in result.output
+        assert tuning.load_profile(path) == {
+            "spispeed": 976562, "layer_dwell_us": 0, "spi_batch": 1}
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+""" Tests for tessled.wiring. """
+
+import json
+
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from tessled import effectbox, recording, show_cache, wiring
+from tessled.frame_utils import FrameConstants, FrameMapper
+
+SHAPE = (2, 3, 4)
+
+
+def mk_frame(shape=SHAPE):
+    return np.arange(np.prod(shape), dtype=np.uint8).reshape(shape)
+
+
+class TestParseWiring:
+    def test_default(self):
+        w = wiring.parse_wiring({"frame_shape": list(SHAPE)})
+        assert w.frame_shape == SHAPE
+        assert w.index.tolist() == list(range(24))
+
+    def test_base(self):
+        w = wiring.parse_wiring(
+            {"frame_shape": list(SHAPE), "base": "minicube"})
+        frame = mk_frame()
+        assert FrameMapper(None, w, SHAPE)(frame).tolist() == (
+            frame[::-1, :, :].tolist())
+
+    def test_swap(self):
+        w = wiring.parse_wiring({
+            "frame_shape": list(SHAPE),
+            "swap": [[[0, 0, 1], [0, 0, 2]], [22, 23]],
+        })
+        expected = list(range(24))
+        expected[1], expected[2] = 2, 1
+        expected[22], expected[23] = 23, 22
+        assert w.index.tolist() == expected
+
+    def test_map(self):
+        index = list(reversed(range(24)))
+        w = wiring.parse_wiring({"frame_shape": list(SHAPE), "map": index})
+        frame = mk_frame()
+        assert FrameMapper(None, w, SHAPE)(frame).ravel().tolist() == index
+
+    @pytest.mark.parametrize("data, message", [
+        ({"map": [0] * 24}, "exactly once"),
+        ({"map": list(range(23))}, "exactly once"),
+        ({"base": "cube"}, "unknown base"),
+        ({"swap": [[0, 24]]}, "out of range"),
+        ({"swap": [[[0, 3, 0], 1]]}, "out of range"),
+        ({"swap": [[[0, 0], 1]]}, "Expected a voxel"),
+        ({"swap": [[0, 1, 2]]}, "Invalid wiring"),
+    ])
+    def test_invalid(self, data, message):
+        data["frame_shape"] = list(SHAPE)
+        with pytest.raises(wiring.WiringError) as err:
+            wiring.parse_wiring(data)
+        assert message in str(err.value)
+
+    def test_load(self, tmpdir):
+        path = tmpdir.join("wiring.json")
+        path.write(json.dumps({"base": "tesseract", "swap": [[0, 1]]}))
+        w = wiring.load_wiring(str(path))
+        assert w.name == str(path)
+        assert w.frame_shape == (8, 8, 8)
+        path.write("{")
+        with pytest.raises(wiring.WiringError):
+            wiring.load_wiring(str(path))
+
+
+class TestFrameConstants:
+    def test_wiring(self):
+        w = wiring.parse_wiring({"base": "tesseract", "swap": [[0, 1]]})
+        fc = FrameConstants(ttype="tesseract", wiring=w)
+        assert fc.layout is w
+        frame = mk_frame((8, 8, 8))
+        expected = frame[::-1, ::-1, :].ravel()
+        expected[[0, 1]] = expected[[1, 0]]
+        assert fc.virtual_to_physical(frame).ravel().tolist() == (
+            expected.tolist())
+
+    def test_to_ttype(self):
+        w = wiring.parse_wiring({"base": "tesseract", "swap": [[0, 1]]})
+        frame = mk_frame((8, 8, 8))
+        physical = FrameMapper(None, w)(frame)
+        assert FrameMapper(w, "tesseract")(physical).tolist() == (
+            frame[::-1, ::-1, :].tolist())
+
+    def test_cache_key(self):
+        w = wiring.parse_wiring({"base": "tesseract", "swap": [[0, 1]]})
+        params = show_cache.cache_params(
+            [], 5.0, FrameConstants(ttype="tesseract"), 1)
+        wired = show_cache.cache_params(
+            [], 5.0, FrameConstants(ttype="tesseract", wiring=w), 1)
+        assert params["wiring"] is None
+        assert wired["wiring"] == w.digest()
+
+
+class TestEffectbox:
+    def test_prerender(self, tmpdir):
+        wiring_path = tmpdir.join("wiring.json")
+        wiring_path.write(json.dumps({"base": "tesseract", "swap": [[0, 1]]}))
+        path = str(tmpdir.join("show.cache"))
+        args = [
+            "--fps", "10", "--seed", "3", "--animation", "expandingbox.slow",
+        ]
+        result = CliRunner().invoke(effectbox.main, args + [
+            "--wiring", str(wiring_path), "--prerender", path,
+            "--duration", "1"])
+        assert result.exit_code == 0, result.output
+        assert len(recording.Recording(path)) == 10
+        result = CliRunner().invoke(
+            effectbox.main, args + ["--from-cache", path])
+        assert "changed: wiring" in result.output
+
+    def test_wrong_shape(self, tmpdir):
+        wiring_path = tmpdir.join("wiring.json")
+        wiring_path.write(json.dumps({"frame_shape": list(SHAPE)}))
+        result = CliRunner().invoke(
+            effectbox.main, ["--wiring", str(wiring_path)])
+        assert result.exit_code == 1
+        assert "the wiring is for (2, 3, 4) frames" in result.output